@@ -12,6 +12,27 @@ BASE_URL = 'https://fxadk.com/api/'
 API_KEY = ''
 API_SECRET = ''
 
+# HTTP connection pool per API host. None sizes it for the bot's own concurrency.
+HTTP_POOL_SIZE = None
+# Connections to open at startup, so the first requests don't pay for TCP/TLS handshakes.
+HTTP_PREWARM_CONNECTIONS = 2
+# Use HTTP/2 (one multiplexed connection). Requires `pip install httpx[http2]`.
+HTTP2 = False
+# Let concurrent identical reads (balances, open orders, trade history...) share one in-flight request
+# instead of each spending a call from the rate limit.
+COALESCE_READS = True
+
+# Shared market data. Run one feed process (`python -m market_maker.ws.md_bus SYMBOL [SYMBOL...]`) and set
+# MD_BUS = True in every bot: the bots then read the book from shared memory instead of each polling FxADK,
+# falling back to REST when the feed's data is older than MD_BUS_MAX_AGE seconds.
+# The feed polls every MD_BUS_INTERVAL seconds and keeps MD_BUS_LEVELS levels per side, in files in MD_BUS_DIR
+# (None for the system temp directory).
+MD_BUS = False
+MD_BUS_DIR = None
+MD_BUS_MAX_AGE = 15
+MD_BUS_INTERVAL = 5
+MD_BUS_LEVELS = 10
+
 
 ########################################################################################################################
 # Target
@@ -40,6 +61,27 @@ INTERVAL = 0.005
 # Minimum spread to maintain, in percent, between asks & bids
 MIN_SPREAD = 0.01
 
+# If True, the distance between levels widens with recent volatility:
+#   max(INTERVAL, VOLATILITY_INTERVAL_MULTIPLIER * volatility)
+# where volatility is the EWMA standard deviation of trade-to-trade returns over the last STATS_WINDOW trades.
+VOLATILITY_SCALED_INTERVAL = False
+VOLATILITY_INTERVAL_MULTIPLIER = 2.0
+
+# Rolling trade statistics (VWAP, volatility, buy/sell imbalance) are kept over this many recent trades.
+# VOLATILITY_EWMA_ALPHA is the weight given to each new trade's return.
+STATS_WINDOW = 100
+VOLATILITY_EWMA_ALPHA = 0.06
+
+# Price the ladder is anchored on:
+#   'mid'        - (best bid + best ask) / 2
+#   'microprice' - mid weighted by top-of-book sizes, leaning towards the side likely to trade through next
+#   'imbalance'  - mid shifted by book imbalance over the top REFERENCE_DEPTH levels (each level weighted by
+#                  REFERENCE_DECAY ** level), up to half the spread either way
+# Start positions are moved by (reference - mid), without crossing the book.
+REFERENCE_PRICE = 'mid'
+REFERENCE_DEPTH = 5
+REFERENCE_DECAY = 0.5
+
 # If True, market-maker will place orders just inside the existing spread and work the interval % outwards,
 # rather than starting in the middle and killing potentially profitable spreads.
 MAINTAIN_SPREADS = True
@@ -56,6 +98,42 @@ MAINTAIN_SPREADS = True
 # 0.01 == 1%
 RELIST_INTERVAL = 0.01
 
+# RELIST_INTERVAL applies to the innermost level. Each level further out gets a wider band:
+#   RELIST_INTERVAL * (1 + level * RELIST_LEVEL_WIDENING)
+# An order sitting at the best bid/ask is given twice its band, so it isn't sent to the back of the queue
+# for a small price change.
+RELIST_LEVEL_WIDENING = 0.5
+
+# Size changes smaller than this fraction of the current order size don't trigger an amend.
+RELIST_SIZE_TOLERANCE = 0.1
+
+# An amend costs two API calls (cancel + create). At most this many amends are sent per minute; the rest wait
+# for a later loop. None for no limit.
+AMEND_BUDGET_PER_MINUTE = 10
+
+# If True, orders are sized to the balance we have left after what our open orders lock: the innermost levels are
+# funded first, outer ones are shrunk or not sent at all, so createOrder isn't called for orders FxADK would refuse.
+# Buys reserve FUNDING_FEE_RESERVE (a fraction of the total) on top for fees. Orders that would end up smaller
+# than MIN_FUNDED_ORDER_SIZE are not sent.
+BALANCE_AWARE_SIZING = True
+FUNDING_FEE_RESERVE = 0.002
+MIN_FUNDED_ORDER_SIZE = 1
+
+
+# Strategy that decides which orders to place. Built-in:
+#   'ladder'             - fixed geometric ladder from the spread, as described above.
+#   'avellaneda_stoikov' - skews prices and sizes continuously with inventory (relative to MIN/MAX_POSITION) and
+#                          widens the spread with realized volatility. See market_maker/quoting.py.
+# or your own, as 'module:Class' - see market_maker/strategy.py. Set it in settings-<symbol>.py to run
+# different strategies on different symbols.
+STRATEGY = 'ladder'
+
+# Avellaneda-Stoikov parameters: risk aversion, order book liquidity (1 / typical fill distance, as a fraction
+# of price) and horizon in trades.
+AS_GAMMA = 1.0
+AS_KAPPA = 200.0
+AS_HORIZON = 100
+
 
 ########################################################################################################################
 # Trading Behavior
@@ -67,6 +145,21 @@ CHECK_POSITION_LIMITS = False
 MIN_POSITION = -100
 MAX_POSITION = 100
 
+# Pre-trade risk checks, applied to every order before it is sent. None disables a check.
+# Max size of a single order, in contracts.
+RISK_MAX_ORDER_SIZE = None
+# Max total price * amount of our open orders on each side.
+RISK_MAX_NOTIONAL_PER_SIDE = None
+# Max distance of an order's price from mid, as a fraction (0.1 == 10%).
+RISK_PRICE_BAND = 0.1
+# Max number of our orders open at once.
+RISK_MAX_OPEN_ORDERS = 20
+# Sending more orders than this within a minute throws the kill switch: all quotes are pulled and no new
+# orders are sent until the bot is restarted.
+RISK_MAX_ORDERS_PER_MINUTE = 60
+# If this file exists, the kill switch is thrown.
+KILL_SWITCH_FILE = None
+
 # If True, will only send orders that rest in the book (ExecInst: ParticipateDoNotInitiate).
 # Use to guarantee a maker rebate.
 # However -- orders that would have matched immediately will instead cancel, and you may end up with
@@ -77,7 +170,7 @@ POST_ONLY = False
 # Misc Behavior, Technicals
 ########################################################################################################################
 
-# If true, don't set up any orders, just say what we would do
+# If true, orders are placed on a simulated exchange instead of FxADK (see DRY_BALANCES below)
 # DRY_RUN = True
 DRY_RUN = True
 
@@ -87,28 +180,112 @@ DRY_RUN = True
 LOOP_INTERVAL = 5
 
 # Wait times between orders / errors
+# API_REST_INTERVAL is only used when RATE_LIMIT_PER_MINUTE is None.
 API_REST_INTERVAL = 3
 API_ERROR_INTERVAL = 10
 TIMEOUT = 7
 
-# If we're doing a dry run, use these numbers for BTC balances
+# Outbound requests are queued and sent most urgent first - cancels, then order creates, then market data, then
+# account reads - admitted by a token bucket of RATE_LIMIT_PER_MINUTE tokens holding at most RATE_LIMIT_BURST.
+# CANCEL_RESERVED_TOKENS are kept back for cancels only. SCHEDULER_WORKERS requests can be on the wire at once.
+# Set RATE_LIMIT_PER_MINUTE to None to sleep API_REST_INTERVAL after each call instead.
+RATE_LIMIT_PER_MINUTE = 20
+RATE_LIMIT_BURST = 4
+CANCEL_RESERVED_TOKENS = 1
+SCHEDULER_WORKERS = 4
+
+# Each loop iteration must finish within TICK_BUDGET seconds, split between fetching market data, computing
+# quotes and submitting orders in the TICK_BUDGET_SPLIT proportions. Requests get timeouts from what is left of
+# their stage (never more than TIMEOUT); a tick that runs out of time is abandoned. Resting quotes are then left
+# as they are (DEADLINE_FALLBACK = 'cached') unless the data they were quoted from is older than
+# MAX_QUOTE_DATA_AGE seconds, or pulled straight away (DEADLINE_FALLBACK = 'pull').
+# With the default rate limit a tick of ~10 requests needs about 30s; None disables the budget.
+TICK_BUDGET = 90
+TICK_BUDGET_SPLIT = {'fetch': 0.5, 'compute': 0.1, 'submit': 0.4}
+DEADLINE_FALLBACK = 'cached'
+MAX_QUOTE_DATA_AGE = 180
+
+# On shutdown, open orders are cancelled concurrently by this many threads. Anything not confirmed cancelled
+# within SHUTDOWN_TIMEOUT seconds is logged and left for you to check by hand.
+SHUTDOWN_CANCEL_WORKERS = 8
+SHUTDOWN_TIMEOUT = 10
+
+# A watchdog thread checks every WATCHDOG_INTERVAL seconds that the main loop is still going round and that market
+# data is still coming in. If the loop hasn't started an iteration for WATCHDOG_LOOP_TIMEOUT seconds (keep it well
+# above LOOP_INTERVAL + TICK_BUDGET), or market data hasn't been fetched for WATCHDOG_DATA_TIMEOUT seconds, it
+# cancels all our orders over connections of its own - the shared ones may be what the loop is stuck on - and,
+# with WATCHDOG_RESTART, restarts the bot.
+WATCHDOG = True
+WATCHDOG_INTERVAL = 1
+WATCHDOG_LOOP_TIMEOUT = 300
+WATCHDOG_DATA_TIMEOUT = 300
+WATCHDOG_RESTART = False
+
+# If we're doing a dry run, orders go to a simulated exchange that fills them against live market data.
+# Starting balances per asset; assets of SYMBOL not listed here start with DRY_BTC.
+DRY_BALANCES = {}
 DRY_BTC = 50
 
+# Simulated fee (fraction of order total) and extra per-call latency, in seconds, for dry run orders.
+DRY_RUN_FEE = 0.001
+DRY_RUN_LATENCY = 0.2
+
+# Clock used for sleeping and timestamps. 'real' for trading; for dry runs and simulations:
+#   'simulated'   - time only moves when the bot sleeps, and sleeps return at once. Deterministic and as fast
+#                   as the code runs.
+#   'accelerated' - the real clock running CLOCK_SPEED times faster.
+CLOCK = 'real'
+CLOCK_SPEED = 10.0
+
 # Available levels: logging.(DEBUG|INFO|WARN|ERROR)
 LOG_LEVEL = logging.INFO
 
-# To uniquely identify orders placed by this bot, the bot sends a ClOrdID (Client order ID) that is attached
-# to each order so its source can be identified. This keeps the market maker from cancelling orders that are
-# manually placed, or orders placed by another bot.
+# 'text' for human-readable lines, 'json' for one JSON object per line (with symbol/endpoint/latency/orderid
+# fields where available) for log shippers.
+LOG_FORMAT = 'text'
+
+# If set, also write logs to this file.
+LOG_FILE = None
+
+# If True, log records are handed to a background thread for formatting and writing, so slow output never
+# blocks the trading loop.
+LOG_ASYNC = True
+
+# To uniquely identify orders placed by this bot, the bot tags each order with a ClOrdID (Client order ID)
+# starting with this prefix and indexes it against the exchange orderid. Only indexed orders are amended or
+# cancelled, which keeps the market maker from cancelling orders that are manually placed, or orders placed
+# by another bot. FxADK does not store the ClOrdID, so the index is kept in STATE_FILE; without it, orders left
+# behind by a previous run are not recognised and will not be cancelled.
 #
 # If you are running multiple bots on the same symbol, give them unique ORDERID_PREFIXes - otherwise they will
 # cancel each others' orders.
 # Max length is 13 characters.
 ORDERID_PREFIX = "mm_adk_"
 
+# Our open orders, the last instrument snapshot and a position checkpoint are kept in this SQLite file.
+# With RECONCILE_ON_START, a restarted bot keeps the orders it left open instead of cancelling them all. When the
+# bot restarts itself (on a code change, or from the watchdog), "Contracts Traded This Run" and the PnL carry on
+# from the checkpoint; launching it again starts a new run. Delete the file to start afresh. None disables it.
+STATE_FILE = 'marketmaker-state.db'
+RECONCILE_ON_START = True
+
+# PnL of the run is kept from our fills as they come in, checkpointed in STATE_FILE (for self-restarts within the
+# run) and logged with the status.
+# Closed positions are matched against open ones by 'average' cost or 'fifo' lots.
+PNL_METHOD = 'average'
+
+# Append market snapshots, our order placements and our fills to this file as JSON lines, for offline markout and
+# fill-quality analysis with `marketmaker-tca RECORD_FILE` (needs `pip install bitmex-market-maker[analytics]`).
+# None disables recording.
+RECORD_FILE = None
+
 # If any of these files (and this file) changes, reload the bot.
+# Changes to settings.py / settings-<symbol>.py are applied in place; changes to code files restart the process.
 WATCHED_FILES = [join('market_maker', 'market_maker.py'), join('market_maker', 'fxadk.py'), 'settings.py']
 
+# How often, in seconds, to check WATCHED_FILES for changes.
+FILE_CHECK_INTERVAL = 10
+
 
 ########################################################################################################################
 # BitMEX Portfolio
@@ -1,26 +1,27 @@
 from requests.auth import AuthBase
-import time
 import hashlib
 import hmac
 from future.builtins import bytes
 from future.standard_library import hooks
 with hooks():  # Python 2/3 compat
     from urllib.parse import urlparse
+from market_maker.utils.clock import get_clock
 
 
 class APIKeyAuth(AuthBase):
 
     """Attaches API Key Authentication to the given Request object."""
 
-    def __init__(self, apiKey, apiSecret):
+    def __init__(self, apiKey, apiSecret, clock=None):
         """Init with Key & Secret."""
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        self.clock = clock
 
     def __call__(self, r):
         """Called when forming a request - generates api key headers."""
         # modify and return the request
-        nonce = generate_expires()
+        nonce = generate_expires(self.clock)
         r.headers['api-expires'] = str(nonce)
         r.headers['api-key'] = self.apiKey
         r.headers['api-signature'] = generate_signature(self.apiSecret, r.method, r.url, nonce, r.body or '')
@@ -28,8 +29,8 @@ class APIKeyAuth(AuthBase):
         return r
 
 
-def generate_expires():
-    return int(time.time() + 3600)
+def generate_expires(clock=None):
+    return int((clock or get_clock()).time() + 3600)
 
 
 # Generates an API signature.
@@ -1,16 +1,17 @@
 from requests.auth import AuthBase
-import time
 from market_maker.auth.APIKeyAuth import generate_signature
+from market_maker.utils.clock import get_clock
 
 
 class APIKeyAuthWithExpires(AuthBase):
 
     """Attaches API Key Authentication to the given Request object. This implementation uses `expires`."""
 
-    def __init__(self, apiKey, apiSecret):
+    def __init__(self, apiKey, apiSecret, clock=None):
         """Init with Key & Secret."""
         self.apiKey = apiKey
         self.apiSecret = apiSecret
+        self.clock = clock or get_clock()
 
     def __call__(self, r):
         """
@@ -20,7 +21,7 @@ class APIKeyAuthWithExpires(AuthBase):
         For more details, see https://www.bitmex.com/app/apiKeys
         """
         # modify and return the request
-        expires = int(round(time.time()) + 5)  # 5s grace period in case of clock skew
+        expires = int(round(self.clock.time()) + 5)  # 5s grace period in case of clock skew
         r.headers['api-expires'] = str(expires)
         r.headers['api-key'] = self.apiKey
         r.headers['api-signature'] = generate_signature(self.apiSecret, r.method, r.url, expires, r.body or '')
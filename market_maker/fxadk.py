@@ -1,19 +1,45 @@
 """BitMEX API Connector."""
 from __future__ import absolute_import
 import logging
+import threading
+from market_maker.settings import settings
 from market_maker.ws.ws_thread import FxADKInterface
+from market_maker.ws.paper import PaperFxADKInterface
+from market_maker.utils import deadline
+from market_maker.utils.orders import OrderIndex
+from market_maker.utils.errors import OrderStatusUnknown, RiskCheckError
+from market_maker.risk import RiskEngine
 from builtins import str
 
 
+def dry_run_balances(symbol):
+    """Starting paper balances: DRY_BALANCES, with both assets of `symbol` defaulting to DRY_BTC."""
+    balances = {asset: float(settings.DRY_BTC) for asset in (symbol or '').split('/') if asset}
+    balances.update(settings.DRY_BALANCES or {})
+    return balances
+
+
 class FxADK(object):
 
     """FxADK Connector"""
 
-    def __init__(self, symbol=None):
+    def __init__(self, symbol=None, orderIDPrefix='mm_adk_', dry_run=False, store=None, clock=None):
         """Init connector."""
         self.logger = logging.getLogger('root')
         self.symbol = symbol
-        self.ws = FxADKInterface()
+        # Every order we place is tagged and indexed so we never touch orders placed by someone else.
+        if len(orderIDPrefix) > 13:
+            raise ValueError("settings.ORDERID_PREFIX must be at most 13 characters long!")
+        self.orderIDPrefix = orderIDPrefix
+        self.orders = OrderIndex(orderIDPrefix, store)
+        self.risk = RiskEngine.from_settings(settings, clock)
+        # Guards the index and risk state, which the watchdog updates from its own thread. Never held over a request.
+        self.lock = threading.RLock()
+        if dry_run:
+            self.ws = PaperFxADKInterface(balances=dry_run_balances(symbol), fee=settings.DRY_RUN_FEE,
+                                          latency=settings.DRY_RUN_LATENCY, clock=clock)
+        else:
+            self.ws = FxADKInterface(clock)
 
     def __del__(self):
         self.exit()
@@ -28,13 +54,19 @@ class FxADK(object):
         """Get ticker data."""
         if symbol is None:
             symbol = self.symbol
-        return self.ws.get_ticker(symbol)
+        ticker = self.ws.get_ticker(symbol)
+        if symbol == self.symbol:
+            self.risk.update_mid(ticker['mid'])
+        return ticker
 
     def instrument(self, symbol=None):
         """Get an instrument's details."""
         if symbol is None:
             symbol = self.symbol
-        return self.ws.get_instrument(symbol)
+        instrument = self.ws.get_instrument(symbol)
+        if symbol == self.symbol:
+            self.risk.update_mid(instrument['midPrice'])
+        return instrument
 
     def instruments(self, filter=None):
         if filter is None:
@@ -97,7 +129,7 @@ class FxADK(object):
         if symbol is None:
             symbol = self.symbol
 
-        return self.ws.create_order(amount=quantity, price=price, order=order, type='buy', pair=symbol)
+        return self.create_order({'amount': quantity, 'price': price, 'order': order, 'type': 'buy', 'symbol': symbol})
     
     def sell(self, quantity, price, symbol=None, order='limit'):
         """Place a sell order.
@@ -114,7 +146,7 @@ class FxADK(object):
         if symbol is None:
             symbol = self.symbol
 
-        return self.ws.create_order(amount=quantity, price=price, order=order, type='sell', pair=symbol)
+        return self.create_order({'amount': quantity, 'price': price, 'order': order, 'type': 'sell', 'symbol': symbol})
     
     def amend_bulk_orders(self, orders):
         """Amend multiple orders.
@@ -132,30 +164,99 @@ class FxADK(object):
         ]
 
         """
-        self.ws.cancel_orders([o['orderid'] for o in orders])
+        self.cancel([o['orderid'] for o in orders])
 
         return self.create_bulk_orders(orders)
 
     def create_bulk_orders(self, orders):
-        """Create multiple orders. Same format as above with no orderid"""
+        """Create multiple orders. Same format as above with no orderid.
+
+        Each order is tagged with a clOrdID (generated if the order doesn't carry one) and registered
+        in `self.orders` so we can recognise it later.
+        """
 
         orders_created = []
 
         for order in orders:
             try:
-                orders_created.append(
-                    self.ws.create_order(amount=order['amount'], price=order['price'], order=order.get('order', 'limit'), type=order['type'], pair=order.get('symbol', self.symbol))
-                )
+                orders_created.append(self.create_order(order))
+            except RiskCheckError as e:
+                self.logger.warning("Risk check rejected %s %s @ %s: %s" % (order['type'], order['amount'], order['price'], e))
             except RuntimeError:
                 continue  # failed to create this order, you probably don't have a high enough balance
 
         return orders_created
 
+    def create_order(self, order):
+        """Risk-check, tag, send and index a single order. Every order we place goes through here."""
+        with self.lock:
+            self.risk.check(order)
+
+        clordid = order.get('clOrdID') or self.orders.new_clordid()
+        symbol = order.get('symbol', self.symbol)
+        try:
+            created = self.ws.create_order(amount=order['amount'], price=order['price'], order=order.get('order', 'limit'), type=order['type'], pair=symbol)
+        except OrderStatusUnknown as e:
+            # The create most likely timed out because its stage did: look for the order on a grace period of
+            # its own, or an order the exchange accepted would never be indexed (nor cancelled on exit).
+            with deadline.grace(settings.TIMEOUT):
+                created = self.find_unindexed_order(order, symbol)
+            if created is None:
+                raise RuntimeError('No open order found for %s: %s' % (order, e))
+            self.logger.warning("Create of %s %s @ %s timed out but it is open as %s." %
+                                (order['type'], order['amount'], order['price'], created['orderid']))
+
+        with self.lock:
+            self.orders.add(clordid, created['orderid'], symbol)
+            self.risk.on_created(created['orderid'], order)
+        created['clOrdID'] = clordid
+        # What was asked for, and the ladder level it was for (PnL attribution, recording).
+        created.update(type=order['type'], price=order['price'], amount=order['amount'], level=order.get('level'))
+        return created
+
+    def find_unindexed_order(self, order, symbol):
+        """An open order matching `order` that isn't in our index: what a createOrder whose response was lost
+        left behind, if it is still open."""
+        for candidate in self.ws.open_orders(symbol):
+            if (self.orders.clordid(candidate['orderid']) is None and candidate['type'] == order['type'] and
+                    float(candidate['price']) == float(order['price']) and
+                    float(candidate['amount']) == float(order['amount'])):
+                return dict((k, candidate[k]) for k in candidate)
+        return None
+
     def open_orders(self, symbol=None):
-        """Get open orders."""
+        """Get open orders placed by this bot. Orders placed by anyone else are filtered out."""
         if symbol is None:
             symbol = self.symbol
-        return self.ws.open_orders(symbol)
+
+        all_orders = self.ws.open_orders(symbol)
+
+        # Anything we indexed that is no longer open has filled or been cancelled elsewhere.
+        with self.lock:
+            for order_id in self.orders.retain([o['orderid'] for o in all_orders], symbol):
+                self.risk.on_removed(order_id)
+
+        our_orders = []
+        for order in all_orders:
+            clordid = self.orders.clordid(order['orderid'])
+            if clordid is not None:
+                order['clOrdID'] = clordid
+                our_orders.append(order)
+
+        return our_orders
+
+    def reconcile(self, symbol=None):
+        """Match the orders we remember (from a StateStore) against what is open on the exchange.
+        Orders no longer open are forgotten; the rest are returned and counted against the risk limits again."""
+        live_orders = self.open_orders(symbol)
+        with self.lock:
+            for order in live_orders:
+                self.risk.on_created(order['orderid'], order)
+        return live_orders
+
+    def owned_order_ids(self, symbol=None):
+        """Exchange orderids of every order this bot believes is open, without calling the API."""
+        return self.orders.order_ids(symbol)
 
     def http_open_orders(self):
         """Get open orders via HTTP. Used on close to ensure we catch them all."""
@@ -166,7 +267,33 @@ class FxADK(object):
         if isinstance(orderIDs, str):
             orderIDs = [orderIDs]
 
-        self.ws.cancel_orders(orderIDs)
+        for order_id in orderIDs:
+            try:
+                self.ws.cancel_orders([order_id])
+            except OrderStatusUnknown as e:
+                # Keep it indexed: if it is still open, the next converge sees it and cancels it again.
+                self.logger.warning("Cancel of %s may not have gone through: %s" % (order_id, e))
+                continue
+            with self.lock:
+                self.orders.discard(order_id)
+                self.risk.on_removed(order_id)
     
+    def cancel_all(self, timeout, max_workers=8, symbol=None, independent=False):
+        """Cancel every order we own concurrently within `timeout` seconds, over connections of their own if
+        `independent`.
+
+        Returns the orderids that could not be confirmed cancelled; those stay in the index.
+        """
+        order_ids = self.owned_order_ids(symbol)
+        unconfirmed = self.ws.cancel_orders_concurrently(order_ids, timeout, max_workers, independent)
+
+        with self.lock:
+            for order_id in order_ids:
+                if order_id not in unconfirmed:
+                    self.orders.discard(order_id)
+                    self.risk.on_removed(order_id)
+
+        return unconfirmed
+
     def withdraw(self, amount, fee, address):
         raise NotImplementedError('No FxADK api call for this')
\ No newline at end of file
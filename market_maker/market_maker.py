@@ -1,20 +1,45 @@
 from __future__ import absolute_import
-from time import sleep
+from market_maker.utils.timing import startup
 import sys
-from datetime import datetime
-from os.path import getmtime
+import os
 import random
 import requests
 import atexit
 import signal
 
 from market_maker import fxadk
+from market_maker import settings as settings_loader
 from market_maker.settings import settings
-from market_maker.utils import log, constants, errors, math
-
-# Used for reloading the bot - saves modified times of key files
-import os
-watched_files_mtimes = [(f, getmtime(f)) for f in settings.WATCHED_FILES]
+from market_maker.utils import log, constants, errors, book, deadline
+from market_maker.utils.clock import get_clock
+from market_maker.utils.funding import FundsAllocator
+from market_maker.utils.pnl import PnLLedger
+from market_maker.utils.recorder import Recorder
+from market_maker.utils.stats import TradeStats
+from market_maker.utils.requote import RequoteFilter
+from market_maker.utils.state import StateStore, run_id
+from market_maker.strategy import TickContext, freeze, ladder_price, load_strategy
+from market_maker.utils.watcher import FileWatcher
+from market_maker.watchdog import Watchdog
+from market_maker.ws import fxadk_impl
+
+# Changing any of these needs a fresh connection / order index, so a settings reload falls back to a restart.
+RESTART_SETTINGS = frozenset(['BASE_URL', 'API_KEY', 'API_SECRET', 'SYMBOL', 'DRY_RUN', 'ORDERID_PREFIX',
+                              'WATCHED_FILES', 'CLOCK', 'CLOCK_SPEED', 'PNL_METHOD', 'WATCHDOG'])
+
+# Changing any of these rebuilds the requote filter (which restarts its counters).
+REQUOTE_SETTINGS = frozenset(['RELIST_INTERVAL', 'RELIST_LEVEL_WIDENING', 'RELIST_SIZE_TOLERANCE',
+                              'AMEND_BUDGET_PER_MINUTE'])
+
+# Changing any of these alters the desired ladder, so we requote immediately instead of waiting for the next loop.
+QUOTE_SETTINGS = frozenset(['ORDER_PAIRS', 'ORDER_START_SIZE', 'ORDER_STEP_SIZE', 'RANDOM_ORDER_SIZE',
+                            'MIN_ORDER_SIZE', 'MAX_ORDER_SIZE', 'INTERVAL', 'MIN_SPREAD', 'MAINTAIN_SPREADS',
+                            'RELIST_INTERVAL', 'CHECK_POSITION_LIMITS', 'MIN_POSITION', 'MAX_POSITION',
+                            'VOLATILITY_SCALED_INTERVAL', 'VOLATILITY_INTERVAL_MULTIPLIER', 'STRATEGY',
+                            'AS_GAMMA', 'AS_KAPPA', 'AS_HORIZON', 'REFERENCE_PRICE', 'REFERENCE_DEPTH',
+                            'REFERENCE_DECAY', 'BALANCE_AWARE_SIZING'])
+
+startup.mark('imports')
 
 
 #
@@ -24,13 +49,27 @@ logger = log.setup_custom_logger('root')
 
 
 class ExchangeInterface:
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, symbol=None, clock=None):
         self.dry_run = dry_run
-        if len(sys.argv) > 1:
+        self.clock = clock or get_clock()
+        if symbol is not None:
+            self.symbol = symbol
+        elif len(sys.argv) > 1:
             self.symbol = sys.argv[1]
         else:
             self.symbol = settings.SYMBOL
-        self.fxadk = fxadk.FxADK(symbol=self.symbol)
+        # Paper orders don't outlive the process, so there is nothing to persist on a dry run.
+        self.store = StateStore(settings.STATE_FILE) if settings.STATE_FILE and not dry_run else None
+        self.fxadk = fxadk.FxADK(symbol=self.symbol, orderIDPrefix=settings.ORDERID_PREFIX, dry_run=dry_run,
+                                 store=self.store, clock=self.clock)
+        self.trade_stats = TradeStats(settings.STATS_WINDOW, settings.VOLATILITY_EWMA_ALPHA)
+        saved = self.load_run_state('pnl')
+        if saved and saved['method'] == settings.PNL_METHOD:
+            self.pnl = PnLLedger.from_dict(saved)
+        else:
+            self.pnl = PnLLedger(settings.PNL_METHOD)
+        self.recorder = Recorder(settings.RECORD_FILE, self.clock) if settings.RECORD_FILE else None
+        self.last_data = None  # when market data was last fetched successfully
 
     def cancel_order(self, order_id):
         logger.info("Canceling: %s" % order_id)
@@ -39,17 +78,15 @@ class ExchangeInterface:
                 self.fxadk.cancel(order_id)
             except ValueError as e:
                 logger.info(e)
-                sleep(settings.API_ERROR_INTERVAL)
+                self.clock.sleep(settings.API_ERROR_INTERVAL)
             else:
                 break
 
     def cancel_all_orders(self):
-        if self.dry_run:
-            return
-
         logger.info("Resetting current position. Canceling all existing orders.")
 
-        current_order_ids = [o['orderid'] for o in self.get_orders()]
+        # Only our own orders, straight from the local index - no need to fetch the open order list.
+        current_order_ids = self.fxadk.owned_order_ids(self.symbol)
 
         for order_id in current_order_ids:
             logger.info("Canceling: %s" % order_id)
@@ -57,6 +94,48 @@ class ExchangeInterface:
         if len(current_order_ids):
             self.fxadk.cancel(current_order_ids)
 
+    def reconcile_orders(self):
+        """Keep the orders a previous run left open instead of cancelling them."""
+        live_orders = self.fxadk.reconcile(self.symbol)
+        logger.info("Recovered %d open orders from the previous run." % len(live_orders))
+        return live_orders
+
+    def record(self, kind, **fields):
+        """Write a RECORD_FILE line, if recording."""
+        if self.recorder is not None:
+            self.recorder.record(kind, self.symbol, **fields)
+
+    def save_state(self, key, value):
+        if self.store is not None:
+            self.store.save('%s:%s' % (key, self.symbol), value)
+
+    def load_state(self, key, default=None):
+        if self.store is None:
+            return default
+        return self.store.load('%s:%s' % (key, self.symbol), default)
+
+    def save_run_state(self, key, value):
+        """Like save_state, for things that only hold for this run (see utils.state.run_id)."""
+        self.save_state(key, {'run': run_id(), 'value': value})
+
+    def load_run_state(self, key, default=None):
+        """What save_run_state saved in this run, or `default` if it was saved by an earlier one."""
+        saved = self.load_state(key)
+        if not isinstance(saved, dict) or saved.get('run') != run_id():
+            return default
+        return saved['value']
+
+    def cancel_all_orders_fast(self, timeout, independent=False):
+        """Cancel all of our orders concurrently, giving up after `timeout` seconds. With `independent`, over
+           connections of their own rather than the shared pool.
+           Returns the orderids that could not be confirmed cancelled."""
+        unconfirmed = self.fxadk.cancel_all(timeout, settings.SHUTDOWN_CANCEL_WORKERS, symbol=self.symbol,
+                                            independent=independent)
+        if unconfirmed:
+            logger.warning("Could not confirm cancellation of %d orders: %s" %
+                           (len(unconfirmed), ", ".join(unconfirmed)))
+        return unconfirmed
+
     def get_portfolio(self):
         funds = self.fxadk.funds()
         return funds
@@ -77,21 +156,15 @@ class ExchangeInterface:
             symbol = self.symbol
 
         instrument = self.fxadk.instrument(symbol)
+        if symbol == self.symbol:
+            self.last_data = self.clock.time()
         return instrument
 
     def get_margin(self):
-        if self.dry_run:
-            return [
-                {'symbol': 'BTC', 'balance': float(settings.DRY_BTC)}
-            ]
-
         funds = self.fxadk.funds()
         return funds
 
     def get_orders(self):
-        if self.dry_run:
-            return []
-
         open_orders = self.fxadk.open_orders()
 
         return open_orders
@@ -100,33 +173,29 @@ class ExchangeInterface:
         if symbol is None:
             symbol = self.symbol
 
-        return self.fxadk.recent_trades(symbol)
+        recent_trades = self.fxadk.recent_trades(symbol)
+        if symbol == self.symbol:
+            self.trade_stats.update(recent_trades)
+            new_fills = self.pnl.update(recent_trades)
+            for trade in reversed(recent_trades[:new_fills]):
+                self.record('fill', orderid=trade.get('orderid'), side=trade['type'], price=float(trade['price']),
+                            amount=float(trade['amount']), fees=float(trade.get('fees') or 0),
+                            level=self.pnl.order_levels.get(str(trade.get('orderid'))), date=trade.get('date'))
+        return recent_trades
 
     def get_highest_buy(self, recent_trades):
-        if not len(recent_trades):
-            return {'price': -2**32}
+        """Highest buy price over the last STATS_WINDOW trades."""
+        self.trade_stats.update(recent_trades)  # no-op unless these trades are new
 
-        buys = [o for o in recent_trades if o['type'] == 'buy']
-
-        for buy in buys:
-            buy['price'] = float(buy['price'])
-
-        smallest_val = {'price': -2**32}
-        highest_buy = max(buys, key=lambda o: o['price']) if buys else smallest_val
-        return highest_buy if highest_buy else smallest_val
+        highest_buy = self.trade_stats.highest_buy
+        return {'price': highest_buy if highest_buy is not None else -2**32}
 
     def get_lowest_sell(self, recent_trades):
-        if not len(recent_trades):
-            return {'price': 2 ** 32}
-
-        sells = [o for o in recent_trades if o['type'] == 'sell']
+        """Lowest sell price over the last STATS_WINDOW trades."""
+        self.trade_stats.update(recent_trades)
 
-        for sell in sells:
-            sell['price'] = float(sell['price'])
-
-        biggest_val = {'price': 2 ** 32}
-        lowest_sell = min(sells, key=lambda o: o['price']) if sells else biggest_val
-        return lowest_sell if lowest_sell else biggest_val
+        lowest_sell = self.trade_stats.lowest_sell
+        return {'price': lowest_sell if lowest_sell is not None else 2**32}
 
     def get_position(self, symbol=None, qty_only=False):
         if symbol is None:
@@ -140,11 +209,25 @@ class ExchangeInterface:
             symbol = self.symbol
 
         ticker = self.fxadk.ticker_data(symbol)
+        if symbol == self.symbol:
+            ticker.update(self.trade_stats.snapshot())
         return ticker
 
+    def check_kill_switch(self):
+        """True if the risk kill switch is on and no new orders may be sent.
+           Creating KILL_SWITCH_FILE throws the switch."""
+        risk = self.fxadk.risk
+        if settings.KILL_SWITCH_FILE and os.path.exists(settings.KILL_SWITCH_FILE):
+            risk.kill("%s exists" % settings.KILL_SWITCH_FILE)
+        return risk.killed is not None
+
+    def get_simulated_calls(self):
+        """API calls a dry run would have made, by endpoint. Empty on a live run."""
+        return dict(getattr(self.fxadk.ws, 'calls', {}))
+
     def is_open(self):
-        """Check that websockets are still open."""
-        return True  # it's not a real websocket
+        """There are no websockets; the connection counts as open while market data keeps coming in."""
+        return self.last_data is not None and self.clock.time() - self.last_data <= settings.WATCHDOG_DATA_TIMEOUT
 
     def check_market_open(self):
         pass  # this is not implemented
@@ -159,28 +242,34 @@ class ExchangeInterface:
         return instrument
 
     def amend_bulk_orders(self, orders):
-        if self.dry_run:
-            return orders
-
-        self.fxadk.amend_bulk_orders(orders)
+        self.on_created(self.fxadk.amend_bulk_orders(orders))
 
     def create_bulk_orders(self, orders):
-        if self.dry_run:
-            return orders
+        self.on_created(self.fxadk.create_bulk_orders(orders))
 
-        self.fxadk.create_bulk_orders(orders)
+    def on_created(self, created):
+        self.pnl.on_created(created)
+        for order in created:
+            self.record('placement', orderid=order['orderid'], side=order['type'], price=float(order['price']),
+                        amount=float(order['amount']), level=order['level'])
 
     def cancel_bulk_orders(self, orders):
-        if self.dry_run:
-            return orders
-
         current_order_ids = [order['orderid'] for order in orders]
         self.fxadk.cancel(current_order_ids)
 
 
 class OrderManager:
-    def __init__(self):
-        self.exchange = ExchangeInterface(settings.DRY_RUN)
+    """Quotes one symbol. Run one per process - one process per symbol: settings are process-wide, the
+    settings-<symbol>.py overrides are loaded for the symbol on the command line only, and each OrderManager
+    installs the process's exit and SIGTERM handlers. `symbol` overrides the command line and SYMBOL, e.g. for
+    scripts and simulations that drive a single bot."""
+
+    def __init__(self, symbol=None, clock=None):
+        self.exiting = False
+        self.last_fetch = None
+        self.clock = clock or get_clock()
+        self.exchange = ExchangeInterface(settings.DRY_RUN, symbol, self.clock)
+        startup.mark('connect')
         # Once exchange is created, register exit handler that will always cancel orders
         # on any error.
         atexit.register(self.exit)
@@ -189,18 +278,40 @@ class OrderManager:
         logger.info("Using symbol %s." % self.exchange.symbol)
 
         if settings.DRY_RUN:
-            logger.info("Initializing dry run. Orders printed below represent what would be posted to FxADK.")
+            logger.info("Initializing dry run. Orders are placed on a simulated exchange fed by live FxADK market data.")
         else:
             logger.info("Order Manager initializing, connecting to FxADK. Live run: executing real trades.")
-
-        self.start_time = datetime.now()
-        self.instrument = self.exchange.get_instrument()
-        self.starting_qty = self.exchange.get_delta()
+        if settings.CLOCK not in (None, 'real'):
+            logger.warning("Using a %s clock; loop timing and rate limits will not match the real exchange." %
+                           settings.CLOCK)
+
+        self.start_time = self.clock.now()
+        self.strategy = load_strategy(settings.STRATEGY)(settings)
+        logger.info("Using strategy %s." % settings.STRATEGY)
+        self.requote_filter = self.get_requote_filter()
+        self.watcher = FileWatcher(settings.WATCHED_FILES + settings_loader.loaded_files, settings.FILE_CHECK_INTERVAL,
+                                   self.clock)
+        self.watchdog = None
+        if settings.WATCHDOG:
+            self.watchdog = Watchdog.from_settings(settings, self.on_stall, lambda: self.exchange.last_data, self.clock)
+            self.watchdog.start()
+        # After a restart, the last instrument snapshot and position checkpoint save a round of API calls;
+        # sanity_check refreshes the instrument before anything is quoted. The checkpoint is only taken from a
+        # restart within this run, so "Contracts Traded This Run" counts from when the bot was launched.
+        self.instrument = self.exchange.load_state('instrument') or self.exchange.get_instrument()
+        checkpoint = self.exchange.load_run_state('position')
+        self.starting_qty = checkpoint['starting_qty'] if checkpoint else self.exchange.get_delta()
         self.running_qty = self.starting_qty
+        startup.mark('instrument & position')
         self.reset()
+        startup.mark('initial quote')
+        startup.report(logger)
 
     def reset(self):
-        self.exchange.cancel_all_orders()
+        if self.exchange.store is not None and settings.RECONCILE_ON_START:
+            self.exchange.reconcile_orders()
+        else:
+            self.exchange.cancel_all_orders()
         position = self.sanity_check()
         self.print_status(position)
 
@@ -211,6 +322,7 @@ class OrderManager:
         """Print the current MM status."""
 
         self.running_qty = position['currentQty']  # this was get_delta
+        self.exchange.save_run_state('position', {'starting_qty': self.starting_qty, 'running_qty': self.running_qty})
 
         logger.info("Current Contract Position: %d" % self.running_qty)
         if settings.CHECK_POSITION_LIMITS:
@@ -219,6 +331,21 @@ class OrderManager:
             logger.info("Avg Cost Price: %f" % float(position['avgCostPrice']))
             logger.info("Avg Entry Price: %f" % float(position['avgEntryPrice']))
         logger.info("Contracts Traded This Run: %d" % (self.running_qty - self.starting_qty))
+        pnl = self.exchange.pnl.snapshot(self.instrument['midPrice'])
+        logger.info("PnL this run: realized %.8f, unrealized %.8f, fees %.8f, net %.8f (%d fills)" %
+                    (pnl['realized'], pnl['unrealized'], pnl['fees'], pnl['net'], pnl['fills']))
+        logger.debug("PnL by level (level, realized, fees, volume, fills): %s" % self.exchange.pnl.levels())
+        self.exchange.save_run_state('pnl', self.exchange.pnl.to_dict())
+        logger.info("Amends suppressed: %d, deferred by budget: %d (%d API calls saved over plain RELIST_INTERVAL)" %
+                    (self.requote_filter.suppressed, self.requote_filter.deferred, self.requote_filter.calls_saved))
+        if settings.DRY_RUN:
+            logger.info("Simulated API calls: %s" % self.exchange.get_simulated_calls())
+        if self.watchdog is not None:
+            logger.debug("Watchdog: %s" % self.watchdog.health())
+        logger.debug("HTTP connections: %s" % self.exchange.fxadk.ws.fx_adk_api.transport.stats())
+        logger.debug("Coalesced reads: %s" % fxadk_impl.reads.stats())
+        if self.exchange.fxadk.ws.fx_adk_api.scheduler is not None:
+            logger.info("Request latency by class: %s" % self.exchange.fxadk.ws.fx_adk_api.scheduler.stats())
 
     def get_ticker(self, ticker):
         # Set up our buy & sell positions as the smallest possible unit above and below the current spread
@@ -239,13 +366,23 @@ class OrderManager:
             if ticker['sell'] == self.exchange.get_lowest_sell(recent_trades)['price']:
                 self.start_position_sell = ticker["sell"]
 
+        # Anchor on the reference price instead of the plain mid: shift both sides by the difference, but
+        # never through the other side of the book.
+        tick_size = self.instrument['tickSize']
+        reference = book.reference_price(settings.REFERENCE_PRICE, self.instrument,
+                                         settings.REFERENCE_DEPTH, settings.REFERENCE_DECAY)
+        offset = reference - ticker["mid"]
+        if offset:
+            self.start_position_buy = min(self.start_position_buy + offset, ticker["sell"] - tick_size)
+            self.start_position_sell = max(self.start_position_sell + offset, ticker["buy"] + tick_size)
+
         # Back off if our spread is too small.
         if self.start_position_buy * (1.00 + settings.MIN_SPREAD) > self.start_position_sell:
             self.start_position_buy *= (1.00 - (settings.MIN_SPREAD / 2))
             self.start_position_sell *= (1.00 + (settings.MIN_SPREAD / 2))
 
         # Midpoint, used for simpler order placement.
-        self.start_position_mid = ticker["mid"]
+        self.start_position_mid = reference
         logger.info(
             "%s Ticker: buy: %f, sell: %f" %
             (self.instrument['symbol'], ticker["buy"], ticker["sell"])
@@ -253,55 +390,65 @@ class OrderManager:
         logger.info('Start Positions: buy: %f, sell: %f, Mid: %f' %
                     (self.start_position_buy, self.start_position_sell,
                      self.start_position_mid))
+        logger.debug('Trade stats: %s' % self.exchange.trade_stats.snapshot())
         return ticker
 
+    def get_requote_filter(self):
+        return RequoteFilter(settings.RELIST_INTERVAL, settings.RELIST_LEVEL_WIDENING,
+                             settings.RELIST_SIZE_TOLERANCE, settings.AMEND_BUDGET_PER_MINUTE, self.clock)
+
+    def get_interval(self):
+        """Distance between ladder levels. With VOLATILITY_SCALED_INTERVAL, widens with recent volatility
+           but never drops below INTERVAL."""
+        if not settings.VOLATILITY_SCALED_INTERVAL:
+            return settings.INTERVAL
+
+        volatility = self.exchange.trade_stats.volatility
+        return max(settings.INTERVAL, settings.VOLATILITY_INTERVAL_MULTIPLIER * volatility)
+
     def get_price_offset(self, index):
         """Given an index (1, -1, 2, -2, etc.) return the price for that side of the book.
            Negative is a buy, positive is a sell."""
-        # Maintain existing spreads for max profit
-        if settings.MAINTAIN_SPREADS:
-            start_position = self.start_position_buy if index < 0 else self.start_position_sell
-            # First positions (index 1, -1) should start right at start_position, others should branch from there
-            index = index + 1 if index < 0 else index - 1
-        else:
-            # Offset mode: ticker comes from a reference exchange and we define an offset.
-            start_position = self.start_position_buy if index < 0 else self.start_position_sell
-
-            # If we're attempting to sell, but our sell price is actually lower than the buy,
-            # move over to the sell side.
-            if index > 0 and start_position < self.start_position_buy:
-                start_position = self.start_position_sell
-            # Same for buys.
-            if index < 0 and start_position > self.start_position_sell:
-                start_position = self.start_position_buy
-
-        return math.toNearest(start_position * (1 + settings.INTERVAL) ** index, self.instrument['tickSize'])
+        return ladder_price(index, self.start_position_buy, self.start_position_sell, self.get_interval(),
+                            self.instrument['tickSize'], settings.MAINTAIN_SPREADS)
 
     ###
     # Orders
     ###
 
-    def place_orders(self, position):
-        """Create order items for use in convergence."""
-
-        buy_orders = []
-        sell_orders = []
-        # Create orders from the outside in. This is intentional - let's say the inner order gets taken;
-        # then we match orders from the outside in, ensuring the fewest number of orders are amended and only
-        # a new order is created in the inside. If we did it inside-out, all orders would be amended
-        # down and a new order would be created at the outside.
-
-        delta = position['currentQty']
-        long_position_exceeded = self.long_position_limit_exceeded(delta)
-        short_position_exceeded = self.short_position_limit_exceeded(delta)
-
-        for i in reversed(range(1, settings.ORDER_PAIRS + 1)):
-            if not long_position_exceeded:
-                buy_orders.append(self.prepare_order(-i))
-            if not short_position_exceeded:
-                sell_orders.append(self.prepare_order(i))
+    def place_orders(self, position, budget=None):
+        """Ask the strategy for the orders it wants and converge to them, within the stages of `budget`."""
+        if self.exchange.check_kill_switch():
+            logger.error("Kill switch is on (%s). Pulling all quotes." % self.exchange.fxadk.risk.killed)
+            self.exchange.cancel_all_orders()
+            return
 
-        return self.converge_orders(buy_orders, sell_orders)
+        with deadline.stage(budget, 'fetch'):
+            existing_orders = self.exchange.get_orders()
+        with deadline.stage(budget, 'compute'):
+            context = self.get_context(position, existing_orders)
+            buy_orders, sell_orders = self.strategy.place_orders(context)
+        with deadline.stage(budget, 'submit'):
+            return self.converge_orders(buy_orders, sell_orders, existing_orders, position.get('balances'))
+
+    def get_context(self, position, open_orders):
+        """Everything the strategy gets to see this tick, built from data we already fetched."""
+        stats = self.exchange.trade_stats.snapshot()
+        ticker = dict(self.convert_instrument_to_ticker(self.instrument), **stats)
+        ticker['reference'] = self.start_position_mid
+        return TickContext(
+            symbol=self.exchange.symbol,
+            instrument=freeze({k: v for k, v in self.instrument.items() if k not in ('bids', 'asks')}),
+            ticker=freeze(ticker),
+            book=freeze({'bids': self.instrument.get('bids', []), 'asks': self.instrument.get('asks', [])}),
+            position=freeze(position),
+            open_orders=freeze(open_orders),
+            stats=freeze(stats),
+            start_position_buy=self.start_position_buy,
+            start_position_sell=self.start_position_sell,
+            start_position_mid=self.start_position_mid,
+            interval=self.get_interval(),
+        )
 
     def prepare_order(self, index):
         """Create an order object."""
@@ -321,55 +468,78 @@ class OrderManager:
             'type': "buy" if index < 0 else "sell",
         }
 
-    def converge_orders(self, buy_orders, sell_orders):
+    def converge_orders(self, buy_orders, sell_orders, existing_orders=None, balances=None):
         """Converge the orders we currently have in the book with what we want to be in the book.
            This involves amending any open orders and creating new ones if any have filled completely.
-           We start from the closest orders outward."""
+           We start from the closest orders outward.
+           Pass `existing_orders` if you already have our open orders, to save fetching them again, and
+           `balances` ({asset: balance}) to only send what we can fund."""
 
         to_amend = []
         to_create = []
         to_cancel = []
         buys_matched = 0
         sells_matched = 0
-        existing_orders = self.exchange.get_orders()
+        if existing_orders is None:
+            existing_orders = self.exchange.get_orders()
+
+        funded = balances is not None and settings.BALANCE_AWARE_SIZING
+        if funded:
+            # Compare resting orders with what we can fund, not with what we'd like: an order already shrunk to
+            # our balance must not be amended to the same size again every tick.
+            buy_orders, sell_orders = self.cap_to_balances(buy_orders, sell_orders, balances)
+
+        self.requote_filter.retain([order['orderid'] for order in existing_orders])
 
         # Check all existing orders and match them up with what we want to place.
         # If there's an open one, we might be able to amend it to fit what we want.
         for order in existing_orders:
             try:
+                # Desired orders run from the outside in; level counts from the inside.
                 if order['type'] == 'buy':
                     desired_order = buy_orders[buys_matched]
+                    level = len(buy_orders) - 1 - buys_matched
                     buys_matched += 1
                 else:
                     desired_order = sell_orders[sells_matched]
+                    level = len(sell_orders) - 1 - sells_matched
                     sells_matched += 1
 
                 # Found an existing order. Do we need to amend it?
-                if desired_order['amount'] != order['amount'] or (
-                        # If price has changed, and the change is more than our RELIST_INTERVAL, amend.
-                        desired_order['price'] != order['price'] and
-                        abs((desired_order['price'] / order['price']) - 1) > settings.RELIST_INTERVAL):
-                    to_amend.append({'orderid': order['orderid'], 'amount': order['amount'] + desired_order['amount'],
-                                     'price': desired_order['price'], 'type': order['type']})
+                if self.requote_filter.should_amend(order, desired_order, level,
+                                                    self.instrument['bidPrice'], self.instrument['askPrice']):
+                    # An amend is a cancel and a fresh create, so the new order gets the full desired amount.
+                    to_amend.append({'orderid': order['orderid'], 'amount': desired_order['amount'],
+                                     'price': desired_order['price'], 'type': order['type'], 'level': level})
             except IndexError:
                 # Will throw if there isn't a desired order to match. In that case, cancel it.
                 to_cancel.append(order)
 
         while buys_matched < len(buy_orders):
-            to_create.append(buy_orders[buys_matched])
+            to_create.append(dict(buy_orders[buys_matched], level=len(buy_orders) - 1 - buys_matched))
             buys_matched += 1
 
         while sells_matched < len(sell_orders):
-            to_create.append(sell_orders[sells_matched])
+            to_create.append(dict(sell_orders[sells_matched], level=len(sell_orders) - 1 - sells_matched))
             sells_matched += 1
 
+        if funded:
+            to_amend, to_create = self.fund_orders(balances, existing_orders, to_amend, to_create, to_cancel)
+
+        # Cancels go first, so the funds they free are there for the amends and creates.
+        if len(to_cancel) > 0:
+            logger.info("Canceling %d orders:" % (len(to_cancel)))
+            for order in reversed(to_cancel):
+                logger.info("%4s %d @ %f" % (order['type'], order['amount'], order['price']))
+            self.exchange.cancel_bulk_orders(to_cancel)
+
         if len(to_amend) > 0:
             for amended_order in reversed(to_amend):
                 reference_order = [o for o in existing_orders if o['orderid'] == amended_order['orderid']][0]
                 logger.info("Amending %4s: %d @ %f to %d @ %f (%f)" % (
                     amended_order['type'],
                     reference_order['amount'], reference_order['price'],
-                    (amended_order['amount'] - reference_order['amount']), amended_order['price'],
+                    amended_order['amount'], amended_order['price'],
                     (amended_order['price'] - reference_order['price'])
                 ))
             # This can fail if an order has closed in the time we were processing.
@@ -389,12 +559,48 @@ class OrderManager:
                 logger.info("%4s %d @ %f" % (order['type'], order['amount'], order['price']))
             self.exchange.create_bulk_orders(to_create)
 
-        # Could happen if we exceed a delta limit
-        if len(to_cancel) > 0:
-            logger.info("Canceling %d orders:" % (len(to_cancel)))
-            for order in reversed(to_cancel):
-                logger.info("%4s %d @ %f" % (order['type'], order['amount'], order['price']))
-            self.exchange.cancel_bulk_orders(to_cancel)
+    def cap_to_balances(self, buy_orders, sell_orders, balances):
+        """The desired ladder cut down to what `balances` could fund if it were all that was resting, innermost
+           level first. Levels that can't be funded at all are dropped from the outside."""
+        allocator = FundsAllocator(self.exchange.symbol, balances, settings.FUNDING_FEE_RESERVE,
+                                   settings.MIN_FUNDED_ORDER_SIZE)
+        capped = []
+        for orders in (buy_orders, sell_orders):
+            # Desired orders run from the outside in.
+            funded = [allocator.fund(order) for order in reversed(orders)]
+            capped.append([order for order in reversed(funded) if order is not None])
+        if allocator.shrunk or allocator.refused:
+            logger.debug("Ladder capped to balance: %d orders shrunk, %d dropped." %
+                         (allocator.shrunk, allocator.refused))
+        return capped[0], capped[1]
+
+    def fund_orders(self, balances, existing_orders, to_amend, to_create, to_cancel):
+        """Trim amends and creates to what `balances` can fund once our resting orders are accounted for,
+           innermost level first. An amend we can't fund is dropped, leaving the order it would replace."""
+        allocator = FundsAllocator(self.exchange.symbol, balances, settings.FUNDING_FEE_RESERVE,
+                                   settings.MIN_FUNDED_ORDER_SIZE)
+        existing = dict((order['orderid'], order) for order in existing_orders)
+        cancelled = set(order['orderid'] for order in to_cancel)
+        for order in existing_orders:
+            if order['orderid'] not in cancelled:
+                allocator.lock(order)
+
+        funded = {}
+        wanted = [(order, True) for order in to_amend] + [(order, False) for order in to_create]
+        for order, is_amend in sorted(wanted, key=lambda pair: pair[0]['level']):
+            if is_amend:
+                # The amend cancels the old order first, freeing its funds.
+                allocator.release(existing[order['orderid']])
+            funded[id(order)] = allocator.fund(order)
+            if funded[id(order)] is None and is_amend:
+                allocator.lock(existing[order['orderid']])
+        allocator.publish()
+
+        to_amend = [funded[id(order)] for order in to_amend if funded[id(order)] is not None]
+        to_create = [funded[id(order)] for order in to_create if funded[id(order)] is not None]
+        if allocator.shrunk or allocator.refused:
+            logger.info("Not enough balance: %d orders shrunk, %d not sent." % (allocator.shrunk, allocator.refused))
+        return to_amend, to_create
 
     ###
     # Position Limits
@@ -430,10 +636,15 @@ class OrderManager:
 
         # Check if OB is empty - if so, can't quote.
         instrument = self.exchange.check_if_orderbook_empty()
+        self.instrument = instrument
+        self.exchange.save_state('instrument', instrument)
 
         # Get ticker, which sets price offsets and prints some debugging info.
         ticker = self.convert_instrument_to_ticker(instrument)
         ticker = self.get_ticker(ticker)
+        self.exchange.record('snapshot', bid=instrument['bidPrice'], ask=instrument['askPrice'],
+                             mid=instrument['midPrice'], last=instrument['lastPrice'], interval=self.get_interval(),
+                             pairs=settings.ORDER_PAIRS)
 
         # Sanity check:
         if self.get_price_offset(-1) >= ticker["sell"] or self.get_price_offset(1) <= ticker["buy"]:
@@ -464,19 +675,83 @@ class OrderManager:
     ###
 
     def check_file_change(self):
-        """Restart if any files we're watching have changed."""
-        for f, mtime in watched_files_mtimes:
-            if getmtime(f) > mtime:
-                self.restart()
+        """Reload settings in place if a settings file changed; restart if any other watched file changed."""
+        changed = self.watcher.changed()
+        if not changed:
+            return
+
+        if any(f not in settings_loader.loaded_files for f in changed):
+            # Code changed - that can't be applied to a running process.
+            self.restart()
+
+        self.reload_settings()
+
+    def reload_settings(self):
+        """Re-merge the settings files and apply whatever changed without restarting."""
+        try:
+            changed = settings_loader.reload_settings()
+        except Exception as e:
+            # Most likely a file saved halfway through an edit; try again when it next changes.
+            logger.error("Could not reload settings, keeping the current ones: %s: %s" % (type(e).__name__, e))
+            return
+        if not changed:
+            return
+
+        for key in sorted(changed):
+            logger.info("Setting %s changed: %r -> %r" % (key, changed[key][0], changed[key][1]))
+
+        if RESTART_SETTINGS.intersection(changed):
+            self.restart()
+
+        if 'LOG_LEVEL' in changed:
+            logger.setLevel(settings.LOG_LEVEL)
+
+        if 'STRATEGY' in changed:
+            self.strategy = load_strategy(settings.STRATEGY)(settings)
+
+        if REQUOTE_SETTINGS.intersection(changed):
+            self.requote_filter = self.get_requote_filter()
+
+        if any(key.startswith('RISK_') for key in changed):
+            self.exchange.fxadk.risk.configure(settings)
+
+        if self.watchdog is not None and any(key.startswith('WATCHDOG_') for key in changed):
+            self.watchdog.configure(settings)
+
+        if QUOTE_SETTINGS.intersection(changed):
+            logger.info("Quoting settings changed, requoting.")
+            position = self.sanity_check()
+            self.place_orders(position)
 
     def check_connection(self):
-        """Ensure the WS connections are still open."""
-        return True  # it's not a real websocket
+        """True while the loop is ticking and market data is fresh (or, without a watchdog, just the latter)."""
+        if self.watchdog is not None:
+            return self.watchdog.healthy()
+        return self.exchange.is_open()
+
+    def on_stall(self, reason):
+        """Called from the watchdog thread when the loop or market data has stalled: our quotes are stale, so pull
+           them over a connection the stuck loop isn't using, then restart if WATCHDOG_RESTART is set."""
+        if self.exiting:
+            return
+        logger.error("Bot stalled (%s). Cancelling all orders." % reason)
+        self.exchange.cancel_all_orders_fast(settings.SHUTDOWN_TIMEOUT, independent=True)
+        if settings.WATCHDOG_RESTART:
+            self.restart()
+
+    def exit(self, *args):
+        # We get here from atexit, the SIGTERM handler and sanity_check - often more than one of them.
+        # Only the first call does the work. No lock: signal handlers run on the main thread and could
+        # re-enter while it is held.
+        if self.exiting:
+            return
+        self.exiting = True
+        if self.watchdog is not None:
+            self.watchdog.stop()
 
-    def exit(self):
         logger.info("Shutting down. All open orders will be cancelled.")
         try:
-            self.exchange.cancel_all_orders()
+            self.exchange.cancel_all_orders_fast(settings.SHUTDOWN_TIMEOUT)
             self.exchange.fxadk.exit()
         except errors.AuthenticationError as e:
             logger.info("Was not authenticated; could not cancel orders.")
@@ -487,15 +762,32 @@ class OrderManager:
 
     def run_loop(self):
         while True:
+            if self.watchdog is not None:
+                self.watchdog.beat()
             sys.stdout.write("-----\n")
             sys.stdout.flush()
 
             self.check_file_change()
-            sleep(settings.LOOP_INTERVAL)
+            self.clock.sleep(settings.LOOP_INTERVAL)
 
-            position = self.sanity_check()  # Ensures health of mm - several cut-out points here
-            self.print_status(position)  # Print skew, delta, etc
-            self.place_orders(position)  # Creates desired orders and converges to existing orders
+            budget = deadline.TickBudget.from_settings(self.clock)
+            try:
+                with deadline.stage(budget, 'fetch'):
+                    position = self.sanity_check()  # Ensures health of mm - several cut-out points here
+                self.last_fetch = self.clock.time()
+                self.print_status(position)  # Print skew, delta, etc
+                self.place_orders(position, budget)  # Creates desired orders and converges to existing orders
+            except errors.DeadlineExceeded as e:
+                self.on_deadline_exceeded(e)
+
+    def on_deadline_exceeded(self, e):
+        """A tick ran out of time and was abandoned. Our resting orders were quoted from the last good data;
+           leave them, unless DEADLINE_FALLBACK says to pull or that data is older than MAX_QUOTE_DATA_AGE."""
+        age = self.clock.time() - self.last_fetch if self.last_fetch else None
+        logger.warning("Tick abandoned: %s" % e)
+        if settings.DEADLINE_FALLBACK == 'pull' or age is None or age > settings.MAX_QUOTE_DATA_AGE:
+            logger.warning("Pulling quotes (market data is %s old)." % ("%.1fs" % age if age is not None else "not"))
+            self.exchange.cancel_all_orders()
 
     def restart(self):
         logger.info("Restarting the market maker...")
@@ -507,7 +799,7 @@ class OrderManager:
 
 
 def run():
-    logger.info('FxADK Market Maker Version: %s\n' % constants.VERSION)
+    logger.info('FxADK Market Maker Version: %s\n' % constants.get_version())
 
     om = OrderManager()
     # Try/except just keeps ctrl-c from printing an ugly stacktrace
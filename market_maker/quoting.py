@@ -0,0 +1,80 @@
+"""Inventory- and volatility-aware quoting, after Avellaneda & Stoikov (2008).
+
+Prices are computed in relative (return) terms so the parameters don't depend on the price level:
+
+    q            = inventory, normalised to [-1, 1] by the position limits
+    reservation  = mid * (1 - q * gamma * sigma^2 * T)
+    half spread  = gamma * sigma^2 * T / 2 + ln(1 + gamma / kappa) / gamma
+
+where sigma is the per-trade return volatility from TradeStats and T the horizon in trades. Level i sits a
+further (1 + interval) ** i out from the first quote. Sizes are skewed linearly with inventory: when long,
+bids shrink and asks grow (and the other way round), so the position limits act gradually instead of as an
+on/off switch.
+
+Select it with STRATEGY = 'avellaneda_stoikov'.
+"""
+import logging
+from math import log
+
+from market_maker.strategy import Strategy, make_order
+
+logger = logging.getLogger('root')
+
+
+def normalised_inventory(position, min_position, max_position):
+    """Map a position onto [-1, 1]: 0 in the middle of the limits, +/-1 at them."""
+    centre = (max_position + min_position) / 2.0
+    half_range = (max_position - min_position) / 2.0
+    if half_range <= 0:
+        return 0.0
+    return max(-1.0, min(1.0, (position - centre) / half_range))
+
+
+def avellaneda_stoikov_ladder(mid, q, sigma, sizes, interval, gamma, kappa, horizon, min_spread=0.0):
+    """Quote a whole ladder at once.
+
+    `sizes` are the unskewed sizes for levels 1..n. Returns (bids, asks), each a list of (price, size) from
+    level 1 outwards. Prices are unrounded.
+    """
+    variance_term = gamma * sigma * sigma * horizon
+    reservation = mid * (1 - q * variance_term)
+    half_spread = max(variance_term / 2 + log(1 + gamma / kappa) / gamma, min_spread / 2)
+
+    bid_scale = max(0.0, min(2.0, 1 - q))
+    ask_scale = max(0.0, min(2.0, 1 + q))
+
+    bid_start = reservation * (1 - half_spread)
+    ask_start = reservation * (1 + half_spread)
+    bids = [(bid_start * (1 - interval) ** i, size * bid_scale) for i, size in enumerate(sizes)]
+    asks = [(ask_start * (1 + interval) ** i, size * ask_scale) for i, size in enumerate(sizes)]
+    return bids, asks
+
+
+class AvellanedaStoikovStrategy(Strategy):
+    """Quotes with avellaneda_stoikov_ladder instead of the fixed geometric ladder."""
+
+    def place_orders(self, context):
+        settings = self.settings
+        tick_size = context.instrument['tickSize']
+        sizes = [settings.ORDER_START_SIZE + i * settings.ORDER_STEP_SIZE for i in range(settings.ORDER_PAIRS)]
+        q = normalised_inventory(context.position['currentQty'], settings.MIN_POSITION, settings.MAX_POSITION)
+
+        bids, asks = avellaneda_stoikov_ladder(
+            context.start_position_mid, q, context.stats['volatility'], sizes, context.interval,
+            settings.AS_GAMMA, settings.AS_KAPPA, settings.AS_HORIZON, settings.MIN_SPREAD)
+        if not bids:
+            return [], []  # ORDER_PAIRS = 0
+        logger.info("Inventory %.2f: first bid %f, first ask %f" % (q, bids[0][0], asks[0][0]))
+
+        # Never quote through the other side of the book. Clamp to the real touch: the start positions may sit
+        # outside it after the MIN_SPREAD back-off.
+        best_ask = context.ticker['sell']
+        best_bid = context.ticker['buy']
+
+        # Outside in, like LadderStrategy, so converge_orders amends the fewest orders.
+        buy_orders = [make_order(context, 'buy', size, min(price, best_ask - tick_size))
+                      for price, size in reversed(bids) if size > 0]
+        sell_orders = [make_order(context, 'sell', size, max(price, best_bid + tick_size))
+                       for price, size in reversed(asks) if size > 0]
+
+        return buy_orders, sell_orders
@@ -0,0 +1,108 @@
+"""Pre-trade risk checks. Every order goes through RiskEngine.check() before it is sent."""
+import logging
+from collections import deque
+
+from market_maker.utils.clock import get_clock
+from market_maker.utils.errors import RiskCheckError
+
+logger = logging.getLogger('root')
+
+
+class RiskEngine(object):
+
+    """Constant-time pre-trade checks against limits on our own open orders.
+
+    State (open notional per side, open order count, recent submissions) is updated as orders are created and
+    removed, so check() never has to look at the order list. Any limit set to None is not checked.
+
+    The kill switch blocks every new order until reset. It is thrown by hand (kill()) or automatically when
+    more than `max_orders_per_minute` orders are submitted - the signature of a runaway ladder.
+    """
+
+    def __init__(self, max_order_size=None, max_notional_per_side=None, price_band=None, max_open_orders=None,
+                 max_orders_per_minute=None, clock=None):
+        self.max_order_size = max_order_size
+        self.max_notional_per_side = max_notional_per_side
+        self.price_band = price_band
+        self.max_open_orders = max_open_orders
+        self.max_orders_per_minute = max_orders_per_minute
+        self.clock = clock or get_clock()
+
+        self.mid = None
+        self.killed = None  # reason, once the kill switch is thrown
+        self.open_orders = {}  # orderid -> (side, notional)
+        self.notional = {'buy': 0.0, 'sell': 0.0}
+        self.submitted = deque()
+
+    @classmethod
+    def from_settings(cls, settings, clock=None):
+        engine = cls(clock=clock)
+        engine.configure(settings)
+        return engine
+
+    def configure(self, settings):
+        """(Re)load the limits from settings, keeping the current state."""
+        self.max_order_size = settings.RISK_MAX_ORDER_SIZE
+        self.max_notional_per_side = settings.RISK_MAX_NOTIONAL_PER_SIDE
+        self.price_band = settings.RISK_PRICE_BAND
+        self.max_open_orders = settings.RISK_MAX_OPEN_ORDERS
+        self.max_orders_per_minute = settings.RISK_MAX_ORDERS_PER_MINUTE
+
+    def update_mid(self, mid):
+        self.mid = mid
+
+    def kill(self, reason):
+        if self.killed is None:
+            logger.error("Risk kill switch thrown: %s. No new orders will be sent." % reason)
+        self.killed = reason
+
+    def reset_kill(self):
+        self.killed = None
+
+    def check(self, order):
+        """Raise RiskCheckError if `order` may not be sent."""
+        if self.killed is not None:
+            raise RiskCheckError("kill switch is on (%s)" % self.killed)
+
+        amount = float(order['amount'])
+        price = float(order['price'])
+        side = order['type']
+
+        if self.max_order_size is not None and amount > self.max_order_size:
+            raise RiskCheckError("size %f is over the %f limit" % (amount, self.max_order_size))
+
+        if self.price_band is not None and self.mid:
+            if abs(price / self.mid - 1) > self.price_band:
+                raise RiskCheckError("price %f is more than %.2f%% from mid %f" %
+                                     (price, self.price_band * 100, self.mid))
+
+        if self.max_open_orders is not None and len(self.open_orders) >= self.max_open_orders:
+            raise RiskCheckError("already %d open orders" % len(self.open_orders))
+
+        if self.max_notional_per_side is not None and \
+                self.notional[side] + amount * price > self.max_notional_per_side:
+            raise RiskCheckError("%s notional would be %f, over the %f limit" %
+                                 (side, self.notional[side] + amount * price, self.max_notional_per_side))
+
+        if self.max_orders_per_minute is not None:
+            now = self.clock.time()
+            while self.submitted and self.submitted[0] <= now - 60:
+                self.submitted.popleft()
+            if len(self.submitted) >= self.max_orders_per_minute:
+                self.kill("more than %d orders in a minute" % self.max_orders_per_minute)
+                raise RiskCheckError("kill switch is on (%s)" % self.killed)
+            self.submitted.append(now)
+
+    def on_created(self, orderid, order):
+        """An order is open. Registering the same order again replaces its entry rather than adding to it."""
+        self.on_removed(orderid)
+        notional = float(order['amount']) * float(order['price'])
+        self.open_orders[str(orderid)] = (order['type'], notional)
+        self.notional[order['type']] += notional
+
+    def on_removed(self, orderid):
+        """An order was cancelled or filled."""
+        entry = self.open_orders.pop(str(orderid), None)
+        if entry is not None:
+            side, notional = entry
+            self.notional[side] -= notional
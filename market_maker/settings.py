@@ -1,43 +1,65 @@
 from __future__ import absolute_import
 
-import importlib
 import os
+import runpy
 import sys
 
 from market_maker.utils.dotdict import dotdict
 import market_maker._settings_base as baseSettings
 
 
-def import_path(fullpath):
+def load_path(fullpath):
     """
-    Import a file with full path specification. Allows one to
-    import from anywhere, something __import__ does not do.
+    Run a settings file (given without its .py) in a fresh namespace and return that namespace.
+    Unlike reloading a module, a setting deleted from the file is gone from the result.
     """
-    path, filename = os.path.split(fullpath)
-    filename, ext = os.path.splitext(filename)
-    sys.path.insert(0, path)
-    module = importlib.import_module(filename, path)
-    importlib.reload(module)  # Might be out of date
-    del sys.path[0]
-    return module
-
-
-userSettings = import_path(os.path.join('.', 'settings'))
-symbolSettings = None
-symbol = sys.argv[1] if len(sys.argv) > 1 else None
-if symbol:
-    print("Importing symbol settings for %s..." % symbol)
-    try:
-        symbolSettings = import_path(os.path.join('..', 'settings-%s' % symbol))
-    except Exception as e:
-        print("Unable to find settings-%s.py." % symbol)
-
-# Assemble settings.
-settings = {}
-settings.update(vars(baseSettings))
-settings.update(vars(userSettings))
-if symbolSettings:
-    settings.update(vars(symbolSettings))
+    return runpy.run_path(fullpath + '.py')
+
+
+# Files the current settings were assembled from, so they can be watched for changes.
+loaded_files = []
+
+
+def load_settings():
+    """Merge the base settings, the user's settings.py and settings-<symbol>.py (in that order of precedence)."""
+    userSettings = load_path(os.path.join('.', 'settings'))
+    symbolSettings = None
+    symbol = sys.argv[1] if len(sys.argv) > 1 else None
+    if symbol:
+        print("Importing symbol settings for %s..." % symbol)
+        try:
+            symbolSettings = load_path(os.path.join('..', 'settings-%s' % symbol))
+        except (IOError, OSError):
+            print("Unable to find settings-%s.py." % symbol)
+
+    # Assemble settings.
+    merged = {}
+    merged.update(vars(baseSettings))
+    merged.update(userSettings)
+    if symbolSettings:
+        merged.update(symbolSettings)
+
+    loaded_files[:] = [os.path.abspath(s['__file__']) for s in (userSettings, symbolSettings) if s is not None]
+    return merged
+
+
+def reload_settings():
+    """Re-read the settings files and update `settings` in place, so every module holding a reference sees
+    the new values. Returns {name: (old, new)} for each setting that changed.
+    If a file fails to load, the exception is raised and `settings` is left as it was."""
+    merged = load_settings()
+    changed = {}
+    for key in set(settings) | set(merged):
+        if key.isupper() and settings.get(key) != merged.get(key):
+            changed[key] = (settings.get(key), merged.get(key))
+
+    # Other threads read settings all the time: add and overwrite first, then drop what is gone, so no key that
+    # exists before and after is ever missing in between.
+    settings.update(merged)
+    for key in [key for key in settings if key not in merged]:
+        del settings[key]
+    return changed
+
 
 # Main export
-settings = dotdict(settings)
+settings = dotdict(load_settings())
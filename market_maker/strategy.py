@@ -0,0 +1,137 @@
+"""Strategy plugin API.
+
+Each tick, OrderManager fetches everything a strategy may need exactly once and hands it over as an immutable
+TickContext. A strategy turns that into the orders it wants in the book; OrderManager converges the book to
+them. Strategies never see the exchange, so they can't add API round-trips to the loop.
+
+To write one, subclass Strategy, implement place_orders(context) and set STRATEGY = 'your.module:YourStrategy'
+(in settings.py, or settings-<symbol>.py to run different strategies on different symbols).
+"""
+import importlib
+import random
+from collections import namedtuple
+from types import MappingProxyType
+
+from market_maker.utils import math
+
+# Built-in strategies, by the name used in settings.STRATEGY.
+STRATEGIES = {
+    'ladder': 'market_maker.strategy:LadderStrategy',
+    'avellaneda_stoikov': 'market_maker.quoting:AvellanedaStoikovStrategy',
+}
+
+TickContext = namedtuple('TickContext', [
+    'symbol',
+    'instrument',      # lastPrice, bidPrice, askPrice, midPrice, tickSize
+    'ticker',          # last, buy, sell, mid, plus the TradeStats snapshot
+    'book',            # {'bids': ((price, size), ...), 'asks': ...}, best first
+    'position',        # currentQty, avgCostPrice, avgEntryPrice
+    'open_orders',     # our open orders
+    'stats',           # TradeStats snapshot: vwap, volatility, imbalance, ...
+    'start_position_buy',
+    'start_position_sell',
+    'start_position_mid',
+    'interval',        # level spacing for this tick, see OrderManager.get_interval
+])
+
+
+def freeze(value):
+    """Read-only view of nested dicts/lists, so a strategy can't modify shared state."""
+    if isinstance(value, dict):
+        # value[k] rather than items(), so lazily-typed records hand over converted values
+        return MappingProxyType({k: freeze(value[k]) for k in value})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def make_order(context, side, quantity, price):
+    """Build an order in the format converge_orders expects, with the price rounded to the tick size."""
+    return {
+        'amount': quantity,
+        'price': math.toNearest(price, context.instrument['tickSize']),
+        'symbol': context.symbol,
+        'order': 'limit',
+        'type': side,
+    }
+
+
+def load_strategy(name):
+    """Return the strategy class for a built-in name or a 'module:Class' path."""
+    path = STRATEGIES.get(name, name)
+    module_name, _, class_name = path.partition(':')
+    if not class_name:
+        raise ValueError("Unknown strategy %r: use a built-in name (%s) or 'module:Class'" %
+                         (name, ", ".join(sorted(STRATEGIES))))
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class Strategy(object):
+    """Base class for strategies. One instance quotes one symbol."""
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    def place_orders(self, context):
+        """Return (buy_orders, sell_orders) for this tick, each ordered from the outside in."""
+        raise NotImplementedError
+
+
+def ladder_price(index, start_position_buy, start_position_sell, interval, tick_size, maintain_spreads):
+    """Given an index (1, -1, 2, -2, etc.) return the price for that side of the book.
+       Negative is a buy, positive is a sell."""
+    # Maintain existing spreads for max profit
+    if maintain_spreads:
+        start_position = start_position_buy if index < 0 else start_position_sell
+        # First positions (index 1, -1) should start right at start_position, others should branch from there
+        index = index + 1 if index < 0 else index - 1
+    else:
+        # Offset mode: ticker comes from a reference exchange and we define an offset.
+        start_position = start_position_buy if index < 0 else start_position_sell
+
+        # If we're attempting to sell, but our sell price is actually lower than the buy,
+        # move over to the sell side.
+        if index > 0 and start_position < start_position_buy:
+            start_position = start_position_sell
+        # Same for buys.
+        if index < 0 and start_position > start_position_sell:
+            start_position = start_position_buy
+
+    return math.toNearest(start_position * (1 + interval) ** index, tick_size)
+
+
+class LadderStrategy(Strategy):
+    """The classic ladder: ORDER_PAIRS levels INTERVAL apart, starting at the spread, one side dropped when its
+       position limit is reached."""
+
+    def place_orders(self, context):
+        settings = self.settings
+        buy_orders = []
+        sell_orders = []
+        # Create orders from the outside in. This is intentional - let's say the inner order gets taken;
+        # then we match orders from the outside in, ensuring the fewest number of orders are amended and only
+        # a new order is created in the inside. If we did it inside-out, all orders would be amended
+        # down and a new order would be created at the outside.
+
+        delta = context.position['currentQty']
+        long_position_exceeded = settings.CHECK_POSITION_LIMITS and delta >= settings.MAX_POSITION
+        short_position_exceeded = settings.CHECK_POSITION_LIMITS and delta <= settings.MIN_POSITION
+
+        for i in reversed(range(1, settings.ORDER_PAIRS + 1)):
+            if not long_position_exceeded:
+                buy_orders.append(self.prepare_order(context, -i))
+            if not short_position_exceeded:
+                sell_orders.append(self.prepare_order(context, i))
+
+        return buy_orders, sell_orders
+
+    def prepare_order(self, context, index):
+        settings = self.settings
+        if settings.RANDOM_ORDER_SIZE is True:
+            quantity = random.randint(settings.MIN_ORDER_SIZE, settings.MAX_ORDER_SIZE)
+        else:
+            quantity = settings.ORDER_START_SIZE + ((abs(index) - 1) * settings.ORDER_STEP_SIZE)
+
+        price = ladder_price(index, context.start_position_buy, context.start_position_sell, context.interval,
+                             context.instrument['tickSize'], settings.MAINTAIN_SPREADS)
+        return make_order(context, "buy" if index < 0 else "sell", quantity, price)
@@ -0,0 +1,282 @@
+"""Offline fill-quality analysis: markouts, fill rates per ladder level and adverse selection per quoting config.
+
+    marketmaker-tca marketmaker-record.jsonl [more.jsonl ...] [--symbol ADK/BTC] [--horizons 1,5,30,60,300] [--json]
+
+Input is what the bot writes to RECORD_FILE. Each symbol in it is analysed on its own, or only --symbol. Fills can
+also be taken from saved getTradeHistory responses with --trade-history (their level is unknown), but markouts
+always need the recorded market snapshots.
+
+Fills are timed by the trade's own date, not by when the bot noticed them. Snapshots are only written once a loop,
+so horizons shorter than their typical spacing can't be resolved and are left out.
+
+A markout is how far the mid moved in our favour after a fill: side * (mid at fill time + horizon - fill price) /
+fill price, in basis points, where side is +1 for a buy and -1 for a sell. Consistently negative markouts at
+short horizons mean we are being picked off (adverse selection).
+
+The analysis is vectorised with NumPy (`pip install bitmex-market-maker[analytics]`), which is only imported
+when the command runs.
+"""
+import argparse
+import calendar
+import json
+import sys
+import time
+
+DEFAULT_HORIZONS = (1, 5, 30, 60, 300)
+NO_LEVEL = -1
+
+
+def load_records(paths):
+    """Split recorder files by symbol: {symbol: (snapshots, placements, fills)}, each a list of dicts."""
+    by_symbol = {}
+    kinds = {'snapshot': 0, 'placement': 1, 'fill': 2}
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('kind') in kinds:
+                    records = by_symbol.setdefault(record.get('symbol'), ([], [], []))
+                    records[kinds[record['kind']]].append(record)
+    return by_symbol
+
+
+def parse_date(value):
+    """Trade 'date' as seconds since the epoch: a number, or 'YYYY-mm-dd HH:MM:SS' in UTC."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float(calendar.timegm(time.strptime(value, '%Y-%m-%d %H:%M:%S')))
+
+
+def load_trade_history(paths):
+    """Fills from saved getTradeHistory responses (or bare lists of trades)."""
+    fills = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        trades = data.get('message', []) if isinstance(data, dict) else data
+        for trade in trades if isinstance(trades, list) else []:
+            fills.append({'t': parse_date(trade['date']), 'orderid': trade.get('orderid'), 'side': trade['type'],
+                          'price': float(trade['price']), 'amount': float(trade['amount']),
+                          'fees': float(trade.get('fees') or 0), 'level': None})
+    return fills
+
+
+def fill_time(fill):
+    """When a recorded fill happened: its trade date if it has one, else when the bot saw it."""
+    if fill.get('date') is not None:
+        try:
+            return parse_date(fill['date'])
+        except ValueError:
+            pass
+    return fill['t']
+
+
+def snapshot_spacing(np, snapshots):
+    """Median seconds between snapshots, or None with fewer than two."""
+    times = np.sort(np.array([s['t'] for s in snapshots], dtype=float))
+    return float(np.median(np.diff(times))) if len(times) > 1 else None
+
+
+def to_arrays(np, snapshots, placements, fills):
+    """Column arrays, snapshots sorted by time."""
+    snapshots = sorted(snapshots, key=lambda s: s['t'])
+    snap = {
+        't': np.array([s['t'] for s in snapshots], dtype=float),
+        'mid': np.array([s['mid'] for s in snapshots], dtype=float),
+        'interval': np.array([s.get('interval') or 0 for s in snapshots], dtype=float),
+        'pairs': np.array([s.get('pairs') or 0 for s in snapshots], dtype=int),
+    }
+    placed = {
+        'level': np.array([level_of(p) for p in placements], dtype=int),
+        'amount': np.array([p['amount'] for p in placements], dtype=float),
+    }
+    # A fill's quoting config is the one in force when its order was placed, if we saw that.
+    placed_at = dict((str(p['orderid']), p['t']) for p in placements)
+    fill = {
+        't': np.array([fill_time(f) for f in fills], dtype=float),
+        'placed': np.array([placed_at.get(str(f.get('orderid')), fill_time(f)) for f in fills], dtype=float),
+        'side': np.array([1 if str(f['side']).lower() == 'buy' else -1 for f in fills], dtype=int),
+        'price': np.array([f['price'] for f in fills], dtype=float),
+        'amount': np.array([f['amount'] for f in fills], dtype=float),
+        'fees': np.array([f.get('fees') or 0 for f in fills], dtype=float),
+        'level': np.array([level_of(f) for f in fills], dtype=int),
+    }
+    return snap, placed, fill
+
+
+def level_of(record):
+    level = record.get('level')
+    return NO_LEVEL if level is None else int(level)
+
+
+def mid_at(np, snap, times):
+    """Mid of the last snapshot at or before each of `times`; NaN before the first or after the last snapshot."""
+    index = np.searchsorted(snap['t'], times, side='right') - 1
+    valid = (index >= 0) & (times <= snap['t'][-1] if len(snap['t']) else False)
+    mids = np.full(len(times), np.nan)
+    mids[valid] = snap['mid'][index[valid]]
+    return mids
+
+
+def markouts(np, snap, fill, horizons):
+    """{horizon: per-fill markout in bps (NaN where the horizon runs past the recording)}."""
+    result = {}
+    for horizon in horizons:
+        future = mid_at(np, snap, fill['t'] + horizon)
+        result[horizon] = fill['side'] * (future - fill['price']) / fill['price'] * 1e4
+    return result
+
+
+def weighted_mean(np, values, weights, groups=None, n_groups=None):
+    """Notional-weighted mean of `values`, ignoring NaNs; per group if `groups` is given."""
+    ok = ~np.isnan(values)
+    if groups is None:
+        total = weights[ok].sum()
+        return float((values[ok] * weights[ok]).sum() / total) if total else None
+    sums = np.bincount(groups[ok], weights=values[ok] * weights[ok], minlength=n_groups)
+    totals = np.bincount(groups[ok], weights=weights[ok], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / totals
+
+
+def analyse(np, snapshots, placements, fills, horizons=DEFAULT_HORIZONS):
+    snap, placed, fill = to_arrays(np, snapshots, placements, fills)
+    notional = fill['price'] * fill['amount']
+    marks = markouts(np, snap, fill, horizons)
+
+    report = {
+        'fills': int(len(fill['t'])),
+        'placements': int(len(placed['level'])),
+        'snapshots': int(len(snap['t'])),
+        'notional': float(notional.sum()),
+        'fees': float(fill['fees'].sum()),
+        'markoutBps': dict((h, weighted_mean(np, marks[h], notional)) for h in horizons),
+        'levels': [],
+        'configs': [],
+    }
+
+    # Per ladder level: placed vs filled amount, and markouts. Offset by one so NO_LEVEL gets bucket 0.
+    n_levels = int(max(placed['level'].max(initial=NO_LEVEL), fill['level'].max(initial=NO_LEVEL))) + 2
+    placed_amount = np.bincount(placed['level'] + 1, weights=placed['amount'], minlength=n_levels)
+    filled_amount = np.bincount(fill['level'] + 1, weights=fill['amount'], minlength=n_levels)
+    fill_counts = np.bincount(fill['level'] + 1, minlength=n_levels)
+    level_marks = dict((h, weighted_mean(np, marks[h], notional, fill['level'] + 1, n_levels)) for h in horizons)
+    for bucket in range(n_levels):
+        if not placed_amount[bucket] and not fill_counts[bucket]:
+            continue
+        report['levels'].append({
+            'level': bucket - 1 if bucket else None,
+            'placed': float(placed_amount[bucket]),
+            'filled': float(filled_amount[bucket]),
+            'fillRate': float(filled_amount[bucket] / placed_amount[bucket]) if placed_amount[bucket] else None,
+            'fills': int(fill_counts[bucket]),
+            'markoutBps': dict((h, nan_to_none(np, level_marks[h][bucket])) for h in horizons),
+        })
+
+    # Per quoting config (INTERVAL, ORDER_PAIRS) in force when the order was placed.
+    if len(snap['t']) and len(fill['t']):
+        config_index = np.clip(np.searchsorted(snap['t'], fill['placed'], side='right') - 1, 0, None)
+        configs = np.stack([snap['interval'][config_index], snap['pairs'][config_index]], axis=1)
+        unique, groups = np.unique(configs, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        config_marks = dict((h, weighted_mean(np, marks[h], notional, groups, len(unique))) for h in horizons)
+        counts = np.bincount(groups, minlength=len(unique))
+        for i, (interval, pairs) in enumerate(unique):
+            report['configs'].append({
+                'interval': float(interval),
+                'pairs': int(pairs),
+                'fills': int(counts[i]),
+                'markoutBps': dict((h, nan_to_none(np, config_marks[h][i])) for h in horizons),
+            })
+    return report
+
+
+def nan_to_none(np, value):
+    return None if np.isnan(value) else float(value)
+
+
+def format_bps(value):
+    return '%8.2f' % value if value is not None else '%8s' % '-'
+
+
+def print_report(report, horizons, out=sys.stdout):
+    header = ''.join('%8s' % ('%gs' % h) for h in horizons)
+    out.write('%d fills (notional %.8f, fees %.8f), %d placements, %d snapshots\n\n' %
+              (report['fills'], report['notional'], report['fees'], report['placements'], report['snapshots']))
+    out.write('Markout, bps (notional-weighted; positive is in our favour)\n%-24s%s\n' % ('', header))
+    out.write('%-24s%s\n\n' % ('all fills', ''.join(format_bps(report['markoutBps'][h]) for h in horizons)))
+
+    out.write('%-8s%12s%12s%9s%7s%s\n' % ('level', 'placed', 'filled', 'rate', 'fills', header))
+    for level in report['levels']:
+        out.write('%-8s%12.2f%12.2f%9s%7d%s\n' % (
+            level['level'] if level['level'] is not None else '?', level['placed'], level['filled'],
+            '%.1f%%' % (level['fillRate'] * 100) if level['fillRate'] is not None else '-', level['fills'],
+            ''.join(format_bps(level['markoutBps'][h]) for h in horizons)))
+
+    if report['configs']:
+        out.write('\n%-12s%7s%7s%s\n' % ('interval', 'pairs', 'fills', header))
+        for config in report['configs']:
+            out.write('%-12g%7d%7d%s\n' % (config['interval'], config['pairs'], config['fills'],
+                                          ''.join(format_bps(config['markoutBps'][h]) for h in horizons)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Markout and fill-quality analysis of recorded market making.')
+    parser.add_argument('records', nargs='+', help='RECORD_FILE(s) written by the bot')
+    parser.add_argument('--symbol', help='only analyse this symbol')
+    parser.add_argument('--trade-history', action='append', default=[],
+                        help='saved getTradeHistory response to take fills from instead (repeatable)')
+    parser.add_argument('--horizons', default=','.join(str(h) for h in DEFAULT_HORIZONS),
+                        help='markout horizons in seconds, comma separated')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        import numpy as np
+    except ImportError:
+        sys.exit('marketmaker-tca needs NumPy: pip install bitmex-market-maker[analytics]')
+
+    requested = [float(h) for h in args.horizons.split(',')]
+    by_symbol = load_records(args.records)
+    if args.symbol:
+        by_symbol = {args.symbol: by_symbol.get(args.symbol, ([], [], []))}
+    if args.trade_history:
+        if len(by_symbol) != 1:
+            sys.exit('The records hold %d symbols; say which the trade history is for with --symbol.' %
+                     len(by_symbol))
+        symbol, (snapshots, placements, _) = list(by_symbol.items())[0]
+        by_symbol[symbol] = (snapshots, placements, load_trade_history(args.trade_history))
+
+    reports = {}
+    for symbol in sorted(by_symbol, key=str):
+        snapshots, placements, fills = by_symbol[symbol]
+        if not snapshots:
+            sys.stderr.write('No market snapshots for %s; markouts need a RECORD_FILE.\n' % symbol)
+            continue
+        spacing = snapshot_spacing(np, snapshots)
+        horizons = [h for h in requested if spacing is None or h >= spacing]
+        if len(horizons) < len(requested):
+            sys.stderr.write('%s: snapshots are %.1fs apart; leaving out shorter horizons (%s).\n' %
+                             (symbol, spacing, ', '.join('%gs' % h for h in requested if h not in horizons)))
+        if not horizons:
+            continue
+        reports[symbol] = (analyse(np, snapshots, placements, fills, horizons), horizons)
+        reports[symbol][0]['snapshotSpacing'] = spacing
+
+    if not reports:
+        sys.exit('Nothing to analyse in %s.' % ', '.join(args.records))
+    if args.json:
+        json.dump(dict((str(symbol), report) for symbol, (report, _) in reports.items()), sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        for symbol in sorted(reports, key=str):
+            sys.stdout.write('== %s ==\n' % symbol)
+            print_report(reports[symbol][0], reports[symbol][1])
+            sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
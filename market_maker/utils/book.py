@@ -0,0 +1,54 @@
+"""Reference prices from the order book levels get_instrument already fetches.
+
+`bids` and `asks` are lists of (price, size), best level first.
+"""
+
+
+def level_weights(depth, decay):
+    """Weight of each level: 1 for the best, `decay` for the next, decay ** 2 after that..."""
+    return [decay ** i for i in range(depth)]
+
+
+def weighted_size(levels, weights):
+    return sum(weight * size for weight, (price, size) in zip(weights, levels))
+
+
+def microprice(bids, asks):
+    """Mid weighted by the opposite side's top-of-book size, so it leans towards the side likely to trade
+       through next."""
+    (bid, bid_size), (ask, ask_size) = bids[0], asks[0]
+    total = bid_size + ask_size
+    if total <= 0:
+        return (bid + ask) / 2
+    return (bid * ask_size + ask * bid_size) / total
+
+
+def book_imbalance(bids, asks, depth=5, decay=0.5):
+    """(bid size - ask size) / total over the top `depth` levels, each level weighted by `decay` ** level.
+       In [-1, 1]; positive means more size bid than offered."""
+    weights = level_weights(depth, decay)
+    bid_size = weighted_size(bids, weights)
+    ask_size = weighted_size(asks, weights)
+    total = bid_size + ask_size
+    return (bid_size - ask_size) / total if total > 0 else 0.0
+
+
+def reference_price(method, instrument, depth=5, decay=0.5):
+    """Fair price to quote around.
+
+    'mid'        - plain (bid + ask) / 2
+    'microprice' - top-of-book microprice
+    'imbalance'  - mid shifted by multi-level book imbalance, up to half the spread either way
+    Falls back to mid if either side of the book is empty.
+    """
+    mid = instrument['midPrice']
+    bids = instrument.get('bids')
+    asks = instrument.get('asks')
+    if method == 'mid' or not bids or not asks:
+        return mid
+    if method == 'microprice':
+        return microprice(bids, asks)
+    if method == 'imbalance':
+        half_spread = (asks[0][0] - bids[0][0]) / 2
+        return mid + book_imbalance(bids, asks, depth, decay) * half_spread
+    raise ValueError("Unknown REFERENCE_PRICE %r" % method)
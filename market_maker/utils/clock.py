@@ -0,0 +1,117 @@
+"""Clocks. Everything that reads the time or sleeps does it through one of these, so a simulation can run
+faster than real time.
+
+    RealClock          - the wall clock
+    SimulatedClock     - time only moves when something sleeps; sleeping returns at once. Deterministic.
+    AcceleratedClock   - the wall clock, sped up `speed` times
+
+Components take a `clock` argument and fall back to the process-wide clock from get_clock(), which CLOCK and
+CLOCK_SPEED choose.
+"""
+import threading
+import time
+from datetime import datetime
+
+from market_maker.settings import settings
+
+
+class RealClock(object):
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def now(self):
+        """The current time as a datetime, like datetime.now()."""
+        return datetime.fromtimestamp(self.time())
+
+    def wait(self, condition, seconds):
+        """condition.wait(seconds) in this clock's time: returns early if notified. Call with the condition held."""
+        if seconds > 0:
+            condition.wait(seconds)
+
+
+class SimulatedClock(RealClock):
+
+    """Time that only advances when something sleeps or advance() is called.
+
+    sleep() moves the clock forward and returns immediately, so a loop that sleeps LOOP_INTERVAL between
+    iterations runs as fast as the code allows. Meant for single-threaded simulations and tests: threads
+    sleeping at the same time each move the clock by their own amount.
+    """
+
+    def __init__(self, start=None):
+        self.current = time.time() if start is None else start
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, condition, seconds):
+        """Let other threads run, then move the clock to the end of the wait. Threads waiting for the same moment
+           move the clock there once, not once each."""
+        until = self.time() + seconds
+        condition.wait(0)
+        self.advance_to(until)
+
+    def advance(self, seconds):
+        with self.lock:
+            self.current += max(0, seconds)
+
+    def advance_to(self, moment):
+        with self.lock:
+            self.current = max(self.current, moment)
+
+
+class AcceleratedClock(RealClock):
+
+    """The wall clock running `speed` times faster, starting from the real time now. sleep(n) takes n / speed
+       real seconds."""
+
+    def __init__(self, speed):
+        self.speed = float(speed)
+        self.started = time.time()
+
+    def time(self):
+        return self.started + (time.time() - self.started) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def wait(self, condition, seconds):
+        if seconds > 0:
+            condition.wait(seconds / self.speed)
+
+
+_clock = None
+
+
+def from_settings():
+    if settings.CLOCK == 'simulated':
+        return SimulatedClock()
+    if settings.CLOCK == 'accelerated':
+        return AcceleratedClock(settings.CLOCK_SPEED)
+    if settings.CLOCK in (None, 'real'):
+        return RealClock()
+    raise ValueError("Unknown CLOCK %r" % settings.CLOCK)
+
+
+def get_clock():
+    """The process-wide clock, created from settings on first use."""
+    global _clock
+    if _clock is None:
+        _clock = from_settings()
+    return _clock
+
+
+def set_clock(clock):
+    """Replace the process-wide clock, e.g. with a SimulatedClock in a test. Components already built keep theirs."""
+    global _clock
+    _clock = clock
@@ -1,9 +1,25 @@
-import subprocess
 # Constants
 XBt_TO_XBT = 100000000
 VERSION = 'v1.1'
-try:
-    VERSION = str(subprocess.check_output(["git", "describe", "--tags"], stderr=subprocess.DEVNULL).rstrip())
-except Exception as e:
-    # git not available, ignore
-    pass
+
+_version = None
+
+
+def get_version():
+    """Return the bot version. Uses the version baked in at build time (see setup.py) if there is one, otherwise
+       asks git. Resolved on first call rather than at import so startup doesn't wait on a subprocess."""
+    global _version
+    if _version is None:
+        try:
+            from market_maker.utils._version import VERSION as built_version
+            _version = built_version
+        except ImportError:
+            _version = VERSION
+            try:
+                import subprocess
+                _version = subprocess.check_output(["git", "describe", "--tags"],
+                                                   stderr=subprocess.DEVNULL).decode('utf8').strip()
+            except Exception as e:
+                # git not available, ignore
+                pass
+    return _version
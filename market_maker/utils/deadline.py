@@ -0,0 +1,89 @@
+"""Per-tick deadline budget.
+
+Each tick gets TICK_BUDGET seconds, split into fetch, compute and submit stages. The stage being run is set
+thread-locally; FxAdkImpl reads it to size each request's timeout and to stop retrying once the stage is out of
+time, raising DeadlineExceeded instead of blocking the loop.
+"""
+import threading
+from contextlib import contextmanager
+
+from market_maker.settings import settings
+from market_maker.utils.clock import get_clock
+from market_maker.utils.errors import DeadlineExceeded
+
+_local = threading.local()
+
+
+class Deadline(object):
+    """The point in time a stage must be finished by."""
+
+    def __init__(self, expires, name, clock=None):
+        self.expires = expires
+        self.name = name
+        self.clock = clock or get_clock()
+
+    def remaining(self):
+        return self.expires - self.clock.time()
+
+    def check(self, what='work'):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded('%s stage out of time before %s' % (self.name, what))
+
+
+class TickBudget(object):
+
+    """The deadlines of one tick. Stages end at cumulative shares of the budget, so time one stage doesn't use is
+       left for the next."""
+
+    def __init__(self, budget, split, clock=None):
+        self.clock = clock or get_clock()
+        self.started = self.clock.time()
+        self.ends = {}
+        share = 0.0
+        for name, fraction in split.items():
+            share += fraction
+            self.ends[name] = self.started + budget * share / sum(split.values())
+
+    @classmethod
+    def from_settings(cls, clock=None):
+        """A budget for a new tick, or None if TICK_BUDGET is unset."""
+        if not settings.TICK_BUDGET:
+            return None
+        return cls(settings.TICK_BUDGET, settings.TICK_BUDGET_SPLIT, clock)
+
+
+def current():
+    """The deadline of the stage running on this thread, or None."""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def stage(budget, name):
+    """Run the block as stage `name` of `budget`. A None budget runs it unbounded."""
+    previous = current()
+    _local.deadline = Deadline(budget.ends[name], name, budget.clock) if budget is not None else None
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+@contextmanager
+def grace(seconds, clock=None):
+    """Run the block under a fresh `seconds` deadline of its own, however much the current stage has left: for
+       clean-up that must still happen after the stage ran out."""
+    clock = clock or get_clock()
+    previous = current()
+    _local.deadline = Deadline(clock.time() + seconds, 'grace', clock)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def request_timeout(deadline):
+    """Timeout for one request: TIMEOUT, cut down to what is left of `deadline`."""
+    if deadline is None:
+        return settings.TIMEOUT
+    deadline.check('request')
+    return min(settings.TIMEOUT, deadline.remaining())
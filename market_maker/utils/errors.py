@@ -6,3 +6,13 @@ class MarketClosedError(Exception):
 
 class MarketEmptyError(Exception):
     pass
+
+class RiskCheckError(Exception):
+    pass
+
+class DeadlineExceeded(Exception):
+    pass
+
+class OrderStatusUnknown(Exception):
+    """An order write was sent but its response was lost, so it may or may not have happened."""
+    pass
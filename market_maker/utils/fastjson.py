@@ -0,0 +1,49 @@
+"""Fast JSON decoding and lazily-typed records for API responses."""
+try:
+    import orjson
+    loads = orjson.loads
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+        BACKEND = 'ujson'
+    except ImportError:
+        import json
+        loads = json.loads
+        BACKEND = 'json'
+
+
+def lower(value):
+    return value.lower()
+
+
+class LazyRecord(dict):
+
+    """A decoded API record whose string fields are converted (e.g. '0.015' -> 0.015) when first read.
+
+    Records that are never looked at - most of a long trade history - are never converted. Conversion happens
+    in __getitem__ / get(); iterating items() or values() gives the raw values, so use record[key].
+    Subclasses list their fields in `converters`; each converter must be safe to apply twice.
+    """
+
+    converters = {}
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        convert = self.converters.get(key)
+        if convert is not None and isinstance(value, str):
+            value = convert(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+class OrderRecord(LazyRecord):
+    converters = {'amount': float, 'price': float, 'total': float, 'type': lower}
+
+
+class TradeRecord(LazyRecord):
+    converters = {'amount': float, 'price': float, 'total': float, 'fees': float, 'type': lower}
@@ -0,0 +1,77 @@
+"""Balance-aware order sizing: only send orders we can fund."""
+import math
+import threading
+from collections import defaultdict
+
+# Funds each symbol's orders hold or were allotted on its last tick, so allocators for different symbols in one
+# process don't promise the same balance twice. The bot runs one symbol per process, and processes can't see each
+# other's claims: bots for several symbols on one account can still over-commit a shared asset.
+_claims = {}
+_claims_lock = threading.Lock()
+
+
+def balances_from_funds(funds):
+    """{asset: balance} from a getAccountbalance list."""
+    return dict((fund['symbol'], float(fund['balance'])) for fund in funds)
+
+
+def order_funds(symbol, order, fee_reserve=0.0):
+    """(asset, amount) an order on `symbol` locks: the quote total plus fees for a buy, the base amount for a sell."""
+    base, quote = symbol.split('/')
+    if order['type'] == 'buy':
+        return quote, float(order['amount']) * float(order['price']) * (1 + fee_reserve)
+    return base, float(order['amount'])
+
+
+class FundsAllocator(object):
+
+    """Hands out one symbol's available balance per asset to the orders it wants to send.
+
+    Available is the balance less what our resting orders lock (lock() them first) and less what other symbols
+    in this process claimed. fund() grants an order in full, shrinks it to what is left, or refuses it if that
+    would be below `min_size`; call it innermost level first so the levels that matter most get funded.
+    """
+
+    def __init__(self, symbol, balances, fee_reserve=0.0, min_size=0.0):
+        self.symbol = symbol
+        self.fee_reserve = fee_reserve
+        self.min_size = min_size
+        self.available = defaultdict(float, balances)
+        self.claimed = defaultdict(float)
+        self.shrunk = 0
+        self.refused = 0
+        with _claims_lock:
+            for other, claims in _claims.items():
+                if other != symbol:
+                    for asset, amount in claims.items():
+                        self.available[asset] -= amount
+
+    def lock(self, order):
+        asset, amount = order_funds(self.symbol, order, self.fee_reserve)
+        self.available[asset] -= amount
+        self.claimed[asset] += amount
+
+    def release(self, order):
+        asset, amount = order_funds(self.symbol, order, self.fee_reserve)
+        self.available[asset] += amount
+        self.claimed[asset] -= amount
+
+    def fund(self, order):
+        """`order`, possibly with a smaller amount, if it can be funded; otherwise None."""
+        asset, needed = order_funds(self.symbol, order, self.fee_reserve)
+        left = max(self.available[asset], 0.0)
+        if needed > left:
+            amount = left if order['type'] == 'sell' else left / (float(order['price']) * (1 + self.fee_reserve))
+            amount = math.floor(amount * 1e8) / 1e8
+            if amount <= 0 or amount < self.min_size:
+                self.refused += 1
+                return None
+            order = dict(order, amount=amount)
+            self.shrunk += 1
+        self.lock(order)
+        return order
+
+    def publish(self):
+        """Record what this symbol holds and was allotted, for other symbols' allocators."""
+        with _claims_lock:
+            _claims[self.symbol] = dict(self.claimed)
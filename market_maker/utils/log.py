@@ -1,14 +1,59 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 from market_maker.settings import settings
 
+# Fields a log call can attach with `extra=`, e.g. logger.info("Created order", extra={'orderid': order_id}).
+# They are emitted as their own keys by the JSON formatter.
+STRUCTURED_FIELDS = ('symbol', 'endpoint', 'latency', 'orderid')
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats each record as a single line of JSON."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 
 def setup_custom_logger(name, log_level=settings.LOG_LEVEL):
-    formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
+    if settings.LOG_FORMAT == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(fmt='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
 
-    handler = logging.StreamHandler()
-    handler.setFormatter(formatter)
+    handlers = [logging.StreamHandler()]
+    if settings.LOG_FILE:
+        handlers.append(logging.FileHandler(settings.LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
 
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
-    logger.addHandler(handler)
+
+    if settings.LOG_ASYNC:
+        # Formatting and writing happen on a background thread; a log call only costs a queue put, so a slow
+        # terminal or disk never stalls the trading loop.
+        log_queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, *handlers)
+        listener.start()
+        atexit.register(listener.stop)  # flushes whatever is still queued
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
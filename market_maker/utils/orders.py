@@ -0,0 +1,82 @@
+"""Client-side order tagging and ownership tracking."""
+import base64
+import threading
+import uuid
+
+
+def new_clordid(prefix):
+    """Generate a unique client order ID starting with `prefix`."""
+    return prefix + base64.b64encode(uuid.uuid4().bytes).decode('utf8').rstrip('=\n')
+
+
+class OrderIndex(object):
+
+    """Index of the orders this bot has placed, keyed by client order ID and by exchange orderid.
+
+    FxADK does not accept a client order ID, so ownership cannot be read back from the exchange.
+    Every order we create is registered here instead; an exchange order that is not in the index
+    belongs to someone else (another bot, or a manual order) and must be left alone.
+
+    If a StateStore is given, the index is written through to it and reloaded from it on startup, so orders
+    from a previous run are still recognised as ours.
+    """
+
+    def __init__(self, prefix, store=None):
+        self.prefix = prefix
+        self.store = store
+        self._lock = threading.Lock()
+        self._by_clordid = {}
+        self._by_orderid = {}
+
+        if store is not None:
+            for orderid, clordid, symbol in store.load_orders(prefix):
+                self._by_clordid[clordid] = orderid
+                self._by_orderid[orderid] = {'clOrdID': clordid, 'orderid': orderid, 'symbol': symbol}
+
+    def __len__(self):
+        return len(self._by_orderid)
+
+    def new_clordid(self):
+        return new_clordid(self.prefix)
+
+    def add(self, clordid, orderid, symbol=None):
+        """Register an order we just created."""
+        orderid = str(orderid)
+        with self._lock:
+            self._by_clordid[clordid] = orderid
+            self._by_orderid[orderid] = {'clOrdID': clordid, 'orderid': orderid, 'symbol': symbol}
+        if self.store is not None:
+            self.store.save_order(orderid, clordid, symbol)
+
+    def discard(self, orderid):
+        """Forget an order (cancelled or filled). Returns its client order ID, or None if it wasn't ours."""
+        with self._lock:
+            entry = self._by_orderid.pop(str(orderid), None)
+            if entry is None:
+                return None
+            self._by_clordid.pop(entry['clOrdID'], None)
+        if self.store is not None:
+            self.store.delete_order(orderid)
+        return entry['clOrdID']
+
+    def owns(self, orderid):
+        return str(orderid) in self._by_orderid
+
+    def clordid(self, orderid):
+        entry = self._by_orderid.get(str(orderid))
+        return entry['clOrdID'] if entry else None
+
+    def orderid(self, clordid):
+        return self._by_clordid.get(clordid)
+
+    def order_ids(self, symbol=None):
+        with self._lock:
+            return [o for o, e in self._by_orderid.items() if symbol is None or e['symbol'] == symbol]
+
+    def retain(self, live_order_ids, symbol=None):
+        """Drop every order on `symbol` that is no longer live on the exchange. Returns the dropped orderids."""
+        live = set(str(o) for o in live_order_ids)
+        dropped = [o for o in self.order_ids(symbol) if o not in live]
+        for orderid in dropped:
+            self.discard(orderid)
+        return dropped
@@ -0,0 +1,207 @@
+"""Incremental PnL ledger, fed with our own fills."""
+from array import array
+from collections import OrderedDict, deque
+
+from market_maker.utils.stats import trade_key
+
+
+class PnLLedger(object):
+
+    """Realized and unrealized PnL, fees and per-ladder-level attribution for one symbol, this run.
+
+    `update()` takes the trade history list as the API returns it (newest first) and applies only fills it hasn't
+    seen, each in O(1) (amortised, for FIFO). Positions and PnL are in the symbol's quote currency and count from
+    the first update: fills from before the run are not replayed, so inventory we already held shows up as the
+    position it is sold from.
+
+    `method` is 'average' (one lot at average cost) or 'fifo' (oldest lots are closed first). Either way `cost`
+    is the cost basis of the open position, so unrealized PnL is position * mark - cost.
+
+    Fills are attributed to the ladder level of the order that filled, if it was registered with on_created();
+    attribution is kept in arrays indexed by level, with unknown orders counted under `unattributed`.
+    """
+
+    MAX_TRACKED_ORDERS = 1000
+
+    def __init__(self, method='average'):
+        if method not in ('average', 'fifo'):
+            raise ValueError("Unknown PNL_METHOD %r" % method)
+        self.method = method
+        self.position = 0.0
+        self.cost = 0.0
+        self.lots = deque()  # fifo: [signed amount, price], oldest first
+        self.realized = 0.0
+        self.fees = 0.0
+        self.volume = 0.0
+        self.fills = 0
+        self.level_realized = array('d')
+        self.level_fees = array('d')
+        self.level_volume = array('d')
+        self.level_fills = array('l')
+        self.unattributed = {'realized': 0.0, 'fees': 0.0, 'volume': 0.0, 'fills': 0}
+        self.order_levels = OrderedDict()  # orderid -> level
+        self.last_key = None
+        self.primed = False
+
+    #
+    # Input
+    #
+    def on_created(self, orders):
+        """Remember the ladder level of each order we created, to attribute its fills."""
+        for order in orders:
+            if order.get('level') is None:
+                continue
+            self.order_levels[str(order['orderid'])] = order['level']
+            if len(self.order_levels) > self.MAX_TRACKED_ORDERS:
+                self.order_levels.popitem(last=False)
+
+    def update(self, recent_trades):
+        """Feed the latest trade history (newest first). Returns the number of new fills applied.
+           The first call only marks where the run starts."""
+        if not recent_trades:
+            self.primed = True
+            return 0
+        if not self.primed:
+            self.primed = True
+            self.last_key = trade_key(recent_trades[0])
+            return 0
+
+        new_trades = []
+        for trade in recent_trades:
+            if trade_key(trade) == self.last_key:
+                break
+            new_trades.append(trade)
+        if new_trades:
+            self.last_key = trade_key(new_trades[0])
+            for trade in reversed(new_trades):
+                self.add(trade['type'].lower(), float(trade['amount']), float(trade['price']),
+                         float(trade.get('fees') or 0), self.order_levels.get(str(trade.get('orderid'))))
+        return len(new_trades)
+
+    def add(self, side, amount, price, fee=0.0, level=None):
+        """Apply one fill."""
+        signed = amount if side == 'buy' else -amount
+        if self.method == 'fifo':
+            realized = self.add_fifo(signed, price)
+        else:
+            realized = self.add_average(signed, price)
+
+        self.realized += realized
+        self.fees += fee
+        self.volume += amount * price
+        self.fills += 1
+        self.attribute(level, realized, fee, amount * price)
+
+    def add_average(self, signed, price):
+        realized = 0.0
+        if self.position and (self.position > 0) != (signed > 0):
+            closing = min(abs(signed), abs(self.position))
+            direction = 1 if self.position > 0 else -1
+            average = self.cost / self.position
+            realized = closing * (price - average) * direction
+            self.cost -= average * closing * direction
+            self.position -= closing * direction
+            signed += closing * direction
+            if not self.position:
+                self.cost = 0.0
+        self.position += signed
+        self.cost += signed * price
+        return realized
+
+    def add_fifo(self, signed, price):
+        realized = 0.0
+        while signed and self.lots and (self.lots[0][0] > 0) != (signed > 0):
+            lot = self.lots[0]
+            closing = min(abs(signed), abs(lot[0]))
+            direction = 1 if lot[0] > 0 else -1
+            realized += closing * (price - lot[1]) * direction
+            self.cost -= lot[1] * closing * direction
+            self.position -= closing * direction
+            lot[0] -= closing * direction
+            signed += closing * direction
+            if not lot[0]:
+                self.lots.popleft()
+        if signed:
+            self.lots.append([signed, price])
+            self.position += signed
+            self.cost += signed * price
+        if not self.lots:
+            self.cost = 0.0
+        return realized
+
+    def attribute(self, level, realized, fee, volume):
+        if level is None or level < 0:
+            self.unattributed['realized'] += realized
+            self.unattributed['fees'] += fee
+            self.unattributed['volume'] += volume
+            self.unattributed['fills'] += 1
+            return
+        while len(self.level_fills) <= level:
+            for values in (self.level_realized, self.level_fees, self.level_volume, self.level_fills):
+                values.append(0)
+        self.level_realized[level] += realized
+        self.level_fees[level] += fee
+        self.level_volume[level] += volume
+        self.level_fills[level] += 1
+
+    #
+    # Queries
+    #
+    @property
+    def average_cost(self):
+        return self.cost / self.position if self.position else None
+
+    def unrealized(self, mark):
+        return self.position * mark - self.cost if mark else 0.0
+
+    def snapshot(self, mark=None):
+        unrealized = self.unrealized(mark)
+        return {
+            'position': self.position,
+            'avgCost': self.average_cost,
+            'realized': self.realized,
+            'unrealized': unrealized,
+            'fees': self.fees,
+            'net': self.realized + unrealized - self.fees,
+            'fills': self.fills,
+            'volume': self.volume,
+        }
+
+    def levels(self):
+        """Per-level attribution: [(level, realized, fees, volume, fills)], innermost first."""
+        return list(zip(range(len(self.level_fills)), self.level_realized, self.level_fees, self.level_volume,
+                        self.level_fills))
+
+    #
+    # Checkpointing
+    #
+    def to_dict(self):
+        return {
+            'method': self.method, 'position': self.position, 'cost': self.cost, 'lots': list(self.lots),
+            'realized': self.realized, 'fees': self.fees, 'volume': self.volume, 'fills': self.fills,
+            'levelRealized': list(self.level_realized), 'levelFees': list(self.level_fees),
+            'levelVolume': list(self.level_volume), 'levelFills': list(self.level_fills),
+            'unattributed': self.unattributed, 'orderLevels': list(self.order_levels.items()),
+            'lastKey': self.last_key, 'primed': self.primed,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        ledger = cls(data['method'])
+        ledger.position = data['position']
+        ledger.cost = data['cost']
+        ledger.lots = deque(data['lots'])
+        ledger.realized = data['realized']
+        ledger.fees = data['fees']
+        ledger.volume = data['volume']
+        ledger.fills = data['fills']
+        ledger.level_realized = array('d', data['levelRealized'])
+        ledger.level_fees = array('d', data['levelFees'])
+        ledger.level_volume = array('d', data['levelVolume'])
+        ledger.level_fills = array('l', data['levelFills'])
+        ledger.unattributed = data['unattributed']
+        ledger.order_levels = OrderedDict(data['orderLevels'])
+        # JSON turns the key's tuples into lists.
+        ledger.last_key = tuple(tuple(pair) for pair in data['lastKey']) if data['lastKey'] else None
+        ledger.primed = data['primed']
+        return ledger
@@ -0,0 +1,30 @@
+"""Records what the bot saw and did as JSON lines, for offline analysis (see market_maker/tca.py)."""
+import json
+import threading
+
+
+class Recorder(object):
+
+    """Appends one JSON object per line to `path`: {'kind': ..., 't': <clock time>, 'symbol': ..., ...}.
+
+    Kinds written by the bot:
+        snapshot   - every tick: bid, ask, mid, last and the quoting config (interval, pairs)
+        placement  - every order we create: orderid, side, price, amount, level
+        fill       - every new fill of ours: orderid, side, price, amount, fees, level, date (as the API gave it)
+    """
+
+    def __init__(self, path, clock):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', buffering=1)
+
+    def record(self, kind, symbol, **fields):
+        fields.update(kind=kind, t=self.clock.time(), symbol=symbol)
+        line = json.dumps(fields, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
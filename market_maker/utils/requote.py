@@ -0,0 +1,104 @@
+"""Requote suppression: only amend an order when the change is worth the API calls."""
+from collections import deque
+
+from market_maker.utils.clock import get_clock
+
+# FxADK has no amend; an amend is a cancel plus a create.
+CALLS_PER_AMEND = 2
+
+
+class RequoteFilter(object):
+
+    """Decides whether an existing order should be amended to match the desired one.
+
+    - Each level has a price tolerance band: `price_tolerance` at the inside, widening by `level_widening`
+      (as a fraction of the base band) per level outwards, since outer levels rarely fill.
+    - Size differences within `size_tolerance` (a fraction of the current size) are ignored.
+    - An order at the touch (best bid / best ask) keeps its queue priority for as long as it stays within
+      twice its band - amending it would send it to the back of the queue.
+    - At most `amend_budget` amends are sent per minute; beyond that, amends are deferred to a later tick.
+
+    `calls_saved` compares the amends sent with those the plain RELIST_INTERVAL rule (any size change, or a price
+    change over `price_tolerance`) would have sent, tracking the order that rule would have in the book for each
+    of ours. `suppressed` counts the amends that rule would have sent that the bands held back, `deferred` those
+    put off by the budget.
+    """
+
+    def __init__(self, price_tolerance, level_widening=0.0, size_tolerance=0.0, amend_budget=None, clock=None):
+        self.price_tolerance = price_tolerance
+        self.level_widening = level_widening
+        self.size_tolerance = size_tolerance
+        self.amend_budget = amend_budget
+        self.clock = clock or get_clock()
+        self.amend_times = deque()
+        self.suppressed = 0
+        self.deferred = 0
+        self.amends = 0
+        self.baseline_amends = 0
+        self.baseline_orders = {}  # orderid -> (price, amount) the plain rule would be quoting in its place
+
+    @property
+    def calls_saved(self):
+        return (self.baseline_amends - self.amends) * CALLS_PER_AMEND
+
+    def retain(self, orderids):
+        """Forget orders that are no longer open."""
+        live = set(str(orderid) for orderid in orderids)
+        for orderid in [o for o in self.baseline_orders if o not in live]:
+            del self.baseline_orders[orderid]
+
+    def baseline_amend(self, order, desired):
+        """Whether the plain rule would amend now, to what it would have in the book for `order`."""
+        orderid = str(order.get('orderid'))
+        price, amount = self.baseline_orders.get(orderid, (order['price'], order['amount']))
+        if desired['amount'] == amount and (
+                desired['price'] == price or price and abs(desired['price'] / price - 1) <= self.price_tolerance):
+            return False
+        self.baseline_orders[orderid] = (desired['price'], desired['amount'])
+        self.baseline_amends += 1
+        return True
+
+    def band(self, level):
+        """Price tolerance for `level` (0 is the innermost)."""
+        return self.price_tolerance * (1 + level * self.level_widening)
+
+    def is_at_touch(self, order, best_bid, best_ask):
+        if order['type'] == 'buy':
+            return best_bid <= order['price'] < best_ask
+        return best_bid < order['price'] <= best_ask
+
+    def should_amend(self, order, desired, level, best_bid, best_ask):
+        """True if `order` should be amended to `desired`. `level` counts from the inside, starting at 0."""
+        baseline = self.baseline_amend(order, desired)
+        size_change = abs(desired['amount'] - order['amount']) / order['amount'] if order['amount'] else 1.0
+        price_change = abs(desired['price'] / order['price'] - 1) if order['price'] else 1.0
+
+        band = self.band(level)
+        if self.is_at_touch(order, best_bid, best_ask):
+            band *= 2
+
+        if size_change <= self.size_tolerance and price_change <= band:
+            if baseline:
+                self.suppressed += 1
+            return False
+
+        if not self.take_budget():
+            self.deferred += 1
+            return False
+
+        # The amend replaces the order; the plain rule's order would now match ours again.
+        self.baseline_orders.pop(str(order.get('orderid')), None)
+        self.amends += 1
+        return True
+
+    def take_budget(self):
+        if self.amend_budget is None:
+            return True
+
+        now = self.clock.time()
+        while self.amend_times and self.amend_times[0] <= now - 60:
+            self.amend_times.popleft()
+        if len(self.amend_times) >= self.amend_budget:
+            return False
+        self.amend_times.append(now)
+        return True
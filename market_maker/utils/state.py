@@ -0,0 +1,68 @@
+"""Persistent local state, so a restarted bot can pick up where the last run left off."""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+RUN_ID_VARIABLE = 'MARKETMAKER_RUN_ID'
+
+
+def run_id():
+    """ID of this run of the bot. Made on first use and kept in the environment, so the os.execv restarts that
+       apply code changes (or the watchdog's) stay in the same run, while launching the bot afresh starts a new one."""
+    if RUN_ID_VARIABLE not in os.environ:
+        os.environ[RUN_ID_VARIABLE] = uuid.uuid4().hex
+    return os.environ[RUN_ID_VARIABLE]
+
+
+class StateStore(object):
+
+    """Small SQLite store for the bot's own orders and a few JSON snapshots (instrument, position checkpoint).
+
+    Writes are committed immediately; WAL mode keeps them cheap enough for the main loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS orders '
+                          '(orderid TEXT PRIMARY KEY, clordid TEXT NOT NULL, symbol TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    #
+    # Orders
+    #
+    def save_order(self, orderid, clordid, symbol):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO orders VALUES (?, ?, ?)', (str(orderid), clordid, symbol))
+
+    def delete_order(self, orderid):
+        with self.lock:
+            self.conn.execute('DELETE FROM orders WHERE orderid = ?', (str(orderid),))
+
+    def load_orders(self, prefix):
+        """Orders whose client order ID starts with `prefix`, as (orderid, clordid, symbol) tuples."""
+        with self.lock:
+            rows = self.conn.execute('SELECT orderid, clordid, symbol FROM orders').fetchall()
+        return [row for row in rows if row[1].startswith(prefix)]
+
+    #
+    # Snapshots
+    #
+    def save(self, key, value):
+        data = json.dumps(value)
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?)', (key, data))
+
+    def load(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM snapshots WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
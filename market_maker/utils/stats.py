@@ -0,0 +1,125 @@
+"""Rolling trade statistics, updated incrementally as new trades come in."""
+from collections import deque
+from math import log, sqrt
+
+
+def trade_key(trade):
+    """Identity of a trade in the trade history list. Reads through trade[k] so a lazily-typed record gives
+       the same key before and after its fields are converted."""
+    return tuple(sorted((k, str(trade[k])) for k in trade))
+
+
+class TradeStats(object):
+
+    """VWAP, EWMA volatility, buy/sell imbalance and extreme prices over the last `window` trades.
+
+    `update()` takes the trade history list as the API returns it (newest first) and only processes trades
+    it hasn't seen before. Each new trade costs O(1): running sums are adjusted for the trade entering and
+    the one leaving the window, and the highest buy / lowest sell are kept in monotonic deques.
+    """
+
+    def __init__(self, window=100, alpha=0.06):
+        self.window = window
+        self.alpha = alpha
+        self.seq = 0
+        self.trades = deque()  # (seq, price, amount, type)
+        self.notional = 0.0
+        self.volume = 0.0
+        self.buy_volume = 0.0
+        self.sell_volume = 0.0
+        self.buy_maxima = deque()  # (seq, price), prices decreasing
+        self.sell_minima = deque()  # (seq, price), prices increasing
+        self.variance = 0.0
+        self.last_price = None
+        self.last_side = None
+        self.last_key = None
+
+    def update(self, recent_trades):
+        """Feed the latest trade history (newest first). Returns the number of new trades processed."""
+        new_trades = []
+        for trade in recent_trades:
+            if trade_key(trade) == self.last_key or len(new_trades) == self.window:
+                break
+            new_trades.append(trade)
+
+        if new_trades:
+            self.last_key = trade_key(new_trades[0])
+            for trade in reversed(new_trades):
+                self.add(float(trade['price']), float(trade['amount']), trade['type'].lower())
+
+        return len(new_trades)
+
+    def add(self, price, amount, side):
+        """Add a single trade, oldest to newest."""
+        self.seq += 1
+        self.trades.append((self.seq, price, amount, side))
+        self.notional += price * amount
+        self.volume += amount
+        if side == 'buy':
+            self.buy_volume += amount
+            while self.buy_maxima and self.buy_maxima[-1][1] <= price:
+                self.buy_maxima.pop()
+            self.buy_maxima.append((self.seq, price))
+        else:
+            self.sell_volume += amount
+            while self.sell_minima and self.sell_minima[-1][1] >= price:
+                self.sell_minima.pop()
+            self.sell_minima.append((self.seq, price))
+
+        if self.last_price and price > 0:
+            ret = log(price / self.last_price)
+            self.variance = self.alpha * ret * ret + (1 - self.alpha) * self.variance
+        self.last_price = price
+        self.last_side = side
+
+        if len(self.trades) > self.window:
+            self.evict()
+
+    def evict(self):
+        seq, price, amount, side = self.trades.popleft()
+        self.notional -= price * amount
+        self.volume -= amount
+        if side == 'buy':
+            self.buy_volume -= amount
+            if self.buy_maxima and self.buy_maxima[0][0] == seq:
+                self.buy_maxima.popleft()
+        else:
+            self.sell_volume -= amount
+            if self.sell_minima and self.sell_minima[0][0] == seq:
+                self.sell_minima.popleft()
+
+    #
+    # Queries - all O(1)
+    #
+    @property
+    def vwap(self):
+        return self.notional / self.volume if self.volume > 0 else None
+
+    @property
+    def volatility(self):
+        """EWMA standard deviation of trade-to-trade log returns."""
+        return sqrt(self.variance)
+
+    @property
+    def imbalance(self):
+        """(buy volume - sell volume) / total volume, in [-1, 1]."""
+        total = self.buy_volume + self.sell_volume
+        return (self.buy_volume - self.sell_volume) / total if total > 0 else 0.0
+
+    @property
+    def highest_buy(self):
+        return self.buy_maxima[0][1] if self.buy_maxima else None
+
+    @property
+    def lowest_sell(self):
+        return self.sell_minima[0][1] if self.sell_minima else None
+
+    def snapshot(self):
+        return {
+            'vwap': self.vwap,
+            'volatility': self.volatility,
+            'imbalance': self.imbalance,
+            'lastSide': self.last_side,
+            'highestBuy': self.highest_buy,
+            'lowestSell': self.lowest_sell,
+        }
@@ -0,0 +1,29 @@
+import time
+
+
+class StartupTimer(object):
+    """Records how long each startup phase takes so slow restarts can be tracked down."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.last = self.started
+        self.phases = []
+        self.reported = False
+
+    def mark(self, phase):
+        """Close the current phase under the name `phase`."""
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, logger):
+        """Log the phase breakdown. Only the first report is logged; later OrderManagers are not startup."""
+        if self.reported:
+            return
+        self.reported = True
+        logger.info("Startup took %.2fs: %s" % (self.last - self.started,
+                                               ", ".join("%s %.2fs" % phase for phase in self.phases)))
+
+
+# Started when this module is first imported, which market_maker.py does before anything expensive.
+startup = StartupTimer()
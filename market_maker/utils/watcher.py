@@ -0,0 +1,42 @@
+import os
+
+from market_maker.utils.clock import get_clock
+
+
+class FileWatcher(object):
+    """Polls a set of files for modification, at most once every `interval` seconds."""
+
+    def __init__(self, paths, interval, clock=None):
+        self.interval = interval
+        self.clock = clock or get_clock()
+        self.mtimes = {}
+        self.next_check = self.clock.time() + interval
+        self.watch(paths)
+
+    def watch(self, paths):
+        for path in paths:
+            path = os.path.abspath(path)
+            if path not in self.mtimes:
+                self.mtimes[path] = self.get_mtime(path)
+
+    @staticmethod
+    def get_mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def changed(self):
+        """Return the files modified since the last check. Cheap to call on every loop."""
+        now = self.clock.time()
+        if now < self.next_check:
+            return []
+        self.next_check = now + self.interval
+
+        changed = []
+        for path, mtime in self.mtimes.items():
+            new_mtime = self.get_mtime(path)
+            if new_mtime != mtime:
+                self.mtimes[path] = new_mtime
+                changed.append(path)
+        return changed
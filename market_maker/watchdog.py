@@ -0,0 +1,106 @@
+"""Liveness watchdog: notices when the main loop hangs or market data stops, and pulls our quotes."""
+import logging
+import threading
+
+from market_maker.utils.clock import get_clock
+
+logger = logging.getLogger('root')
+
+
+class Watchdog(object):
+
+    """Checks the main loop's heartbeat and the age of our market data from a daemon thread.
+
+    The loop calls beat() at the top of every iteration; `data_time()` returns when market data was last fetched
+    successfully (None if never). When either is older than its timeout, `on_stall(reason)` is called from the
+    watchdog thread - once per stall: it is called again only after the bot has recovered and stalled anew.
+
+    Each check is a couple of subtractions every `interval` (real) seconds, so it can run all the time.
+    """
+
+    def __init__(self, on_stall, data_time, loop_timeout=300, data_timeout=300, interval=1.0, clock=None):
+        self.on_stall = on_stall
+        self.data_time = data_time
+        self.loop_timeout = loop_timeout
+        self.data_timeout = data_timeout
+        self.interval = interval
+        self.clock = clock or get_clock()
+
+        self.started = self.clock.time()
+        self.last_beat = self.started
+        self.stalled = None  # reason, while stalled
+        self.stalls = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @classmethod
+    def from_settings(cls, settings, on_stall, data_time, clock=None):
+        watchdog = cls(on_stall, data_time, clock=clock)
+        watchdog.configure(settings)
+        return watchdog
+
+    def configure(self, settings):
+        """(Re)load the timeouts from settings."""
+        self.loop_timeout = settings.WATCHDOG_LOOP_TIMEOUT
+        self.data_timeout = settings.WATCHDOG_DATA_TIMEOUT
+        self.interval = settings.WATCHDOG_INTERVAL
+
+    def beat(self):
+        self.last_beat = self.clock.time()
+
+    def check(self):
+        """Why the bot looks stalled, or None if it looks healthy."""
+        now = self.clock.time()
+        if now - self.last_beat > self.loop_timeout:
+            return "main loop silent for %.0fs" % (now - self.last_beat)
+        data_time = self.data_time()
+        data_age = now - (data_time if data_time is not None else self.started)
+        if data_age > self.data_timeout:
+            return "no market data for %.0fs" % data_age
+        return None
+
+    def healthy(self):
+        return self.check() is None
+
+    def health(self):
+        now = self.clock.time()
+        data_time = self.data_time()
+        return {
+            'healthy': self.healthy(),
+            'loopAge': now - self.last_beat,
+            'dataAge': now - data_time if data_time is not None else None,
+            'stalled': self.stalled,
+            'stalls': self.stalls,
+        }
+
+    #
+    # Thread
+    #
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='watchdog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        reason = self.check()
+        if reason is None:
+            if self.stalled is not None:
+                logger.info("Watchdog: recovered from stall (%s)." % self.stalled)
+            self.stalled = None
+            return
+        if self.stalled is not None:
+            return
+
+        self.stalled = reason
+        self.stalls += 1
+        logger.error("Watchdog: %s." % reason)
+        try:
+            self.on_stall(reason)
+        except Exception as e:
+            logger.error("Watchdog stall handler failed: %s" % e)
@@ -1,19 +1,30 @@
-import time
-import requests
-
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
+import logging
 
 from market_maker.settings import settings
+from market_maker.utils import deadline as tick_deadline, fastjson
+from market_maker.utils.clock import get_clock
+from market_maker.utils.errors import DeadlineExceeded, OrderStatusUnknown
+from market_maker.ws.scheduler import get_scheduler, request_class
+from market_maker.ws.singleflight import SingleFlight
+from market_maker.ws.transport import get_transport
 
-# ----------------------------------------------------------------------------------------------------------------------
-# Config
+logger = logging.getLogger('root')
+
+# Endpoints that change state on the exchange; everything else is a read and may be coalesced.
+WRITE_ENDPOINTS = frozenset(['createOrder', 'cancelOrder'])
+
+# Shared by every FxAdkImpl in the process, so components reading the same thing at once share one request.
+reads = SingleFlight()
+
+
+def endpoint_name(url):
+    """'https://fxadk.com/api/getOpenOrders' -> 'getOpenOrders'"""
+    return url.rsplit('/', 1)[-1]
 
-base_url = 'https://fxadk.com/api/'
 
-session = requests.Session()
-retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-session.mount('https://', HTTPAdapter(max_retries=retries))
+def read_key(url, data):
+    """Coalescing key for a read: endpoint plus parameters. The secret is left out; the key identifies the account."""
+    return (url,) + tuple(sorted((k, str(v)) for k, v in data.items() if k != 'api_secret'))
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -21,44 +32,94 @@ session.mount('https://', HTTPAdapter(max_retries=retries))
 
 
 class FxAdkImpl(object):
-    def __init__(self, api_key, api_secret):
+    def __init__(self, api_key, api_secret, base_url=None, clock=None, transport=None, scheduled=True):
         self.api_key = api_key
         self.api_secret = api_secret
+        self.base_url = base_url or settings.BASE_URL
+        self.clock = clock or get_clock()
+        self.transport = transport or get_transport(self.base_url)
+        self.scheduler = None
+        if scheduled and settings.RATE_LIMIT_PER_MINUTE:
+            self.scheduler = get_scheduler(self.base_url, self.clock)
         self.max_attempts = 5
 
-    def get_post_json_impl(self, url, data, attempt=1):
+    def get_post_json_impl(self, url, data, attempt=1, deadline=None):
+        """POST, retrying reads on errors. Writes are never re-sent: if one times out or its response can't be read,
+           the exchange may have acted on it, and OrderStatusUnknown is raised for the caller to sort out."""
         if attempt > 1:
-            print('Attempt %i' % attempt)
+            logger.warning('Attempt %i' % attempt, extra={'endpoint': endpoint_name(url)})
 
+        timeout = tick_deadline.request_timeout(deadline)
         try:
-            res = session.post(url, data)
-        except:
-            time.sleep(settings.API_ERROR_INTERVAL)
+            res = self.transport.post(url, data, timeout=timeout)
+        except Exception as e:
+            if endpoint_name(url) in WRITE_ENDPOINTS:
+                raise OrderStatusUnknown('%s: %s' % (endpoint_name(url), e))
+
+            self.wait_to_retry(url, deadline)
 
             if attempt > self.max_attempts:
                 raise
 
-            return self.get_post_json_impl(url, data, attempt=attempt+1)
+            return self.get_post_json_impl(url, data, attempt=attempt+1, deadline=deadline)
 
         try:
-            return res.json()
+            return fastjson.loads(res.content)
         except:
-            print('FxADK error: %s' % res.content)
+            logger.error('FxADK error: %s' % res.content, extra={'endpoint': endpoint_name(url)})
+            if endpoint_name(url) in WRITE_ENDPOINTS:
+                raise OrderStatusUnknown('%s: unreadable response' % endpoint_name(url))
 
-            time.sleep(settings.API_ERROR_INTERVAL)
+            self.wait_to_retry(url, deadline)
 
             if attempt > self.max_attempts:
                 raise
 
-            return self.get_post_json_impl(url, data, attempt=attempt+1)
+            return self.get_post_json_impl(url, data, attempt=attempt+1, deadline=deadline)
+
+    def wait_to_retry(self, url, deadline):
+        """Sleep API_ERROR_INTERVAL before a retry, unless that would run past the deadline."""
+        if deadline is not None and deadline.remaining() < settings.API_ERROR_INTERVAL:
+            raise DeadlineExceeded('%s stage out of time to retry %s' % (deadline.name, endpoint_name(url)))
+        self.clock.sleep(settings.API_ERROR_INTERVAL)
+
+    def get_post_json(self, url, data, rest=True):
+        """POST and decode the response.
+
+        Requests go through the scheduler, which sends them in priority order (cancels, order writes, market data,
+        account reads) within RATE_LIMIT_PER_MINUTE. Without a rate limit set, this sleeps API_REST_INTERVAL
+        after each call instead. `rest=False` sends immediately, outside both.
+
+        With COALESCE_READS, a read that is already in flight with the same parameters is not sent again: the
+        caller waits for it and shares its response.
+
+        Inside a tick stage (see utils/deadline.py), each request's timeout is cut down to the time the stage has
+        left, and DeadlineExceeded is raised rather than sending or retrying once it has none."""
+        started = self.clock.time()
+        deadline = tick_deadline.current()
+        if deadline is not None:
+            deadline.check(endpoint_name(url))
+        if settings.COALESCE_READS and endpoint_name(url) not in WRITE_ENDPOINTS:
+            post_json, sent = reads.do(read_key(url, data), lambda: self.send(url, data, rest, deadline), deadline)
+        else:
+            post_json, sent = self.send(url, data, rest, deadline), True
+        logger.debug('Called %s' % url if sent else 'Coalesced %s' % url,
+                     extra={'endpoint': endpoint_name(url), 'latency': round(self.clock.time() - started, 4)})
+        return post_json
 
-    def get_post_json(self, url, data):
-        print('Calling %s' % url)
-        post_json = self.get_post_json_impl(url, data)
-        time.sleep(settings.API_REST_INTERVAL)
+    def send(self, url, data, rest=True, deadline=None):
+        if not rest:
+            return self.get_post_json_impl(url, data, deadline=deadline)
+        if self.scheduler is not None:
+            return self.scheduler.submit(request_class(endpoint_name(url)),
+                                         lambda: self.get_post_json_impl(url, data, deadline=deadline), deadline)
+        post_json = self.get_post_json_impl(url, data, deadline=deadline)
+        self.clock.sleep(settings.API_REST_INTERVAL)
         return post_json
 
-    def get_currency_details(self, url='%s%s' % (base_url, 'getCurrencies')):
+    def get_currency_details(self, url=None):
+        url = url or self.base_url + 'getCurrencies'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -67,7 +128,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_pair_details(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getPairDetails')):
+    def get_pair_details(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getPairDetails'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -77,7 +140,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_market_history(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getMarketHistory')):
+    def get_market_history(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getMarketHistory'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -87,7 +152,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_buy_orders(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getBuyOrders')):
+    def get_buy_orders(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getBuyOrders'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -97,7 +164,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_sell_orders(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getSellOrders')):
+    def get_sell_orders(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getSellOrders'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -113,7 +182,9 @@ class FxAdkImpl(object):
 
     ORDER_ID_KEY = 'orderid'
 
-    def create_order(self, amount=0.00000011, price=0.0, order='limit', type='buy', pair='ADK/BTC', url='%s%s' % (base_url, 'createOrder')):
+    def create_order(self, amount=0.00000011, price=0.0, order='limit', type='buy', pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'createOrder'
+
         asset = pair.split('/')[0]
 
         pair = pair.replace('/', '_')  # this will probably not be needed in the future
@@ -132,27 +203,31 @@ class FxAdkImpl(object):
 
         if self.ORDER_ID_KEY in res_json:
             order_id = res_json[self.ORDER_ID_KEY]
-            print('Created order %s' % order_id)
+            logger.info('Created order %s' % order_id, extra={'symbol': pair, 'orderid': order_id})
             return res_json  # return the whole order object
 
-        print(res_json)
+        logger.error('Order rejected: %s' % res_json, extra={'symbol': pair})
         raise RuntimeError('Failed to create order to %s %s %s' % (type, amount, asset))
 
-    def cancel_order(self, order_id,  url='%s%s' % (base_url, 'cancelOrder')):
+    def cancel_order(self, order_id,  url=None, rest=True):
+        url = url or self.base_url + 'cancelOrder'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
             'orderid': order_id,
         }
 
-        res_json = self.get_post_json(url, data)
+        res_json = self.get_post_json(url, data, rest=rest)
 
         if res_json.get('status') != 'success':
             raise RuntimeError('Failed to cancel order %s' % order_id)
 
-        print('Successfully cancelled order %s' % order_id)
+        logger.info('Successfully cancelled order %s' % order_id, extra={'orderid': order_id})
+
+    def get_trade_history(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getTradeHistory'
 
-    def get_trade_history(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getTradeHistory')):
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -162,7 +237,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_cancel_history(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getCancelHistory')):
+    def get_cancel_history(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getCancelHistory'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -172,8 +249,10 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_stop_orders(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getStopOrders')):
+    def get_stop_orders(self, pair='ADK/BTC', url=None):
         """These are active stop loss orders"""
+        url = url or self.base_url + 'getStopOrders'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -183,7 +262,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_open_orders(self, pair='ADK/BTC', url='%s%s' % (base_url, 'getOpenOrders')):
+    def get_open_orders(self, pair='ADK/BTC', url=None):
+        url = url or self.base_url + 'getOpenOrders'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -193,7 +274,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_withdraw_history(self, url='%s%s' % (base_url, 'getWithdrawhistory')):
+    def get_withdraw_history(self, url=None):
+        url = url or self.base_url + 'getWithdrawhistory'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -202,7 +285,9 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_deposit_history(self, url='%s%s' % (base_url, 'getDeposithistory')):
+    def get_deposit_history(self, url=None):
+        url = url or self.base_url + 'getDeposithistory'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
@@ -211,8 +296,10 @@ class FxAdkImpl(object):
         res_json = self.get_post_json(url, data)
         return res_json
 
-    def get_account_balance(self, url='%s%s' % (base_url, 'getAccountbalance')):
+    def get_account_balance(self, url=None):
         """Get account balance"""
+        url = url or self.base_url + 'getAccountbalance'
+
         data = {
             'api_key': self.api_key,
             'api_secret': self.api_secret,
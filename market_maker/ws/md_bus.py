@@ -0,0 +1,213 @@
+"""Shared-memory market data bus: one feed process polls FxADK, any number of bots read.
+
+The feed writes each symbol's top-of-book levels into a memory-mapped file, guarded by a seqlock: the writer
+makes the sequence number odd, writes, then makes it even again. Readers unpack straight from the mapping and
+retry if the sequence was odd or changed while they read, so they never block the writer and never see a
+half-written snapshot.
+
+A feed restarted with a different MD_BUS_LEVELS re-lays the file out under the seqlock; readers notice the new
+header and map it again. The file is never shrunk, so a reader's mapping always stays within it.
+
+Run the feed with
+
+    python -m market_maker.ws.md_bus ADK/BTC ADK/USDT
+
+and set MD_BUS = True in the bots' settings. FxADKInterface.get_instrument then reads from the bus while its
+data is at most MD_BUS_MAX_AGE seconds old, and falls back to REST otherwise.
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from market_maker.settings import settings
+from market_maker.utils.clock import get_clock
+
+logger = logging.getLogger('root')
+
+MAGIC = b'MDB2'
+HEADER = struct.Struct('<4sI')  # magic, levels per side
+SEQ = struct.Struct('<Q')
+SNAPSHOT = struct.Struct('<ddddII')  # published, last, bid, ask, bid levels, ask levels
+LEVEL = struct.Struct('<dd')  # price, size
+
+SEQ_OFFSET = 16
+SNAPSHOT_OFFSET = SEQ_OFFSET + SEQ.size
+LEVELS_OFFSET = SNAPSHOT_OFFSET + SNAPSHOT.size
+
+
+def bus_path(symbol):
+    """File backing `symbol`'s bus, in MD_BUS_DIR (or the temp directory)."""
+    return os.path.join(settings.MD_BUS_DIR or tempfile.gettempdir(), 'fxadk-md-%s.bus' % symbol.replace('/', '_'))
+
+
+class Layout(object):
+    """Offsets within a bus file with room for `levels` levels per side."""
+
+    def __init__(self, levels):
+        self.levels = levels
+        self.header = (MAGIC, levels)
+        self.asks_offset = LEVELS_OFFSET + levels * LEVEL.size
+        self.size = self.asks_offset + levels * LEVEL.size
+
+
+class MarketDataWriter(object):
+
+    """The feed's end of one symbol's bus. There must be only one writer per file."""
+
+    def __init__(self, path, levels=10, clock=None):
+        self.layout = Layout(levels)
+        self.clock = clock or get_clock()
+        with open(path, 'a+b') as f:
+            # Never shrink the file: readers may have its old size mapped, and touching a mapping past the end
+            # of its file kills the process.
+            size = max(os.fstat(f.fileno()).st_size, self.layout.size, LEVELS_OFFSET)
+            f.truncate(size)
+            self.map = mmap.mmap(f.fileno(), size)
+        self.seq = SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+        if self.seq % 2:
+            self.seq += 1  # a previous feed died mid-write
+        self.begin()
+        HEADER.pack_into(self.map, 0, *self.layout.header)
+        SNAPSHOT.pack_into(self.map, SNAPSHOT_OFFSET, 0, 0, 0, 0, 0, 0)  # nothing published in this layout yet
+        self.end()
+
+    def publish(self, instrument):
+        """Write `instrument` (as returned by get_instrument)."""
+        layout = self.layout
+        bids = instrument.get('bids', [])[:layout.levels]
+        asks = instrument.get('asks', [])[:layout.levels]
+
+        self.begin()
+        SNAPSHOT.pack_into(self.map, SNAPSHOT_OFFSET, self.clock.time(), instrument['lastPrice'],
+                           instrument['bidPrice'], instrument['askPrice'], len(bids), len(asks))
+        for i, level in enumerate(bids):
+            LEVEL.pack_into(self.map, LEVELS_OFFSET + i * LEVEL.size, *level)
+        for i, level in enumerate(asks):
+            LEVEL.pack_into(self.map, layout.asks_offset + i * LEVEL.size, *level)
+        self.end()
+
+    def begin(self):
+        self.seq += 1
+        SEQ.pack_into(self.map, SEQ_OFFSET, self.seq)
+
+    def end(self):
+        self.seq += 1
+        SEQ.pack_into(self.map, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        self.map.close()
+
+
+class MarketDataReader(object):
+
+    """A bot's end of one symbol's bus, mapped read-only. Opened lazily, so the feed may start after the bot, and
+       opened again if the feed re-lays the file out."""
+
+    def __init__(self, path, clock=None, max_retries=100):
+        self.path = path
+        self.clock = clock or get_clock()
+        self.max_retries = max_retries
+        self.map = None
+        self.layout = None
+
+    def open(self):
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < LEVELS_OFFSET:
+                    return False
+                self.map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return False
+        magic, levels = HEADER.unpack_from(self.map, 0)
+        self.layout = Layout(levels)
+        if magic != MAGIC or self.layout.size > len(self.map):
+            self.map.close()
+            self.map = None
+            return False
+        return True
+
+    def read(self, unpack):
+        """Run `unpack()` against a stable snapshot. Returns None if the writer kept it busy."""
+        if self.map is None and not self.open():
+            return None
+        for _ in range(self.max_retries):
+            before = SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+            if before % 2:
+                continue
+            relaid = HEADER.unpack_from(self.map, 0) != self.layout.header
+            value = None if relaid else unpack()
+            if SEQ.unpack_from(self.map, SEQ_OFFSET)[0] != before:
+                continue
+            if relaid:
+                # The feed restarted with another layout; our offsets no longer apply.
+                self.close()
+                if not self.open():
+                    return None
+                continue
+            return value if before else None  # never published
+        return None
+
+    def instrument(self, symbol, max_age):
+        """The latest instrument, in get_instrument's format, or None if there is none newer than `max_age`."""
+        def unpack():
+            published, last, bid, ask, n_bids, n_asks = SNAPSHOT.unpack_from(self.map, SNAPSHOT_OFFSET)
+            levels = self.layout.levels
+            bids = [LEVEL.unpack_from(self.map, LEVELS_OFFSET + i * LEVEL.size) for i in range(min(n_bids, levels))]
+            asks = [LEVEL.unpack_from(self.map, self.layout.asks_offset + i * LEVEL.size)
+                    for i in range(min(n_asks, levels))]
+            return published, last, bid, ask, bids, asks
+
+        snapshot = self.read(unpack)
+        if snapshot is None or not snapshot[0]:
+            return None
+        published, last, bid, ask, bids, asks = snapshot
+        if self.clock.time() - published > max_age:
+            return None
+        return {
+            'symbol': symbol,
+            'instrument': symbol,
+            'lastPrice': last,
+            'bidPrice': bid,
+            'askPrice': ask,
+            'midPrice': (bid + ask) / 2,
+            'tickSize': 0.00000001,
+            'bids': bids,
+            'asks': asks,
+        }
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+def run_feed(symbols):
+    """Poll FxADK for `symbols` and publish to their buses until interrupted."""
+    from market_maker.ws.ws_thread import FxADKInterface
+
+    clock = get_clock()
+    interface = FxADKInterface(clock)
+    writers = dict((symbol, MarketDataWriter(bus_path(symbol), settings.MD_BUS_LEVELS, clock)) for symbol in symbols)
+    logger.info("Publishing market data for %s to %s" % (', '.join(symbols), bus_path('*')))
+    while True:
+        for symbol, writer in writers.items():
+            try:
+                instrument = interface.fetch_instrument(symbol)
+            except Exception as e:
+                logger.warning("Feed for %s failed: %s" % (symbol, e))
+                continue
+            writer.publish(instrument)
+        clock.sleep(settings.MD_BUS_INTERVAL)
+
+
+if __name__ == '__main__':
+    from market_maker.utils import log
+    log.setup_custom_logger('root')
+    try:
+        run_feed(sys.argv[1:] or [settings.SYMBOL])
+    except KeyboardInterrupt:
+        pass
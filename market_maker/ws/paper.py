@@ -0,0 +1,148 @@
+import threading
+from collections import Counter, OrderedDict
+
+from market_maker.settings import settings
+from market_maker.utils import deadline as tick_deadline
+from .scheduler import request_class
+from .ws_thread import FxADKInterface
+
+
+class PaperFxADKInterface(FxADKInterface):
+
+    """FxADKInterface for dry runs: market data is read from FxADK, but orders, fills and balances are simulated.
+
+    Resting orders are filled in full when the opposite side of the book reaches them - a buy fills once the
+    best ask is at or below its price, a sell once the best bid is at or above it. The last trade price isn't
+    used: it carries no time, and may be from long before the order was placed.
+    Writes sleep like the real client would and are counted, so a dry run shows the API usage a live run
+    would have.
+    """
+
+    def __init__(self, balances=None, fee=0.0, latency=0.0, clock=None):
+        super(PaperFxADKInterface, self).__init__(clock)
+        self.clock = self.fx_adk_api.clock
+        self.balances = Counter(balances or {})
+        self.fee = fee
+        self.latency = latency
+        self.paper_orders = OrderedDict()
+        self.fills = []  # newest first, like getTradeHistory
+        self.calls = Counter()
+        self.last_instrument = {}
+        self.next_order_id = 1
+        self.lock = threading.Lock()
+
+    def simulate_call(self, endpoint):
+        """Take the time the real call would, including waiting for the scheduler to admit it."""
+        self.calls[endpoint] += 1
+        scheduler = self.fx_adk_api.scheduler
+        if scheduler is not None:
+            scheduler.submit(request_class(endpoint), lambda: self.clock.sleep(self.latency), tick_deadline.current())
+        else:
+            self.clock.sleep(self.latency + settings.API_REST_INTERVAL)
+
+    #
+    # Market data - real, but used to match our resting orders
+    #
+    def get_instrument(self, symbol):
+        instrument = super(PaperFxADKInterface, self).get_instrument(symbol)
+        self.last_instrument[symbol] = instrument
+        self.match(instrument)
+        return instrument
+
+    def match(self, instrument):
+        with self.lock:
+            for order in list(self.paper_orders.values()):
+                if order['symbol'] != instrument['symbol']:
+                    continue
+                if order['type'] == 'buy':
+                    filled = instrument['askPrice'] is not None and instrument['askPrice'] <= order['price']
+                else:
+                    filled = instrument['bidPrice'] is not None and instrument['bidPrice'] >= order['price']
+                if filled:
+                    self.fill(order)
+
+    def fill(self, order):
+        """Fill `order` completely at its limit price. Caller holds self.lock."""
+        del self.paper_orders[order['orderid']]
+
+        base, quote = order['symbol'].split('/')
+        total = order['amount'] * order['price']
+        fees = total * self.fee
+        if order['type'] == 'buy':
+            self.balances[base] += order['amount']
+            self.balances[quote] -= total + fees
+        else:
+            self.balances[base] -= order['amount']
+            self.balances[quote] += total - fees
+
+        self.fills.insert(0, {'orderid': order['orderid'], 'type': order['type'], 'price': order['price'],
+                              'amount': order['amount'], 'total': total, 'fees': fees, 'date': self.clock.time()})
+        del self.fills[500:]
+        self.logger.info("Paper fill: %s %f @ %f" % (order['type'], order['amount'], order['price']))
+
+    #
+    # Account - simulated
+    #
+    def locked(self, asset):
+        """Balance of `asset` tied up in resting orders, including the fees buys will pay."""
+        locked = 0.0
+        for order in self.paper_orders.values():
+            base, quote = order['symbol'].split('/')
+            if order['type'] == 'buy' and quote == asset:
+                locked += order['amount'] * order['price'] * (1 + self.fee)
+            elif order['type'] == 'sell' and base == asset:
+                locked += order['amount']
+        return locked
+
+    def funds(self):
+        self.calls['getAccountbalance'] += 1
+        with self.lock:
+            return [{'symbol': asset, 'balance': balance} for asset, balance in self.balances.items()]
+
+    def recent_trades(self, symbol):
+        self.calls['getTradeHistory'] += 1
+        with self.lock:
+            return [dict(f) for f in self.fills]
+
+    def open_orders(self, symbol):
+        self.calls['getOpenOrders'] += 1
+        with self.lock:
+            return [dict(o) for o in self.paper_orders.values() if o['symbol'] == symbol]
+
+    def create_order(self, amount=0.0, price=0.0, order='limit', type='buy', pair='ADK/BTC'):
+        self.simulate_call('createOrder')
+
+        base, quote = pair.split('/')
+        with self.lock:
+            if type == 'buy':
+                fundable = self.balances[quote] - self.locked(quote) >= amount * price * (1 + self.fee)
+            else:
+                fundable = self.balances[base] - self.locked(base) >= amount
+            if not fundable:
+                raise RuntimeError('Failed to create order to %s %s %s' % (type, amount, base))
+
+            order_id = str(self.next_order_id)
+            self.next_order_id += 1
+            self.paper_orders[order_id] = {'orderid': order_id, 'symbol': pair, 'type': type, 'order': order,
+                                           'amount': float(amount), 'price': float(price),
+                                           'total': float(amount) * float(price)}
+
+        # A limit order priced through the market fills straight away.
+        if pair in self.last_instrument:
+            self.match(self.last_instrument[pair])
+
+        return {'status': 'success', 'orderid': order_id}
+
+    def cancel_orders(self, order_ids):
+        for order_id in order_ids:
+            self.simulate_call('cancelOrder')
+            with self.lock:
+                if self.paper_orders.pop(str(order_id), None) is None:
+                    raise RuntimeError('Failed to cancel order %s' % order_id)
+
+    def cancel_orders_concurrently(self, order_ids, timeout, max_workers=8, independent=False):
+        with self.lock:
+            for order_id in order_ids:
+                self.calls['cancelOrder'] += 1
+                self.paper_orders.pop(str(order_id), None)
+        return []
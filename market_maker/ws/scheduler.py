@@ -0,0 +1,215 @@
+"""Outbound request scheduler: priority classes, rate-limit admission and per-class latency."""
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+
+from market_maker.settings import settings
+from market_maker.utils.clock import get_clock
+from market_maker.utils.errors import DeadlineExceeded
+
+logger = logging.getLogger('root')
+
+# Priority classes, most urgent first.
+CANCEL = 0
+ORDER = 1
+MARKET_DATA = 2
+ACCOUNT = 3
+
+CLASS_NAMES = {CANCEL: 'cancel', ORDER: 'order', MARKET_DATA: 'marketData', ACCOUNT: 'account'}
+
+ENDPOINT_CLASSES = {
+    'cancelOrder': CANCEL,
+    'createOrder': ORDER,
+    'getCurrencies': MARKET_DATA,
+    'getPairDetails': MARKET_DATA,
+    'getMarketHistory': MARKET_DATA,
+    'getBuyOrders': MARKET_DATA,
+    'getSellOrders': MARKET_DATA,
+}
+# Anything else (balances, open orders, our trade/cancel/deposit history...) is an account read.
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(base_url, clock=None):
+    """The shared Scheduler for `base_url`, created on first use. The rate limit is per account, so every
+       FxAdkImpl talking to the same host shares one."""
+    with _schedulers_lock:
+        if base_url not in _schedulers:
+            _schedulers[base_url] = Scheduler(settings.RATE_LIMIT_PER_MINUTE, settings.RATE_LIMIT_BURST,
+                                              settings.CANCEL_RESERVED_TOKENS, settings.SCHEDULER_WORKERS, clock)
+        return _schedulers[base_url]
+
+
+def request_class(endpoint):
+    return ENDPOINT_CLASSES.get(endpoint, ACCOUNT)
+
+
+class TokenBucket(object):
+
+    """`rate_per_minute` tokens a minute, holding at most `burst`. Not thread safe; the Scheduler locks it."""
+
+    def __init__(self, rate_per_minute, burst, clock=None):
+        self.clock = clock or get_clock()
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = self.clock.time()
+
+    def refill(self):
+        now = self.clock.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, keep=0):
+        """Seconds until a token can be taken while leaving `keep` in the bucket."""
+        self.refill()
+        missing = keep + 1 - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Job(object):
+    def __init__(self, priority, fn, clock, deadline=None):
+        self.priority = priority
+        self.fn = fn
+        self.clock = clock
+        self.deadline = deadline
+        self.submitted = clock.time()
+        self.started = None  # set by the worker that takes it, under the Scheduler's lock
+        self.abandoned = False  # the submitter stopped waiting before it started
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def expired(self):
+        return self.deadline is not None and self.deadline.remaining() <= 0
+
+    def expire(self):
+        self.error = DeadlineExceeded('%s stage out of time waiting to be sent' % self.deadline.name)
+        self.done.set()
+
+    def run(self):
+        try:
+            self.result = self.fn()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+class ClassStats(object):
+
+    """Queue wait and total latency of the last `window` requests of one class."""
+
+    def __init__(self, window=500):
+        self.count = 0
+        self.waits = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+
+    def add(self, wait, latency):
+        self.count += 1
+        self.waits.append(wait)
+        self.latencies.append(latency)
+
+    @staticmethod
+    def percentile(values, p):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 4)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'waitP50': self.percentile(self.waits, 0.5),
+            'waitP99': self.percentile(self.waits, 0.99),
+            'latencyP50': self.percentile(self.latencies, 0.5),
+            'latencyP99': self.percentile(self.latencies, 0.99),
+        }
+
+
+class Scheduler(object):
+
+    """Sends requests in priority order within the exchange's rate limit.
+
+    Callers submit a function and block until it has run. Worker threads always take the most urgent queued
+    request next, so a risk cancel never waits behind routine polling - only behind requests already on the wire.
+    Admission is a token bucket: RATE_LIMIT_PER_MINUTE tokens a minute, up to RATE_LIMIT_BURST at once. Every
+    class except cancels must leave CANCEL_RESERVED_TOKENS in the bucket, so there is always room to pull quotes.
+
+    A request submitted with a deadline waits no longer than the deadline for its turn, and is dropped without
+    spending a token once the deadline has passed.
+    """
+
+    def __init__(self, rate_per_minute, burst, cancel_reserve=1, workers=4, clock=None):
+        self.clock = clock or get_clock()
+        self.bucket = TokenBucket(rate_per_minute, burst, self.clock)
+        self.cancel_reserve = min(cancel_reserve, burst - 1)
+        self.cond = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.stats_by_class = dict((c, ClassStats()) for c in CLASS_NAMES)
+
+        for i in range(workers):
+            threading.Thread(target=self.work, name='scheduler-%d' % i, daemon=True).start()
+
+    def submit(self, priority, fn, deadline=None):
+        """Queue `fn` at `priority` and wait for it. Returns its result or raises its exception.
+           Raises DeadlineExceeded if `deadline` passes before `fn` has started."""
+        job = _Job(priority, fn, self.clock, deadline)
+        with self.cond:
+            heapq.heappush(self.queue, (priority, next(self.sequence), job))
+            self.cond.notify()
+        if not job.done.wait(deadline.remaining() if deadline is not None else None):
+            with self.cond:
+                if job.started is None:
+                    job.abandoned = True
+                    raise DeadlineExceeded('%s stage out of time waiting to be sent' % deadline.name)
+            # Already on the wire: its own timeout is bounded by the same deadline.
+            job.done.wait()
+
+        finished = self.clock.time()
+        with self.cond:
+            if job.started is not None:
+                self.stats_by_class[priority].add(job.started - job.submitted, finished - job.submitted)
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def work(self):
+        while True:
+            with self.cond:
+                while True:
+                    while not self.queue:
+                        self.cond.wait()
+                    # Look at the most urgent request each time a token may be free or a request is submitted;
+                    # a cancel queued while we wait goes ahead of whatever was first when we started waiting.
+                    priority, _, job = self.queue[0]
+                    if job.abandoned or job.expired():
+                        # Out of time: drop it rather than spend a token on a request that would only fail.
+                        heapq.heappop(self.queue)
+                        if not job.abandoned:
+                            job.expire()
+                        continue
+                    wait = self.bucket.wait_time(0 if priority == CANCEL else self.cancel_reserve)
+                    if wait <= 0:
+                        break
+                    if job.deadline is not None:
+                        wait = min(wait, max(job.deadline.remaining(), 0))
+                    self.clock.wait(self.cond, wait)
+                self.bucket.take()
+                heapq.heappop(self.queue)
+                job.started = self.clock.time()
+            job.run()
+
+    def stats(self):
+        with self.cond:
+            stats = dict((CLASS_NAMES[c], s.snapshot()) for c, s in self.stats_by_class.items() if s.count)
+            stats['queued'] = len(self.queue)
+            return stats
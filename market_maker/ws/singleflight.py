@@ -0,0 +1,69 @@
+"""Single-flight: concurrent identical reads share one in-flight request."""
+import threading
+
+from market_maker.utils.errors import DeadlineExceeded
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the function; callers that arrive while it is in flight wait
+    for it and get the same result, or the same exception - except a leader running out of its own tick deadline,
+    in which case a waiting caller tries again itself. A caller with a deadline waits no longer than it has left.
+    Nothing is cached - once the leader returns, the next
+    call for that key goes to the exchange again. Results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, deadline=None):
+        """Run `fn()` unless a call for `key` is already in flight. Returns (result, leader).
+           `deadline` (a utils.deadline.Deadline) bounds the wait for someone else's call."""
+        with self.lock:
+            self.calls += 1
+            call = self.in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self.in_flight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(deadline.remaining() if deadline is not None else None):
+                raise DeadlineExceeded('%s stage out of time waiting for a shared read' % deadline.name)
+            if isinstance(call.error, DeadlineExceeded):
+                return self.do(key, fn, deadline)  # the leader's deadline, not ours
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'coalescedRatio': float(self.coalesced) / self.calls if self.calls else None,
+            }
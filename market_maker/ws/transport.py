@@ -0,0 +1,117 @@
+"""HTTP transport: one pooled, keep-alive connection set per API host."""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from market_maker.settings import settings
+
+logger = logging.getLogger('root')
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(base_url):
+    """The shared Transport for `base_url`, created on first use."""
+    with _transports_lock:
+        if base_url not in _transports:
+            _transports[base_url] = Transport(base_url, pool_size(), settings.HTTP2)
+        return _transports[base_url]
+
+
+def pool_size():
+    """HTTP_POOL_SIZE, or enough connections for every thread that may call the API at once."""
+    if settings.HTTP_POOL_SIZE:
+        return settings.HTTP_POOL_SIZE
+    return max(10, settings.SHUTDOWN_CANCEL_WORKERS + 2)
+
+
+class Transport(object):
+
+    """Keep-alive connection pool to one host.
+
+    Uses a requests Session with a pool sized for our concurrency, or an HTTP/2 httpx client if `http2` is set
+    and httpx (with its http2 extra) is installed. Either way, failed connection attempts are retried up to
+    CONNECT_RETRIES times; requests that reached the server are not (every call here is a POST).
+    Counts requests and, over HTTP/1.1, reads the pool's count of connections opened, so connection reuse can be
+    reported - every new connection is a TCP + TLS handshake. These are totals for the pool: with requests in
+    flight on several threads, which request opened a connection isn't known. httpx doesn't expose its
+    connections, so over HTTP/2 they are not counted.
+    """
+
+    CONNECT_RETRIES = 5
+
+    def __init__(self, base_url, pool_size=10, http2=False):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.client = None
+
+        if http2:
+            try:
+                import httpx
+                limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+                self.client = httpx.Client(transport=httpx.HTTPTransport(http2=True, limits=limits,
+                                                                         retries=self.CONNECT_RETRIES))
+            except ImportError:
+                logger.warning("HTTP2 is set but httpx[http2] is not installed; using HTTP/1.1.")
+
+        if self.client is None:
+            # urllib3 never retries a POST on its status or after it was sent, so this only retries connecting.
+            retries = Retry(total=self.CONNECT_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+            self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+            self.session = requests.Session()
+            self.session.mount(base_url, self.adapter)
+
+    def connection_count(self):
+        """Connections opened so far to this host (HTTP/1.1 only)."""
+        if self.client is not None:
+            return 0
+        pool = self.adapter.poolmanager.connection_from_url(self.base_url)
+        return pool.num_connections
+
+    def post(self, url, data, timeout=None):
+        """POST form data. Returns the response object."""
+        if self.client is not None:
+            res = self.client.post(url, data=data, timeout=timeout)
+        else:
+            res = self.session.post(url, data, timeout=timeout)
+        with self.lock:
+            self.requests += 1
+        return res
+
+    def prewarm(self, connections):
+        """Open `connections` connections in parallel now, so the first real requests don't pay for handshakes."""
+        def warm():
+            with self.lock:
+                self.requests += 1
+            try:
+                if self.client is not None:
+                    self.client.head(self.base_url)
+                else:
+                    self.session.head(self.base_url, timeout=settings.TIMEOUT)
+            except Exception as e:
+                logger.debug("Pre-warming %s failed: %s" % (self.base_url, e))
+
+        threads = [threading.Thread(target=warm, daemon=True) for _ in range(min(connections, self.pool_size))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(settings.TIMEOUT)
+
+    def stats(self):
+        """Requests sent and connection reuse over the whole pool; the connection figures are None over HTTP/2."""
+        with self.lock:
+            requests_sent = self.requests
+        if self.client is not None:
+            return {'requests': requests_sent, 'newConnections': None, 'reuseRatio': None}
+        new_connections = self.connection_count()
+        return {
+            'requests': requests_sent,
+            'newConnections': new_connections,
+            'reuseRatio': max(0.0, 1 - float(new_connections) / requests_sent) if requests_sent else None,
+        }
@@ -1,29 +1,25 @@
-import sys
 import threading
-import traceback
-import ssl
-from time import sleep
-import json
-import decimal
+import queue
+from time import time
 import logging
 from market_maker.settings import settings
-from market_maker.auth.APIKeyAuth import generate_expires, generate_signature
-from market_maker.utils.log import setup_custom_logger
-from market_maker.utils.math import toNearest
-from future.utils import iteritems
+from market_maker.utils.fastjson import OrderRecord, TradeRecord
+from market_maker.utils.funding import balances_from_funds
 from .fxadk_impl import FxAdkImpl
-from future.standard_library import hooks
-with hooks():  # Python 2/3 compat
-    from urllib.parse import urlparse, urlunparse
+from .transport import Transport
+from .md_bus import MarketDataReader, bus_path
 
 # FxADK REST API stuffed into Bitmex Websocket format
 
 
 class FxADKInterface:
-    def __init__(self):
+    def __init__(self, clock=None):
         self.logger = logging.getLogger('root')
         self.__reset()
-        self.fx_adk_api = FxAdkImpl(settings.API_KEY, settings.API_SECRET)
+        self.fx_adk_api = FxAdkImpl(settings.API_KEY, settings.API_SECRET, settings.BASE_URL, clock)
+        self.md_readers = {}
+        if settings.HTTP_PREWARM_CONNECTIONS:
+            self.fx_adk_api.transport.prewarm(settings.HTTP_PREWARM_CONNECTIONS)
 
     def __del__(self):
         self.exit()
@@ -42,7 +38,29 @@ class FxADKInterface:
 
         return last_price
 
+    @staticmethod
+    def get_book_levels(orders):
+        """(price, size) for each non-empty level, in the order the API returns them (best first)."""
+        levels = []
+        for order in orders:
+            if 'total' in order and float(order['total']):
+                price = float(order['price'])
+                size = float(order['amount']) if 'amount' in order else float(order['total']) / price
+                levels.append((price, size))
+        return levels
+
     def get_instrument(self, symbol):
+        """With MD_BUS, from the shared market data bus while it is fresh; from REST otherwise."""
+        if settings.MD_BUS:
+            if symbol not in self.md_readers:
+                self.md_readers[symbol] = MarketDataReader(bus_path(symbol), self.fx_adk_api.clock)
+            instrument = self.md_readers[symbol].instrument(symbol, settings.MD_BUS_MAX_AGE)
+            if instrument is not None:
+                return instrument
+            self.logger.debug("No fresh market data on the bus for %s; fetching it." % symbol)
+        return self.fetch_instrument(symbol)
+
+    def fetch_instrument(self, symbol):
         pair_details = self.fx_adk_api.get_pair_details(symbol)
         buy_orders = self.fx_adk_api.get_buy_orders(symbol)
         sell_orders = self.fx_adk_api.get_sell_orders(symbol)
@@ -66,6 +84,8 @@ class FxADKInterface:
             'askPrice': ask,
             'midPrice': (bid + ask) / 2,
             'tickSize': 0.00000001,
+            'bids': self.get_book_levels(buy_order_list),
+            'asks': self.get_book_levels(sell_order_list),
         }
 
     def get_ticker(self, symbol):
@@ -98,13 +118,8 @@ class FxADKInterface:
         if res == 'No elements to show':
             return []
 
-        for order in res:
-            order['amount'] = float(order['amount'])
-            order['price'] = float(order['price'])
-            order['total'] = float(order['total'])
-            order['type'] = order['type'].lower()
-
-        return res
+        # Numeric fields are converted when read, not up front.
+        return [OrderRecord(order) for order in res]
 
     def position(self, symbol, qty_only=False):
         # get current quantity of first asset in pair
@@ -112,16 +127,11 @@ class FxADKInterface:
         asset_symbol = symbol.split('/')[0]
 
         funds = self.funds()
-
-        current_qty = 0.0
-
-        for fund in funds:
-            if fund['symbol'] == asset_symbol:
-                current_qty = float(fund['balance'])
-                break
+        balances = balances_from_funds(funds)
+        current_qty = balances.get(asset_symbol, 0.0)
 
         if qty_only:
-            return {'currentQty': current_qty, 'symbol': symbol}
+            return {'currentQty': current_qty, 'symbol': symbol, 'balances': balances}
 
         # get average cost based on pair trading history
         trades = self.recent_trades(symbol)
@@ -143,7 +153,8 @@ class FxADKInterface:
 
         average_cost = total_cost / quantity_reviewed if quantity_reviewed else 0.0
 
-        return {'avgCostPrice': average_cost, 'avgEntryPrice': average_cost, 'currentQty': current_qty, 'symbol': symbol}
+        return {'avgCostPrice': average_cost, 'avgEntryPrice': average_cost, 'currentQty': current_qty, 'symbol': symbol,
+                'balances': balances}
 
     def recent_trades(self, symbol):
         res = self.fx_adk_api.get_trade_history(symbol)['message']
@@ -151,15 +162,58 @@ class FxADKInterface:
         if res == 'No elements to show':
             return []
 
-        for recent_trade in res:
-            recent_trade['type'] = recent_trade['type'].lower()
-
-        return res
+        return [TradeRecord(trade) for trade in res]
 
     def cancel_orders(self, order_ids):
         for order_id in order_ids:
             self.fx_adk_api.cancel_order(order_id)
 
+    def cancel_orders_concurrently(self, order_ids, timeout, max_workers=8, independent=False):
+        """Cancel orders in parallel, skipping the rest interval, and give up after `timeout` seconds.
+
+        Workers are daemon threads so a hung request can't hold up process exit.
+        With `independent`, the cancels go over a connection pool of their own rather than the shared one,
+        which may be what a stalled bot is stuck on.
+        Returns the ids whose cancellation was not confirmed in time.
+        """
+        api = self.independent_api(max_workers) if independent else self.fx_adk_api
+        pending = queue.Queue()
+        for order_id in order_ids:
+            pending.put(order_id)
+
+        confirmed = set()
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                try:
+                    order_id = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    api.cancel_order(order_id, rest=False)
+                except Exception as e:
+                    self.logger.warning("Cancel of %s failed: %s" % (order_id, e))
+                else:
+                    with lock:
+                        confirmed.add(order_id)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(max_workers, len(order_ids)))]
+        deadline = time() + timeout
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(max(0, deadline - time()))
+
+        with lock:
+            return [order_id for order_id in order_ids if order_id not in confirmed]
+
+    def independent_api(self, pool_size):
+        """A client with its own connections to the API host and no place in the shared scheduler's queue."""
+        transport = Transport(settings.BASE_URL, pool_size, settings.HTTP2)
+        return FxAdkImpl(settings.API_KEY, settings.API_SECRET, settings.BASE_URL, self.fx_adk_api.clock, transport,
+                         scheduled=False)
+
     def create_order(self, amount=0.0, price=0.0, order='limit', type='buy', pair='ADK/BTC'):
         return self.fx_adk_api.create_order(amount=amount, price=price, order=order, type=type, pair=pair)
 
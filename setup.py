@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 from setuptools import setup
+from setuptools.command.build_py import build_py
 from os.path import dirname, join
+import subprocess
 
 import market_maker
 
@@ -8,6 +10,20 @@ import market_maker
 here = dirname(__file__)
 
 
+class BuildPyWithVersion(build_py):
+    """Bake `git describe` into market_maker/utils/_version.py so the installed bot never shells out to git."""
+
+    def run(self):
+        build_py.run(self)
+        try:
+            version = subprocess.check_output(["git", "describe", "--tags"],
+                                              stderr=subprocess.DEVNULL).decode('utf8').strip()
+        except Exception:
+            return  # not a git checkout; constants.get_version() falls back to its default
+        with open(join(self.build_lib, 'market_maker', 'utils', '_version.py'), 'w') as f:
+            f.write('VERSION = %r\n' % version)
+
+
 setup(name='bitmex-market-maker',
       version=market_maker.__version__,
       description='Market making bot for BitMEX API',
@@ -21,8 +37,13 @@ setup(name='bitmex-market-maker',
           'websocket-client',
           'future'
       ],
+      extras_require={
+          # marketmaker-tca
+          'analytics': ['numpy'],
+      },
       packages=['market_maker', 'market_maker.auth', 'market_maker.utils', 'market_maker.ws'],
+      cmdclass={'build_py': BuildPyWithVersion},
       entry_points={
-          'console_scripts': ['marketmaker = market_maker:run']
+          'console_scripts': ['marketmaker = market_maker:run', 'marketmaker-tca = market_maker.tca:main']
       }
       )
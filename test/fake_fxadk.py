@@ -0,0 +1,385 @@
+"""A local stand-in for the FxADK REST API, for offline, load and fault-injection testing.
+
+Implements the endpoints FxAdkImpl calls, with a stateful order book: limit orders cross against resting
+liquidity (partial fills included) and rest otherwise, balances are locked and settled, and every fill shows up
+in getTradeHistory. Faults can be injected per request: latency and jitter, 429s over a per-key rate limit, 5xx
+errors and truncated JSON.
+
+Run it on its own and point BASE_URL at it:
+
+    python test/fake_fxadk.py --port 8765 --latency 0.05 --error-rate 0.02
+    # settings.py: BASE_URL = 'http://127.0.0.1:8765/api/'
+
+or start it in-process with `serve()`, as test/fxadk-load-test.py does.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+
+
+class Faults(object):
+    """What to inject into responses. Rates are probabilities per request."""
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=None, error_rate=0.0, malformed_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit  # requests per minute per API key, or None
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+
+
+class FakeExchange(object):
+
+    """Order books, balances and history for one account, behind one lock."""
+
+    def __init__(self, pairs=('ADK/BTC',), price=0.00001, balances=None, fee=0.001, depth=10, seed=None):
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.fee = fee
+        self.balances = Counter(balances or {})
+        self.books = {}
+        self.last_price = {}
+        self.orders = {}  # orderid -> our resting order
+        self.trades = []  # our fills, newest first
+        self.cancelled = []
+        self.next_order_id = 1
+
+        for pair in pairs:
+            base, quote = pair.split('/')
+            self.balances.setdefault(base, 100000.0)
+            self.balances.setdefault(quote, 10.0)
+            self.books[pair] = {'buy': [], 'sell': []}
+            self.last_price[pair] = price
+            self.seed_book(pair, price, depth)
+
+    def seed_book(self, pair, price, depth):
+        """Resting liquidity from other participants, 0.5% apart either side of `price`."""
+        for i in range(1, depth + 1):
+            for side, sign in (('buy', -1), ('sell', 1)):
+                level = round(price * (1 + sign * 0.005 * i), 8)
+                self.rest({'orderid': None, 'pair': pair, 'type': side, 'price': level,
+                           'amount': float(self.random.randint(100, 5000))})
+
+    def rest(self, order):
+        """Add `order` to its book, best price first, then time priority."""
+        book = self.books[order['pair']][order['type']]
+        better = (lambda a, b: a > b) if order['type'] == 'buy' else (lambda a, b: a < b)
+        index = len(book)
+        for i, resting in enumerate(book):
+            if better(order['price'], resting['price']):
+                index = i
+                break
+        book.insert(index, order)
+
+    #
+    # Matching
+    #
+    def create_order(self, pair, side, amount, price):
+        base, quote = pair.split('/')
+        if amount <= 0 or price <= 0:
+            return {'status': 'error', 'message': 'Invalid amount or price'}
+        if side == 'buy' and self.available(quote) < amount * price * (1 + self.fee):
+            return {'status': 'error', 'message': 'Insufficient %s balance' % quote}
+        if side == 'sell' and self.available(base) < amount:
+            return {'status': 'error', 'message': 'Insufficient %s balance' % base}
+
+        order_id = str(self.next_order_id)
+        self.next_order_id += 1
+        order = {'orderid': order_id, 'pair': pair, 'type': side, 'price': price, 'amount': amount,
+                 'date': time.time()}
+
+        opposite = self.books[pair]['sell' if side == 'buy' else 'buy']
+        crosses = (lambda p: p <= price) if side == 'buy' else (lambda p: p >= price)
+        while order['amount'] > 0 and opposite and crosses(opposite[0]['price']):
+            maker = opposite[0]
+            amount_filled = min(order['amount'], maker['amount'])
+            self.trade(order, maker, amount_filled, maker['price'])
+            if maker['amount'] <= 0:
+                opposite.pop(0)
+                self.orders.pop(maker['orderid'], None)
+
+        if order['amount'] > 0:
+            self.orders[order_id] = order
+            self.rest(order)
+        return {'status': 'success', 'orderid': order_id}
+
+    def trade(self, taker, maker, amount, price):
+        """Fill `amount` between `taker` and `maker` at `price`, settling whichever side is ours."""
+        taker['amount'] -= amount
+        maker['amount'] -= amount
+        self.last_price[taker['pair']] = price
+        for order in (taker, maker):
+            if order['orderid'] is not None:
+                self.settle(order, amount, price)
+
+    def settle(self, order, amount, price):
+        base, quote = order['pair'].split('/')
+        total = amount * price
+        fees = total * self.fee
+        if order['type'] == 'buy':
+            self.balances[base] += amount
+            self.balances[quote] -= total + fees
+        else:
+            self.balances[base] -= amount
+            self.balances[quote] += total - fees
+        self.trades.insert(0, {'orderid': order['orderid'], 'pair': order['pair'], 'type': order['type'],
+                               'price': '%.8f' % price, 'amount': '%.8f' % amount, 'total': '%.8f' % total,
+                               'fees': '%.8f' % fees, 'date': time.strftime('%Y-%m-%d %H:%M:%S')})
+        del self.trades[500:]
+
+    def take(self, pair):
+        """Someone else sends a small market order, so resting orders (ours included) get filled over time."""
+        side = self.random.choice(('buy', 'sell'))
+        book = self.books[pair]['sell' if side == 'buy' else 'buy']
+        if not book:
+            return
+        taker = {'orderid': None, 'pair': pair, 'type': side, 'amount': float(self.random.randint(10, 500))}
+        while taker['amount'] > 0 and book:
+            maker = book[0]
+            self.trade(taker, maker, min(taker['amount'], maker['amount']), maker['price'])
+            if maker['amount'] <= 0:
+                book.pop(0)
+                self.orders.pop(maker['orderid'], None)
+        # Replenish the other participants' side so the book never runs dry.
+        if len(book) < 5:
+            self.seed_book(pair, self.last_price[pair], 5)
+
+    def cancel_order(self, order_id):
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return {'status': 'error', 'message': 'Order not found'}
+        self.books[order['pair']][order['type']].remove(order)
+        self.cancelled.insert(0, dict(order, status='cancelled'))
+        del self.cancelled[500:]
+        return {'status': 'success'}
+
+    def available(self, asset):
+        """Balance of `asset` not locked in our resting orders."""
+        locked = 0.0
+        for order in self.orders.values():
+            base, quote = order['pair'].split('/')
+            if order['type'] == 'buy' and quote == asset:
+                locked += order['amount'] * order['price'] * (1 + self.fee)
+            elif order['type'] == 'sell' and base == asset:
+                locked += order['amount']
+        return self.balances[asset] - locked
+
+    #
+    # Views, in the API's response format
+    #
+    def levels(self, pair, side):
+        """The book aggregated by price, best first."""
+        levels = []
+        for order in self.books[pair][side]:
+            if levels and levels[-1][0] == order['price']:
+                levels[-1][1] += order['amount']
+            else:
+                levels.append([order['price'], order['amount']])
+        return [{'price': '%.8f' % price, 'amount': '%.8f' % amount, 'total': '%.8f' % (price * amount)}
+                for price, amount in levels]
+
+    def open_orders(self, pair):
+        return [{'orderid': o['orderid'], 'pair': pair, 'type': o['type'], 'price': '%.8f' % o['price'],
+                 'amount': '%.8f' % o['amount'], 'total': '%.8f' % (o['price'] * o['amount'])}
+                for o in self.orders.values() if o['pair'] == pair]
+
+    def handle(self, endpoint, params):
+        """Response for `endpoint` called with form `params`, or None if there is no such endpoint."""
+        pair = params.get('pair', 'ADK/BTC').replace('_', '/')
+        if 'pair' in params and pair not in self.books:
+            return {'status': 'error', 'message': 'Invalid pair'}
+
+        def listing(items):
+            return {'status': 'success', 'message': items or 'No elements to show'}
+
+        with self.lock:
+            if endpoint == 'getCurrencies':
+                return listing([{'symbol': asset} for asset in sorted(self.balances)])
+            if endpoint == 'getPairDetails':
+                return {'status': 'success', 'message': {'trade_data': {'lastprice': '%.8f' % self.last_price[pair]}}}
+            if endpoint == 'getMarketHistory':
+                return listing([])
+            if endpoint == 'getBuyOrders':
+                return {'status': 'success', 'message': {'buy_orders': self.levels(pair, 'buy')}}
+            if endpoint == 'getSellOrders':
+                return {'status': 'success', 'message': {'sell_orders': self.levels(pair, 'sell')}}
+            if endpoint == 'createOrder':
+                try:
+                    amount, price = float(params.get('amount', 0)), float(params.get('price', 0))
+                except ValueError:
+                    return {'status': 'error', 'message': 'Invalid amount or price'}
+                return self.create_order(pair, params.get('type', 'buy'), amount, price)
+            if endpoint == 'cancelOrder':
+                return self.cancel_order(params.get('orderid', ''))
+            if endpoint == 'getOpenOrders':
+                return listing(self.open_orders(pair))
+            if endpoint == 'getTradeHistory':
+                return listing([t for t in self.trades if t['pair'] == pair])
+            if endpoint == 'getCancelHistory':
+                return listing([c for c in self.cancelled if c['pair'] == pair])
+            if endpoint == 'getStopOrders':
+                return listing([])
+            if endpoint in ('getWithdrawhistory', 'getDeposithistory'):
+                return listing([])
+            if endpoint == 'getAccountbalance':
+                return listing([{'symbol': asset, 'balance': '%.8f' % balance}
+                                for asset, balance in sorted(self.balances.items())])
+        return None
+
+
+class FakeFxADKServer(ThreadingMixIn, HTTPServer):
+
+    """Serves a FakeExchange at http://host:port/api/<endpoint>, injecting `faults`."""
+
+    daemon_threads = True
+
+    def __init__(self, address, exchange=None, faults=None, api_key=None, api_secret=None):
+        HTTPServer.__init__(self, address, Handler)
+        self.exchange = exchange or FakeExchange()
+        self.faults = faults or Faults()
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.random = random.Random()
+        self.recent = {}  # api_key -> deque of request times in the last minute
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d/api/' % self.server_address[:2]
+
+    def rate_limited(self, api_key):
+        if not self.faults.rate_limit:
+            return False
+        now = time.time()
+        with self.lock:
+            recent = self.recent.setdefault(api_key, deque())
+            while recent and recent[0] < now - 60:
+                recent.popleft()
+            if len(recent) >= self.faults.rate_limit:
+                return True
+            recent.append(now)
+            return False
+
+    def count(self, what):
+        with self.lock:
+            self.counts[what] += 1
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown out the client's own logs
+
+    def do_HEAD(self):
+        # Connection pre-warming.
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        faults = server.faults
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict((k, v[0]) for k, v in parse_qs(self.rfile.read(length).decode('utf8')).items())
+        endpoint = self.path.rstrip('/').rsplit('/', 1)[-1]
+        server.count(endpoint)
+
+        if faults.latency or faults.jitter:
+            time.sleep(faults.latency + server.random.uniform(0, faults.jitter))
+
+        if server.rate_limited(params.get('api_key')):
+            server.count('429')
+            return self.reply(429, {'status': 'error', 'message': 'Too many requests'})
+        if server.random.random() < faults.error_rate:
+            server.count('5xx')
+            return self.reply(server.random.choice((500, 502, 503)), {'status': 'error', 'message': 'Server error'})
+
+        if not params.get('api_key') or (server.api_key and (params.get('api_key'), params.get('api_secret')) !=
+                                         (server.api_key, server.api_secret)):
+            server.count('401')
+            return self.reply(200, {'status': 'error', 'message': 'Invalid API key'})
+
+        response = server.exchange.handle(endpoint, params)
+        if response is None:
+            server.count('404')
+            return self.reply(404, {'status': 'error', 'message': 'Unknown endpoint %s' % endpoint})
+
+        if server.random.random() < faults.malformed_rate:
+            server.count('malformed')
+            return self.reply(200, response, malformed=True)
+        self.reply(200, response)
+
+    def reply(self, status, body, malformed=False):
+        content = json.dumps(body).encode('utf8')
+        if malformed:
+            content = content[:max(1, len(content) // 2)]
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def serve(port=0, exchange=None, faults=None, taker_interval=None, **kwargs):
+    """Start a FakeFxADKServer on a background thread (port 0 picks a free one) and return it.
+
+    With `taker_interval`, another participant takes liquidity every that many seconds, so resting orders fill.
+    Stop it with server.shutdown().
+    """
+    server = FakeFxADKServer(('127.0.0.1', port), exchange, faults, **kwargs)
+    threading.Thread(target=server.serve_forever, name='fake-fxadk', daemon=True).start()
+
+    if taker_interval:
+        def take():
+            while True:
+                time.sleep(taker_interval)
+                with server.exchange.lock:
+                    for pair in server.exchange.books:
+                        server.exchange.take(pair)
+        threading.Thread(target=take, name='fake-fxadk-taker', daemon=True).start()
+    return server
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds, uniformly')
+    parser.add_argument('--rate-limit', type=int, default=None, help='requests per minute per API key before 429s')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 5xx')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of responses with truncated JSON')
+    parser.add_argument('--pair', action='append', help='pair to list (repeatable), default ADK/BTC')
+    parser.add_argument('--price', type=float, default=0.00001, help='starting price of every pair')
+    parser.add_argument('--taker-interval', type=float, default=None,
+                        help='seconds between other participants\' market orders')
+
+
+def from_arguments(args, port=0):
+    faults = Faults(args.latency, args.jitter, args.rate_limit, args.error_rate, args.malformed_rate)
+    exchange = FakeExchange(pairs=args.pair or ('ADK/BTC',), price=args.price)
+    return serve(port, exchange, faults, args.taker_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = from_arguments(args, args.port)
+    print('Fake FxADK listening on %s' % server.base_url)
+    try:
+        while True:
+            time.sleep(60)
+            print('Requests: %s' % dict(server.counts))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Load test: bot-like ticks against the fake FxADK server, through the real client stack.
+
+Starts test/fake_fxadk.py in-process (or uses --url), then runs --bots threads for --duration seconds. Each
+tick does what OrderManager does: fetch the instrument, our open orders and balances, cancel our orders and
+place a fresh buy and sell around the mid. Reports tick and request throughput, p50/p99/max latency per
+operation, client errors by type and what the server injected.
+
+    python test/fxadk-load-test.py --bots 4 --duration 30 --latency 0.05 --error-rate 0.02 --malformed-rate 0.01
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import fake_fxadk
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else float('nan')
+
+
+class Recorder(object):
+    """Latencies per operation and errors per type, from every bot thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+
+    def timed(self, name, fn, *args, **kwargs):
+        started = time.time()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            with self.lock:
+                self.errors['%s: %s' % (name, type(e).__name__)] += 1
+            raise
+        finally:
+            with self.lock:
+                self.latencies[name].append(time.time() - started)
+
+
+def bot(interface, pair, recorder, stop):
+    """Tick until `stop` is set. Orders are sized small so balances last the whole run."""
+    while not stop.is_set():
+        try:
+            tick_started = time.time()
+            instrument = recorder.timed('getInstrument', interface.get_instrument, pair)
+            orders = recorder.timed('getOpenOrders', interface.open_orders, pair)
+            recorder.timed('getAccountbalance', interface.funds)
+            for order in orders:
+                recorder.timed('cancelOrder', interface.fx_adk_api.cancel_order, order['orderid'])
+            tick_size = instrument['tickSize']
+            recorder.timed('createOrder', interface.create_order, amount=10, type='buy', pair=pair,
+                           price=round(instrument['bidPrice'] - tick_size, 8))
+            recorder.timed('createOrder', interface.create_order, amount=10, type='sell', pair=pair,
+                           price=round(instrument['askPrice'] + tick_size, 8))
+            with recorder.lock:
+                recorder.latencies['tick'].append(time.time() - tick_started)
+        except Exception:
+            pass  # counted by the recorder; carry on like the bot's loop would
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='API to test against instead of starting the fake server')
+    parser.add_argument('--bots', type=int, default=4, help='concurrent bot threads')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run for')
+    parser.add_argument('--client-rate-limit', type=int, default=None,
+                        help='RATE_LIMIT_PER_MINUTE for the client scheduler (default: no scheduler)')
+    parser.add_argument('--retry-interval', type=float, default=0.1, help='API_ERROR_INTERVAL for the client')
+    fake_fxadk.add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        server = fake_fxadk.from_arguments(args)
+        base_url = server.base_url
+    pair = (args.pair or ['ADK/BTC'])[0]
+
+    # market_maker reads sys.argv[1] as a symbol when loading settings.
+    sys.argv = sys.argv[:1]
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from market_maker.settings import settings
+    settings.update(BASE_URL=base_url, API_KEY=settings.API_KEY or 'load-test', API_SECRET=settings.API_SECRET or 'x',
+                    API_REST_INTERVAL=0, API_ERROR_INTERVAL=args.retry_interval,
+                    RATE_LIMIT_PER_MINUTE=args.client_rate_limit, TICK_BUDGET=None)
+    from market_maker.ws.ws_thread import FxADKInterface
+    from market_maker.ws import fxadk_impl
+
+    recorder = Recorder()
+    stop = threading.Event()
+    interfaces = [FxADKInterface() for _ in range(args.bots)]
+    threads = [threading.Thread(target=bot, args=(i, pair, recorder, stop), daemon=True) for i in interfaces]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(settings.TIMEOUT * 2)
+    elapsed = time.time() - started
+
+    with recorder.lock:
+        ticks = len(recorder.latencies['tick'])
+        requests = sum(len(v) for k, v in recorder.latencies.items() if k != 'tick')
+        print('%d bots, %.1fs: %d ticks (%.2f/s), %d client calls (%.2f/s)' %
+              (args.bots, elapsed, ticks, ticks / elapsed, requests, requests / elapsed))
+        print('%-20s %8s %9s %9s %9s' % ('operation', 'count', 'p50 ms', 'p99 ms', 'max ms'))
+        for name in sorted(recorder.latencies):
+            values = recorder.latencies[name]
+            print('%-20s %8d %9.1f %9.1f %9.1f' % (name, len(values), percentile(values, 0.5) * 1000,
+                                                    percentile(values, 0.99) * 1000, max(values) * 1000))
+        if recorder.errors:
+            print('Client errors: %s' % dict(recorder.errors))
+    print('Coalesced reads: %s' % fxadk_impl.reads.stats())
+    if server is not None:
+        print('Server requests: %s' % dict(server.counts))
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import unittest
+
+from market_maker.market_maker import OrderManager
+from market_maker.settings import settings
+from market_maker.utils import funding
+from market_maker.utils.funding import FundsAllocator, balances_from_funds, order_funds
+from market_maker.utils.requote import RequoteFilter
+
+
+class FakeExchange(object):
+    """Just enough of ExchangeInterface for converge_orders: keeps the orders it is asked to place."""
+
+    symbol = 'ADK/BTC'
+
+    def __init__(self):
+        self.orders = []
+        self.calls = []
+        self.next_id = 1
+
+    def create_bulk_orders(self, orders):
+        self.calls.append(('create', len(orders)))
+        for order in orders:
+            self.orders.append(dict(order, orderid=str(self.next_id)))
+            self.next_id += 1
+
+    def amend_bulk_orders(self, orders):
+        self.calls.append(('amend', len(orders)))
+        self.cancel_bulk_orders(orders)
+        self.create_bulk_orders(orders)
+
+    def cancel_bulk_orders(self, orders):
+        cancelled = set(order['orderid'] for order in orders)
+        self.orders = [order for order in self.orders if order['orderid'] not in cancelled]
+
+
+def order_manager(exchange):
+    manager = OrderManager.__new__(OrderManager)
+    manager.exchange = exchange
+    manager.requote_filter = RequoteFilter(0.01, 0.5, 0.1)
+    manager.instrument = {'bidPrice': 0.00099, 'askPrice': 0.00101}
+    return manager
+
+
+class FundsAllocatorTest(unittest.TestCase):
+
+    def setUp(self):
+        funding._claims.clear()
+
+    def tearDown(self):
+        funding._claims.clear()
+
+    def test_order_funds(self):
+        self.assertEqual(order_funds('ADK/BTC', {'type': 'sell', 'amount': 5, 'price': 2.0}), ('ADK', 5.0))
+        asset, amount = order_funds('ADK/BTC', {'type': 'buy', 'amount': 5, 'price': 2.0}, 0.01)
+        self.assertEqual(asset, 'BTC')
+        self.assertAlmostEqual(amount, 10.1)
+
+    def test_balances_from_funds(self):
+        self.assertEqual(balances_from_funds([{'symbol': 'ADK', 'balance': '1.5'}]), {'ADK': 1.5})
+
+    def test_fund_grants_shrinks_then_refuses(self):
+        allocator = FundsAllocator('ADK/BTC', {'ADK': 10}, min_size=2)
+        self.assertEqual(allocator.fund({'type': 'sell', 'amount': 6, 'price': 1.0})['amount'], 6)
+        self.assertEqual(allocator.fund({'type': 'sell', 'amount': 6, 'price': 1.0})['amount'], 4.0)
+        self.assertIsNone(allocator.fund({'type': 'sell', 'amount': 1, 'price': 1.0}))
+        self.assertEqual((allocator.shrunk, allocator.refused), (1, 1))
+
+    def test_shrunk_below_min_size_is_refused(self):
+        allocator = FundsAllocator('ADK/BTC', {'BTC': 1.0}, min_size=5)
+        self.assertIsNone(allocator.fund({'type': 'buy', 'amount': 10, 'price': 0.25}))
+        self.assertEqual(allocator.available['BTC'], 1.0)
+
+    def test_fee_reserved_on_buys(self):
+        allocator = FundsAllocator('ADK/BTC', {'BTC': 1.0}, fee_reserve=0.25)
+        funded = allocator.fund({'type': 'buy', 'amount': 10, 'price': 0.1})
+        self.assertAlmostEqual(funded['amount'], 8.0)
+
+    def test_resting_orders_lock_and_release(self):
+        allocator = FundsAllocator('ADK/BTC', {'ADK': 10})
+        resting = {'type': 'sell', 'amount': 8, 'price': 1.0}
+        allocator.lock(resting)
+        self.assertEqual(allocator.fund({'type': 'sell', 'amount': 5, 'price': 1.0})['amount'], 2.0)
+        allocator.release(resting)
+        self.assertEqual(allocator.available['ADK'], 8.0)
+
+    def test_other_symbols_claims_are_taken_out(self):
+        first = FundsAllocator('ADK/BTC', {'BTC': 1.0, 'ADK': 0})
+        first.fund({'type': 'buy', 'amount': 6, 'price': 0.1})
+        first.publish()
+
+        second = FundsAllocator('ETH/BTC', {'BTC': 1.0, 'ETH': 0})
+        self.assertAlmostEqual(second.available['BTC'], 0.4)
+        # A symbol's own earlier claim is replaced, not stacked.
+        again = FundsAllocator('ADK/BTC', {'BTC': 1.0, 'ADK': 0})
+        self.assertAlmostEqual(again.available['BTC'], 1.0)
+
+
+class ConvergeWithBalancesTest(unittest.TestCase):
+
+    def setUp(self):
+        funding._claims.clear()
+
+    def test_shrunk_order_is_not_amended_every_tick(self):
+        exchange = FakeExchange()
+        manager = order_manager(exchange)
+        desired = [{'type': 'buy', 'amount': 100, 'price': 0.001, 'order': 'limit', 'symbol': 'ADK/BTC'}]
+        balances = {'BTC': 0.04, 'ADK': 0}
+
+        for _ in range(3):
+            manager.converge_orders(desired, [], [dict(o) for o in exchange.orders], balances)
+
+        self.assertEqual(exchange.calls, [('create', 1)])
+        self.assertEqual(len(exchange.orders), 1)
+        funded = 0.04 / (0.001 * (1 + settings.FUNDING_FEE_RESERVE))
+        self.assertAlmostEqual(exchange.orders[0]['amount'], funded, places=6)
+
+    def test_outer_levels_dropped_when_unfunded(self):
+        exchange = FakeExchange()
+        manager = order_manager(exchange)
+        # Outside in, as strategies return them.
+        desired = [{'type': 'sell', 'amount': 200, 'price': 0.0012},
+                   {'type': 'sell', 'amount': 100, 'price': 0.0011}]
+
+        manager.converge_orders([], desired, [], {'BTC': 0, 'ADK': 150})
+
+        self.assertEqual([(o['amount'], o['level']) for o in exchange.orders], [(50.0, 1), (100, 0)])
+
+    def test_unfunded_amend_keeps_the_resting_order(self):
+        exchange = FakeExchange()
+        manager = order_manager(exchange)
+        resting = {'orderid': 'a', 'type': 'buy', 'amount': 10, 'price': 0.0009, 'level': 0}
+        fee = 1 + settings.FUNDING_FEE_RESERVE
+
+        # Even with the resting order's funds back, the amend can't fund MIN_FUNDED_ORDER_SIZE at its price.
+        to_amend, to_create = manager.fund_orders(
+            {'BTC': 0.0095, 'ADK': 0}, [resting],
+            [{'orderid': 'a', 'type': 'buy', 'amount': 20, 'price': 0.02, 'level': 0}],
+            [{'type': 'buy', 'amount': 100, 'price': 0.00001, 'level': 1}], [])
+
+        self.assertEqual(to_amend, [])
+        # The resting order stays, so its funds stay locked and the create only gets what is left.
+        left = 0.0095 - 10 * 0.0009 * fee
+        self.assertAlmostEqual(to_create[0]['amount'], left / (0.00001 * fee), places=4)
+
+    def test_amend_funded_from_the_order_it_replaces(self):
+        exchange = FakeExchange()
+        manager = order_manager(exchange)
+        exchange.orders = [{'orderid': 'a', 'type': 'sell', 'amount': 100, 'price': 0.0015}]
+
+        # All our ADK is in the resting order; moving it must reuse those funds.
+        manager.converge_orders([], [{'type': 'sell', 'amount': 100, 'price': 0.0011}],
+                                [dict(o) for o in exchange.orders], {'BTC': 0, 'ADK': 100})
+
+        self.assertEqual(exchange.calls, [('amend', 1), ('create', 1)])
+        self.assertEqual([(o['amount'], o['price']) for o in exchange.orders], [(100, 0.0011)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import logging
+import threading
+import unittest
+
+from market_maker.fxadk import FxADK
+from market_maker.risk import RiskEngine
+from market_maker.utils import clock as clocks, deadline as tick_deadline
+from market_maker.utils.errors import OrderStatusUnknown
+from market_maker.utils.orders import OrderIndex
+
+
+class LostResponseWS(object):
+    """A createOrder that the exchange accepts but whose response never comes back before the stage ends."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.open = []
+
+    def create_order(self, amount, price, order, type, pair):
+        self.open.append({'orderid': '42', 'type': type, 'price': str(price), 'amount': str(amount)})
+        self.clock.advance(60)
+        raise OrderStatusUnknown('createOrder timed out')
+
+    def exit(self):
+        pass
+
+    def open_orders(self, symbol):
+        # Like FxAdkImpl.get_post_json: every request is bounded by the current stage.
+        tick_deadline.request_timeout(tick_deadline.current())
+        return list(self.open)
+
+
+def connector(clock):
+    fxadk = FxADK.__new__(FxADK)
+    fxadk.logger = logging.getLogger('root')
+    fxadk.symbol = 'ADK/BTC'
+    fxadk.orders = OrderIndex('mm_adk_')
+    fxadk.risk = RiskEngine(clock=clock)
+    fxadk.lock = threading.RLock()
+    fxadk.ws = LostResponseWS(clock)
+    return fxadk
+
+
+class CreateOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = clocks.SimulatedClock(1000)
+        clocks.set_clock(self.clock)
+
+    def tearDown(self):
+        clocks.set_clock(None)
+
+    def test_create_timed_out_at_stage_end_is_still_indexed(self):
+        fxadk = connector(self.clock)
+        budget = tick_deadline.TickBudget(30, {'submit': 1}, self.clock)
+
+        with tick_deadline.stage(budget, 'submit'):
+            created = fxadk.create_order({'type': 'buy', 'amount': 10, 'price': 0.001})
+
+        self.assertEqual(created['orderid'], '42')
+        self.assertEqual(fxadk.owned_order_ids('ADK/BTC'), ['42'])
+        self.assertEqual(fxadk.risk.open_orders, {'42': ('buy', 0.01)})
+
+    def test_create_not_found_raises(self):
+        fxadk = connector(self.clock)
+        fxadk.ws.open_orders = lambda symbol: []
+
+        with self.assertRaises(RuntimeError):
+            fxadk.create_order({'type': 'buy', 'amount': 10, 'price': 0.001})
+        self.assertEqual(fxadk.owned_order_ids('ADK/BTC'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import unittest
+
+from market_maker.utils.pnl import PnLLedger
+
+
+def trade(n, side, amount, price, fees=0.0, orderid=None):
+    return {'id': n, 'date': 1000 + n, 'type': side, 'amount': amount, 'price': price, 'fees': fees,
+            'orderid': orderid}
+
+
+class AverageCostTest(unittest.TestCase):
+
+    def test_partial_close_realizes_against_average(self):
+        ledger = PnLLedger('average')
+        ledger.add('buy', 10, 1.0)
+        ledger.add('buy', 10, 2.0)
+        ledger.add('sell', 5, 3.0)
+
+        self.assertAlmostEqual(ledger.realized, 5 * (3.0 - 1.5))
+        self.assertAlmostEqual(ledger.position, 15)
+        self.assertAlmostEqual(ledger.average_cost, 1.5)
+
+    def test_sign_flip_opens_at_fill_price(self):
+        ledger = PnLLedger('average')
+        ledger.add('buy', 10, 1.0)
+        ledger.add('sell', 15, 2.0)
+
+        self.assertAlmostEqual(ledger.realized, 10.0)
+        self.assertAlmostEqual(ledger.position, -5)
+        self.assertAlmostEqual(ledger.average_cost, 2.0)
+        # Short 5 at 2.0, marked at 1.0.
+        self.assertAlmostEqual(ledger.unrealized(1.0), 5.0)
+
+    def test_flat_clears_cost(self):
+        ledger = PnLLedger('average')
+        ledger.add('sell', 3, 2.0)
+        ledger.add('buy', 3, 1.0)
+
+        self.assertEqual(ledger.position, 0)
+        self.assertEqual(ledger.cost, 0.0)
+        self.assertIsNone(ledger.average_cost)
+        self.assertAlmostEqual(ledger.realized, 3.0)
+
+
+class FifoTest(unittest.TestCase):
+
+    def test_oldest_lot_closes_first(self):
+        ledger = PnLLedger('fifo')
+        ledger.add('buy', 10, 1.0)
+        ledger.add('buy', 10, 2.0)
+        ledger.add('sell', 15, 3.0)
+
+        self.assertAlmostEqual(ledger.realized, 10 * 2.0 + 5 * 1.0)
+        self.assertAlmostEqual(ledger.position, 5)
+        self.assertEqual([list(lot) for lot in ledger.lots], [[5, 2.0]])
+        self.assertAlmostEqual(ledger.average_cost, 2.0)
+
+    def test_sign_flip_leaves_a_short_lot(self):
+        ledger = PnLLedger('fifo')
+        ledger.add('buy', 4, 1.0)
+        ledger.add('sell', 10, 1.5)
+
+        self.assertAlmostEqual(ledger.realized, 2.0)
+        self.assertEqual([list(lot) for lot in ledger.lots], [[-6, 1.5]])
+        self.assertAlmostEqual(ledger.cost, -9.0)
+
+    def test_matches_cash_flow_once_flat(self):
+        fills = [('buy', 3, 1.0), ('buy', 2, 1.2), ('sell', 4, 1.1), ('sell', 3, 0.9), ('buy', 2, 1.0)]
+        for method in ('average', 'fifo'):
+            ledger = PnLLedger(method)
+            for side, amount, price in fills:
+                ledger.add(side, amount, price)
+            cash = sum(amount * price * (1 if side == 'sell' else -1) for side, amount, price in fills)
+            self.assertEqual(ledger.position, 0)
+            self.assertAlmostEqual(ledger.realized, cash)
+
+
+class UpdateTest(unittest.TestCase):
+
+    def test_first_update_only_primes_and_attributes_by_level(self):
+        ledger = PnLLedger('average')
+        history = [trade(1, 'buy', 1, 1.0)]
+        self.assertEqual(ledger.update(history), 0)
+
+        ledger.on_created([{'orderid': 'a', 'level': 2}])
+        history = [trade(3, 'sell', 1, 1.2, 0.01, 'a'), trade(2, 'buy', 1, 1.0, 0.01, 'b')] + history
+        self.assertEqual(ledger.update(history), 2)
+        self.assertEqual(ledger.update(history), 0)
+
+        self.assertAlmostEqual(ledger.realized, 0.2)
+        self.assertEqual(ledger.unattributed['fills'], 1)
+        level, realized, fees, volume, fills = ledger.levels()[2]
+        self.assertAlmostEqual(realized, 0.2)
+        self.assertAlmostEqual(fees, 0.01)
+        self.assertEqual(fills, 1)
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def test_round_trip_through_json(self):
+        ledger = PnLLedger('fifo')
+        ledger.update([trade(1, 'buy', 1, 1.0)])
+        ledger.on_created([{'orderid': 'x', 'level': 1}])
+        new = [trade(3, 'buy', 2, 1.1, 0.02, 'x'), trade(2, 'sell', 1, 1.3), trade(1, 'buy', 1, 1.0)]
+        ledger.update(new)
+
+        restored = PnLLedger.from_dict(json.loads(json.dumps(ledger.to_dict())))
+
+        self.assertEqual(restored.to_dict(), ledger.to_dict())
+        self.assertEqual(restored.snapshot(1.2), ledger.snapshot(1.2))
+        # The restored ledger carries on from the same point in the history.
+        newer = [trade(4, 'sell', 1, 1.4)] + new
+        self.assertEqual(restored.update(newer), 1)
+        self.assertEqual(ledger.update(newer), 1)
+        self.assertAlmostEqual(restored.realized, ledger.realized)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from market_maker.quoting import AvellanedaStoikovStrategy, avellaneda_stoikov_ladder, normalised_inventory
+from market_maker.strategy import TickContext
+from market_maker.utils.dotdict import dotdict
+
+TICK = 0.00000001
+
+
+def strategy_settings(**overrides):
+    values = dict(ORDER_PAIRS=3, ORDER_START_SIZE=100, ORDER_STEP_SIZE=100, MIN_POSITION=-100, MAX_POSITION=100,
+                  AS_GAMMA=1.0, AS_KAPPA=200.0, AS_HORIZON=100, MIN_SPREAD=0.01)
+    values.update(overrides)
+    return dotdict(values)
+
+
+def context(position, volatility, bid=0.00099, ask=0.00101, start_buy=None, start_sell=None):
+    mid = (bid + ask) / 2
+    return TickContext(
+        symbol='ADK/BTC',
+        instrument={'tickSize': TICK, 'bidPrice': bid, 'askPrice': ask, 'midPrice': mid},
+        ticker={'buy': bid, 'sell': ask, 'mid': mid},
+        book={'bids': (), 'asks': ()},
+        position={'currentQty': position},
+        open_orders=(),
+        stats={'volatility': volatility},
+        start_position_buy=start_buy if start_buy is not None else bid + TICK,
+        start_position_sell=start_sell if start_sell is not None else ask - TICK,
+        start_position_mid=mid,
+        interval=0.005,
+    )
+
+
+class LadderTest(unittest.TestCase):
+
+    def test_normalised_inventory(self):
+        self.assertEqual(normalised_inventory(0, -100, 100), 0.0)
+        self.assertEqual(normalised_inventory(-300, -100, 100), -1.0)
+        self.assertEqual(normalised_inventory(50, 0, 100), 0.0)
+        self.assertEqual(normalised_inventory(5, 10, 10), 0.0)
+
+    def test_long_inventory_skews_down(self):
+        bids, asks = avellaneda_stoikov_ladder(1.0, 0.5, 0.01, [100, 200], 0.01, 1.0, 200.0, 100)
+        flat_bids, flat_asks = avellaneda_stoikov_ladder(1.0, 0.0, 0.01, [100, 200], 0.01, 1.0, 200.0, 100)
+
+        self.assertLess(bids[0][0], flat_bids[0][0])
+        self.assertLess(asks[0][0], flat_asks[0][0])
+        self.assertEqual([size for _, size in bids], [50, 100])
+        self.assertEqual([size for _, size in asks], [150, 300])
+
+
+class PlaceOrdersTest(unittest.TestCase):
+
+    def test_short_bid_never_crosses_the_ask_after_min_spread_back_off(self):
+        # The MIN_SPREAD back-off in get_ticker moves start_position_sell above the real ask.
+        bid, ask = 0.00099, 0.00101
+        start_buy, start_sell = (bid + TICK) * (1 - 0.005), (ask - TICK) * (1 + 0.005)
+        strategy = AvellanedaStoikovStrategy(strategy_settings())
+
+        # Fully short and volatile: the reservation price is far above the book.
+        buys, sells = strategy.place_orders(context(-100, 0.05, bid, ask, start_buy, start_sell))
+
+        self.assertTrue(buys)
+        for order in buys:
+            self.assertLess(order['price'], ask)
+        self.assertAlmostEqual(buys[-1]['price'], ask - TICK)
+        for order in sells:
+            self.assertGreater(order['price'], bid)
+
+    def test_long_ask_never_crosses_the_bid(self):
+        bid, ask = 0.00099, 0.00101
+        strategy = AvellanedaStoikovStrategy(strategy_settings())
+
+        buys, sells = strategy.place_orders(context(100, 0.05, bid, ask, bid * 0.995, ask * 1.005))
+
+        self.assertTrue(sells)
+        self.assertAlmostEqual(sells[-1]['price'], bid + TICK)
+        self.assertEqual(buys, [])
+
+    def test_no_levels(self):
+        strategy = AvellanedaStoikovStrategy(strategy_settings(ORDER_PAIRS=0))
+        self.assertEqual(strategy.place_orders(context(0, 0.01)), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+
+from market_maker.utils.clock import SimulatedClock
+from market_maker.utils.requote import RequoteFilter
+
+BID, ASK = 0.98, 1.02
+
+
+def order(price, amount=100, side='buy', orderid='a'):
+    return {'orderid': orderid, 'type': side, 'price': price, 'amount': amount}
+
+
+class BandTest(unittest.TestCase):
+
+    def test_bands_widen_outwards(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        self.assertAlmostEqual(requote.band(0), 0.01)
+        self.assertAlmostEqual(requote.band(2), 0.02)
+
+    def test_price_moves_inside_the_band_are_ignored(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        # Level 2 tolerates 2%; the order is away from the touch.
+        self.assertFalse(requote.should_amend(order(0.90), order(0.915), 2, BID, ASK))
+        self.assertTrue(requote.should_amend(order(0.90), order(0.92), 2, BID, ASK))
+        self.assertTrue(requote.should_amend(order(0.90), order(0.915), 0, BID, ASK))
+
+    def test_touch_gets_twice_its_band(self):
+        requote = RequoteFilter(0.01)
+        self.assertFalse(requote.should_amend(order(BID), order(BID * 1.015), 0, BID, ASK))
+        self.assertTrue(requote.should_amend(order(BID), order(BID * 1.025), 0, BID, ASK))
+        ask = order(ASK, side='sell')
+        self.assertFalse(requote.should_amend(ask, order(ASK * 0.985, side='sell'), 0, BID, ASK))
+
+    def test_size_tolerance(self):
+        requote = RequoteFilter(0.01, size_tolerance=0.1)
+        self.assertFalse(requote.should_amend(order(0.9, 100), order(0.9, 109), 0, BID, ASK))
+        self.assertTrue(requote.should_amend(order(0.9, 100), order(0.9, 120), 0, BID, ASK))
+
+
+class BudgetTest(unittest.TestCase):
+
+    def test_amends_over_budget_are_deferred_until_the_window_slides(self):
+        clock = SimulatedClock(1000)
+        requote = RequoteFilter(0.01, amend_budget=2, clock=clock)
+        move = lambda n: requote.should_amend(order(0.9, orderid=n), order(0.8), 0, BID, ASK)
+
+        self.assertTrue(move('a'))
+        self.assertTrue(move('b'))
+        self.assertFalse(move('c'))
+        self.assertEqual(requote.deferred, 1)
+
+        clock.advance(61)
+        self.assertTrue(move('c'))
+
+    def test_no_budget(self):
+        requote = RequoteFilter(0.01)
+        for n in range(100):
+            self.assertTrue(requote.should_amend(order(0.9, orderid=n), order(0.8), 0, BID, ASK))
+
+
+class SavingsTest(unittest.TestCase):
+
+    def test_moves_the_plain_rule_would_ignore_save_nothing(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        for _ in range(10):
+            requote.should_amend(order(0.90), order(0.905), 2, BID, ASK)
+
+        self.assertEqual((requote.suppressed, requote.calls_saved), (0, 0))
+
+    def test_a_held_back_move_is_saved_once(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        # 1.5% is over RELIST_INTERVAL but inside level 2's band. The plain rule amends once, then matches.
+        for _ in range(10):
+            self.assertFalse(requote.should_amend(order(0.90), order(0.9135), 2, BID, ASK))
+
+        self.assertEqual(requote.suppressed, 1)
+        self.assertEqual(requote.calls_saved, 2)
+
+    def test_drift_back_is_another_amend_for_the_plain_rule(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        requote.should_amend(order(0.90), order(0.9135), 2, BID, ASK)
+        requote.should_amend(order(0.90), order(0.90), 2, BID, ASK)
+
+        self.assertEqual(requote.calls_saved, 4)
+
+    def test_deferred_amend_saves_nothing_once_sent(self):
+        clock = SimulatedClock(1000)
+        requote = RequoteFilter(0.01, amend_budget=1, clock=clock)
+        self.assertTrue(requote.should_amend(order(0.9, orderid='a'), order(0.8), 0, BID, ASK))
+        self.assertFalse(requote.should_amend(order(0.9, orderid='b'), order(0.8), 0, BID, ASK))
+        self.assertFalse(requote.should_amend(order(0.9, orderid='b'), order(0.8), 0, BID, ASK))
+        self.assertEqual(requote.calls_saved, 2)
+
+        clock.advance(61)
+        self.assertTrue(requote.should_amend(order(0.9, orderid='b'), order(0.8), 0, BID, ASK))
+        self.assertEqual(requote.calls_saved, 0)
+
+    def test_retain_forgets_closed_orders(self):
+        requote = RequoteFilter(0.01, level_widening=0.5)
+        requote.should_amend(order(0.90, orderid='a'), order(0.9135), 2, BID, ASK)
+        requote.retain(['b'])
+        self.assertEqual(requote.baseline_orders, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
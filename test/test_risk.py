@@ -0,0 +1,136 @@
+import unittest
+
+from market_maker.risk import RiskEngine
+from market_maker.utils.clock import SimulatedClock
+from market_maker.utils.errors import RiskCheckError
+
+
+def order(side='buy', amount=10, price=1.0):
+    return {'type': side, 'amount': amount, 'price': price}
+
+
+class LimitsTest(unittest.TestCase):
+
+    def test_order_size(self):
+        engine = RiskEngine(max_order_size=10)
+        engine.check(order(amount=10))
+        with self.assertRaises(RiskCheckError):
+            engine.check(order(amount=11))
+
+    def test_price_band_around_mid(self):
+        engine = RiskEngine(price_band=0.1)
+        # No mid yet: nothing to check against.
+        engine.check(order(price=5.0))
+
+        engine.update_mid(1.0)
+        engine.check(order('buy', price=0.91))
+        engine.check(order('sell', price=1.09))
+        with self.assertRaises(RiskCheckError):
+            engine.check(order('buy', price=0.89))
+        with self.assertRaises(RiskCheckError):
+            engine.check(order('sell', price=1.11))
+
+    def test_notional_per_side(self):
+        engine = RiskEngine(max_notional_per_side=25)
+        engine.on_created('a', order('buy', 10, 2.0))
+
+        engine.check(order('buy', 5, 1.0))
+        with self.assertRaises(RiskCheckError):
+            engine.check(order('buy', 6, 1.0))
+        # The other side has its own limit.
+        engine.check(order('sell', 20, 1.0))
+
+        engine.on_removed('a')
+        engine.check(order('buy', 25, 1.0))
+
+    def test_open_order_cap(self):
+        engine = RiskEngine(max_open_orders=2)
+        engine.on_created('a', order())
+        engine.on_created('b', order())
+        with self.assertRaises(RiskCheckError):
+            engine.check(order())
+
+        engine.on_removed('b')
+        engine.check(order())
+
+    def test_disabled_limits_are_not_checked(self):
+        engine = RiskEngine()
+        engine.update_mid(1.0)
+        engine.check(order(amount=1e9, price=100.0))
+
+
+class TrackingTest(unittest.TestCase):
+
+    def test_registering_an_order_twice_counts_it_once(self):
+        engine = RiskEngine(max_notional_per_side=25)
+        engine.on_created('a', order('buy', 10, 2.0))
+        # e.g. reconcile() after the order was already tracked
+        engine.on_created('a', order('buy', 10, 2.0))
+
+        self.assertAlmostEqual(engine.notional['buy'], 20.0)
+        self.assertEqual(len(engine.open_orders), 1)
+        engine.check(order('buy', 5, 1.0))
+
+    def test_removing_an_unknown_order_is_a_no_op(self):
+        engine = RiskEngine()
+        engine.on_removed('nope')
+        self.assertEqual(engine.notional, {'buy': 0.0, 'sell': 0.0})
+
+    def test_orderids_are_compared_as_strings(self):
+        engine = RiskEngine()
+        engine.on_created(7, order('sell', 3, 1.0))
+        engine.on_removed('7')
+        self.assertEqual(engine.open_orders, {})
+        self.assertAlmostEqual(engine.notional['sell'], 0.0)
+
+
+class KillSwitchTest(unittest.TestCase):
+
+    def test_too_many_orders_a_minute_throws_it(self):
+        clock = SimulatedClock(1000)
+        engine = RiskEngine(max_orders_per_minute=3, clock=clock)
+        for _ in range(3):
+            engine.check(order())
+            clock.advance(1)
+
+        with self.assertRaises(RiskCheckError):
+            engine.check(order())
+        self.assertIsNotNone(engine.killed)
+
+        # It stays on after the rate drops, until reset.
+        clock.advance(120)
+        with self.assertRaises(RiskCheckError):
+            engine.check(order())
+
+        engine.reset_kill()
+        engine.check(order())
+
+    def test_rate_window_slides(self):
+        clock = SimulatedClock(1000)
+        engine = RiskEngine(max_orders_per_minute=2, clock=clock)
+        engine.check(order())
+        clock.advance(30)
+        engine.check(order())
+        clock.advance(31)
+        # The first submission is now over a minute old.
+        engine.check(order())
+        self.assertIsNone(engine.killed)
+
+    def test_rejected_orders_do_not_count_towards_the_rate(self):
+        clock = SimulatedClock(1000)
+        engine = RiskEngine(max_order_size=5, max_orders_per_minute=1, clock=clock)
+        with self.assertRaises(RiskCheckError):
+            engine.check(order(amount=10))
+        engine.check(order(amount=5))
+        self.assertIsNone(engine.killed)
+
+    def test_manual_kill(self):
+        engine = RiskEngine()
+        engine.kill('by hand')
+        with self.assertRaises(RiskCheckError):
+            engine.check(order())
+        self.assertEqual(engine.killed, 'by hand')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from market_maker.utils.clock import RealClock
+from market_maker.utils.deadline import Deadline
+from market_maker.utils.errors import DeadlineExceeded
+from market_maker.ws.scheduler import ACCOUNT, CANCEL, Scheduler
+
+
+class SchedulerDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = RealClock()
+        # One token a second, and the only one there is goes first.
+        self.scheduler = Scheduler(60, 1, cancel_reserve=0, workers=1, clock=self.clock)
+        self.scheduler.submit(CANCEL, lambda: None)
+
+    def test_wait_for_a_token_is_bounded_by_the_deadline(self):
+        started = time.time()
+        with self.assertRaises(DeadlineExceeded):
+            self.scheduler.submit(ACCOUNT, lambda: None, Deadline(self.clock.time() + 0.2, 'fetch', self.clock))
+        self.assertLess(time.time() - started, 0.6)
+
+    def test_expired_request_is_dropped_without_a_token(self):
+        sent = []
+        with self.assertRaises(DeadlineExceeded):
+            self.scheduler.submit(ACCOUNT, lambda: sent.append('late'),
+                                  Deadline(self.clock.time() + 0.1, 'fetch', self.clock))
+
+        # The token that refills is still there for the next request, which goes out as soon as it does.
+        started = time.time()
+        self.scheduler.submit(ACCOUNT, lambda: sent.append('next'))
+        self.assertLess(time.time() - started, 1.2)
+        self.assertEqual(sent, ['next'])
+        self.assertEqual(self.scheduler.stats()['queued'], 0)
+
+    def test_request_on_the_wire_is_waited_for(self):
+        scheduler = Scheduler(60, 5, cancel_reserve=0, workers=1, clock=self.clock)
+        running = threading.Event()
+
+        def slow():
+            running.set()
+            time.sleep(0.3)
+            return 'done'
+
+        self.assertEqual(scheduler.submit(ACCOUNT, slow, Deadline(self.clock.time() + 0.1, 'submit', self.clock)),
+                         'done')
+        self.assertTrue(running.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()